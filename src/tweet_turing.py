@@ -2,26 +2,145 @@
 #   A collection of functions used for the Tweet Turing Test project.
 #
 
+# postponed evaluation of annotations, so GCP types can be named without importing GCP libraries
+from __future__ import annotations
+
 # imports from Python standard library
+import collections
+import functools
+import gzip
+import importlib
+import io
+import itertools
 import json
 import logging
+import datetime
 import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING
 
 # imports requiring installation
-#   connection to Google Cloud Storage
-from google.cloud import storage            # pip install google-cloud-storage
-from google.oauth2 import service_account   # pip install google-auth
+#   connection to Google Cloud Storage is optional, and only imported on first use by the GCP functions
+#       (see `_import_optional`)
+if TYPE_CHECKING:
+    from google.cloud import storage        # pip install google-cloud-storage
+    from google.oauth2 import service_account   # pip install google-auth
 
 #  data science packages
-import demoji                               # pip install demoji
+#   note: `demoji` (pip install demoji) is also imported on first use, by the emoji functions, and so are
+#       the pyarrow submodules (`pc`, `pa_csv`, `ds`, `pa_fs` and `pq`, see `_LazyModule`)
 import numpy as np                          # pip install numpy
 import pandas as pd                         # pip install pandas
+import pyarrow as pa                        # pip install pyarrow
+
+# imports from tweet_turing_metrics.py (its decorators are applied when this module is imported)
+from tweet_turing_metrics import instrumented, measure, count_io, file_sizes
+
+#   tweet_turing_cache.py, tweet_turing_counters.py, tweet_turing_dedup.py, tweet_turing_ipc.py and
+#       tweet_turing_json.py are imported on first use (see `_LazyModule`)
+if TYPE_CHECKING:
+    from tweet_turing_cache import GcpObjectCache
+    from tweet_turing_dedup import TweetIdIndex
 
 
 # module-level definitions
 logging.basicConfig(level=logging.WARNING)
 logger = logging.getLogger(__name__)
 
+#   size (in characters) of each read when streaming JSON from a file
+json_read_chunk_size: int = 1 << 20     # ~1 MB of text per read
+
+#   defaults for concurrent GCP object downloads (see `fetch_gcp_objects`)
+gcp_fetch_max_workers: int = 8
+gcp_fetch_max_retries: int = 3
+gcp_fetch_retry_backoff: float = 0.5    # seconds, doubled after each failed attempt
+
+#   errors considered transient (i.e. worth retrying) when downloading GCP objects
+#       (the GCP client library's own transient errors are added by `_get_gcp_transient_errors`)
+gcp_transient_errors: tuple = (ConnectionError, TimeoutError)
+
+#   defaults for streaming GCP object uploads (see `set_gcp_object_from_json`)
+gcp_upload_chunk_size: int = 8 * (1 << 20)     # bytes per upload request, must be a multiple of 256 KB
+gcp_upload_compress_level: int = 6
+gcp_json_content_types: dict = {'json': "application/json", 'jsonl': "application/x-ndjson"}
+
+#   rows per chunk when counting emoji (see `count_emoji`)
+emoji_count_chunk_size: int = 100_000
+
+#   defaults for partitioned parquet snapshots (see `write_parquet_snapshot`)
+snapshot_partition_columns: list = ['data_source', 'publish_month']
+snapshot_compression: str = 'zstd'
+snapshot_row_group_size: int = 100_000  # rows; smaller groups let filtered reads skip more data
+snapshot_schema_file: str = '_common_metadata'  # union of the schemas of all files written to a snapshot
+
+#   optional dependencies, imported on first use: module name -> pip package providing it
+optional_dependencies: dict = {
+    "google.cloud.storage": "google-cloud-storage",
+    "google.oauth2.service_account": "google-auth",
+    "google.api_core.exceptions": "google-api-core",
+    "google.auth.transport.requests": "google-auth",
+    "requests": "requests",
+    "demoji": "demoji"
+}
+
+
+def _import_optional(module_name: str):
+    """Imports an optional dependency on first use (later calls are a cheap `sys.modules` lookup).
+        Keeps `import tweet_turing` fast, and usable without the GCP libraries installed."""
+    try:
+        return importlib.import_module(module_name)
+    except ImportError as e:
+        raise ImportError(f"'{module_name}' is required for this function, "
+                            f"install it with: pip install {optional_dependencies[module_name]}") from e
+
+
+class _LazyModule:
+    """Stands in for a module which is only imported on first attribute access (e.g. `pq.read_table`),
+        so that `import tweet_turing` does not pay for modules which only some functions use."""
+
+    def __init__(self, module_name: str):
+        self._module_name: str = module_name
+        self._module = None
+
+    def __getattr__(self, name: str):
+        if (self._module is None):
+            self._module = importlib.import_module(self._module_name)
+        return getattr(self._module, name)
+
+
+pc = _LazyModule("pyarrow.compute")
+pa_csv = _LazyModule("pyarrow.csv")
+ds = _LazyModule("pyarrow.dataset")
+pa_fs = _LazyModule("pyarrow.fs")
+pq = _LazyModule("pyarrow.parquet")
+tweet_turing_counters = _LazyModule("tweet_turing_counters")
+tweet_turing_dedup = _LazyModule("tweet_turing_dedup")
+tweet_turing_ipc = _LazyModule("tweet_turing_ipc")
+tweet_turing_json = _LazyModule("tweet_turing_json")
+
+
+@functools.lru_cache(maxsize=None)
+def _get_gcp_transient_errors() -> tuple:
+    """Returns `gcp_transient_errors` plus the transient errors defined by the GCP client libraries
+        (when installed; fake buckets used for local testing only need the built-in errors)."""
+    try:
+        gcp_exceptions = _import_optional("google.api_core.exceptions")
+        requests = _import_optional("requests")
+    except ImportError:
+        return gcp_transient_errors
+
+    return gcp_transient_errors + (
+        requests.exceptions.ConnectionError,
+        requests.exceptions.Timeout,
+        gcp_exceptions.TooManyRequests,
+        gcp_exceptions.InternalServerError,
+        gcp_exceptions.BadGateway,
+        gcp_exceptions.ServiceUnavailable,
+        gcp_exceptions.GatewayTimeout
+    )
+
 
 ###################
 #### CONSTANTS ####
@@ -33,8 +152,8 @@ csv_column_dtype_mapping: dict = {
     "content": "string",
     "region": "string",
     "language": "string",
-    "publish_date": "string",   # converted to datetime later
-    "harvested_date": "string", # converted to datetime later
+    "publish_date": "string",   # converted to datetime later (see `parse_date_columns`)
+    "harvested_date": "string", # converted to datetime later (see `parse_date_columns`)
     "following": "uint64",
     "followers": "uint64",
     "updates": "uint64",
@@ -52,6 +171,13 @@ csv_column_dtype_mapping: dict = {
 }
 
 
+#   strings treated as missing values when reading CSV files (same as pandas' `read_csv` defaults)
+csv_null_values: list = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null"
+]
+
+
 authentic_df_eda_dtype_mapping = {
     'author_id': 'string',
     'created_at': 'string',
@@ -59,75 +185,324 @@ authentic_df_eda_dtype_mapping = {
     'text': 'string',
     'lang': 'string',
     'referenced_tweets': 'object',
-    'public_metrics.retweet_count': 'uint64', 
-    'public_metrics.reply_count': 'uint64', 
-    'public_metrics.like_count': 'uint64', 
+    'public_metrics.retweet_count': 'uint64',
+    'public_metrics.reply_count': 'uint64',
+    'public_metrics.like_count': 'uint64',
     'public_metrics.quote_count': 'uint64',
-    'author.location': 'string', 
-    'author.name': 'string', 
-    'author.username': 'string', 
+    'author.location': 'string',
+    'author.name': 'string',
+    'author.username': 'string',
     'author.public_metrics.followers_count': 'uint64',
-    'author.public_metrics.following_count': 'uint64', 
-    'author.entities.url.urls': 'object', 
+    'author.public_metrics.following_count': 'uint64',
+    'author.entities.url.urls': 'object',
     'author.created_at': 'string',
-    'author.verified': 'uint8', 
-    'context_annotations': 'object', 
-    'entities.annotations': 'object', 
+    'author.verified': 'uint8',
+    'context_annotations': 'object',
+    'entities.annotations': 'object',
     'entities.mentions': 'object',
-    'entities.hashtags': 'object', 
+    'entities.hashtags': 'object',
     'entities.urls': 'object',
     'data_source': 'string'
     }
 
 
+def __getattr__(name: str):
+    """Creates `TweetRecord`, the compact typed record of the fields in `authentic_df_eda_dtype_mapping` for the
+        JSON loaders' `record_class` (see tweet_turing_json.py), on first access."""
+    if (name == 'TweetRecord'):
+        record_class: type = tweet_turing_json.make_record_class('TweetRecord', list(authentic_df_eda_dtype_mapping),
+                                                                    module=__name__)
+        globals()['TweetRecord'] = record_class
+        return record_class
+
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+
+
+#   Arrow types of the raw Twitter API v2 JSON fields behind `authentic_df_eda_dtype_mapping`, where they
+#   differ from the flattened column's dtype (nested lists, and booleans stored as uint8 once flattened)
+_arrow_url_entity = pa.struct([
+    ('start', pa.int64()), ('end', pa.int64()), ('url', pa.string()), ('expanded_url', pa.string()),
+    ('display_url', pa.string())
+    ])
+_arrow_context_item = pa.struct([('id', pa.string()), ('name', pa.string()), ('description', pa.string())])
+
+authentic_json_column_types: dict = {
+    'referenced_tweets': pa.list_(pa.struct([('type', pa.string()), ('id', pa.string())])),
+    'author.entities.url.urls': pa.list_(_arrow_url_entity),
+    'author.verified': pa.bool_(),
+    'context_annotations': pa.list_(pa.struct([('domain', _arrow_context_item), ('entity', _arrow_context_item)])),
+    'entities.annotations': pa.list_(pa.struct([
+        ('start', pa.int64()), ('end', pa.int64()), ('probability', pa.float64()), ('type', pa.string()),
+        ('normalized_text', pa.string())
+        ])),
+    'entities.mentions': pa.list_(pa.struct([
+        ('start', pa.int64()), ('end', pa.int64()), ('username', pa.string()), ('id', pa.string())
+        ])),
+    'entities.hashtags': pa.list_(pa.struct([('start', pa.int64()), ('end', pa.int64()), ('tag', pa.string())])),
+    'entities.urls': pa.list_(pa.struct(list(_arrow_url_entity) + [
+        ('unwound_url', pa.string()), ('status', pa.int64()), ('title', pa.string()), ('description', pa.string())
+        ]))
+}
+
+
+#   columns holding the tweet ID: Troll dataset, and Twitter API
+tweet_id_columns: list = ['tweet_id', 'id']
+
+
+#   timestamp formats: Troll dataset (e.g. "10/1/2017 22:43"), and Twitter API (e.g. "2022-10-01T22:43:05.000Z")
+troll_date_format: str = "%m/%d/%Y %H:%M"
+twitter_date_format: str = "ISO8601"
+
+#   columns parsed to UTC datetimes by `parse_date_columns`, and the format of each
+date_column_formats: dict = {
+    'publish_date': troll_date_format,
+    'harvested_date': troll_date_format,
+    'created_at': twitter_date_format,
+    'author.created_at': twitter_date_format
+}
+
+troll_date_pattern: str = r"^(?P<month>\d{1,2})/(?P<day>\d{1,2})/(?P<year>\d{4}) (?P<hour>\d{1,2}):(?P<minute>\d{2})$"
+
+
+#   text columns with few distinct values, stored as categoricals in compact mode (see `compact_dtypes`)
+low_cardinality_columns: list = [
+    'region', 'language', 'post_type', 'account_type', 'account_category', 'lang', 'data_source'
+]
+
+#   as `csv_column_dtype_mapping`, but with categoricals for low-cardinality columns and Arrow-backed strings
+csv_column_compact_dtype_mapping: dict = {
+    col: ('category' if (col in low_cardinality_columns) else 'string[pyarrow]' if (dtype == 'string') else dtype)
+    for (col, dtype) in csv_column_dtype_mapping.items()
+}
+
+
+#########################
+#### DTYPE FUNCTIONS ####
+#########################
+
+@instrumented('convert')
+def compact_dtypes(df: pd.DataFrame, category_cols: list = low_cardinality_columns) -> pd.DataFrame:
+    """Returns a copy of `df` using less memory:
+          - columns in `category_cols` become categoricals
+          - other text columns become Arrow-backed strings (`string[pyarrow]`)
+          - integer columns are downcast to the smallest integer type which holds all of their values
+        Columns holding other objects (e.g. lists of dicts, like `referenced_tweets`) are left as they are.
+        Use `memory_usage_report` to compare memory use before and after."""
+    compact_columns: dict = {}
+
+    for col in df.columns:
+        values: pd.Series = df[col]
+
+        if (col in category_cols):
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                compact_columns[col] = values.astype('category')
+        elif pd.api.types.is_integer_dtype(values.dtype) and not pd.api.types.is_extension_array_dtype(values.dtype):
+            downcast: str = 'unsigned' if pd.api.types.is_unsigned_integer_dtype(values.dtype) \
+                                or ((len(values) > 0) and (values.min() >= 0)) else 'integer'
+            compact_columns[col] = pd.to_numeric(values, downcast=downcast)
+        elif pd.api.types.is_string_dtype(values.dtype) and not isinstance(values.dtype, pd.CategoricalDtype):
+            if (values.dtype == pd.StringDtype('pyarrow')):
+                continue
+            # object columns qualify only if they actually hold strings
+            if (values.dtype == object) and (pd.api.types.infer_dtype(values, skipna=True) not in ['string', 'empty']):
+                continue
+            compact_columns[col] = values.astype(pd.StringDtype('pyarrow'))
+
+    return df.assign(**compact_columns) if (len(compact_columns) > 0) else df.copy()
+
+
+def memory_usage_report(before_df: pd.DataFrame, after_df: pd.DataFrame) -> pd.DataFrame:
+    """Compares the (deep) memory usage of each column of two versions of a DataFrame,
+        e.g. `memory_usage_report(df, compact_dtypes(df))`.
+        Returns a DataFrame indexed by column, with a final 'TOTAL' row."""
+    before_bytes: pd.Series = before_df.memory_usage(index=False, deep=True)
+    after_bytes: pd.Series = after_df.memory_usage(index=False, deep=True)
+
+    report = pd.DataFrame({
+        'dtype_before': before_df.dtypes.astype(str),
+        'dtype_after': after_df.dtypes.astype(str),
+        'bytes_before': before_bytes,
+        'bytes_after': after_bytes
+        })
+    report.loc['TOTAL'] = ['', '', before_bytes.sum(), after_bytes.sum()]
+    report['pct_saved'] = (100 * (1 - (report['bytes_after'] / report['bytes_before']))).round(1)
+
+    return report
+
+
+def _parse_troll_dates(date_strings: pd.Index) -> pd.DatetimeIndex:
+    """Parses strings in `troll_date_format` (month, day and hour need not be zero-padded) to UTC datetimes.
+        Equivalent to `pd.to_datetime(date_strings, format=troll_date_format, utc=True)`, but the fields
+        are extracted with a single vectorized regex and combined with numpy date arithmetic."""
+    date_fields = pc.extract_regex(pa.array(date_strings, type=pa.string(), from_pandas=True), troll_date_pattern)
+    is_missing: np.ndarray = pd.isna(date_strings)
+    is_unmatched: np.ndarray = pc.is_null(date_fields).to_numpy(zero_copy_only=False) & ~is_missing
+
+    fields: dict = {
+        name: pc.fill_null(pc.cast(pc.struct_field(date_fields, name), pa.int64()), 0).to_numpy()
+        for name in ['year', 'month', 'day', 'hour', 'minute']
+        }
+    months: np.ndarray = ((fields['year'] - 1970) * 12 + fields['month'] - 1).astype('datetime64[M]')
+    days: np.ndarray = months.astype('datetime64[D]') + (fields['day'] - 1).astype('timedelta64[D]')
+
+    # reject values strptime would reject, e.g. "2/30/2017 25:00"
+    is_unmatched |= ~is_missing & ((fields['month'] < 1) | (fields['month'] > 12) | (fields['day'] < 1)
+                                    | (days.astype('datetime64[M]') != months)
+                                    | (fields['hour'] > 23) | (fields['minute'] > 59))
+    if is_unmatched.any():
+        raise ValueError(f"time data '{date_strings[is_unmatched.argmax()]}' doesn't match format '{troll_date_format}'")
+
+    timestamps: np.ndarray = days.astype('datetime64[m]') + (fields['hour'] * 60 + fields['minute']).astype('timedelta64[m]')
+    timestamps[is_missing] = np.datetime64('NaT')
+
+    return pd.DatetimeIndex(timestamps.astype('datetime64[us]')).tz_localize('UTC')
+
+
+#   formats with a dedicated parser, others are parsed with `pd.to_datetime`
+date_format_parsers: dict = {
+    troll_date_format: _parse_troll_dates
+}
+
+
+def parse_datetime_column(dates: pd.Series, date_format: str) -> pd.Series:
+    """Converts a Series of timestamp strings in the fixed `date_format` to timezone-aware UTC datetimes.
+        Each distinct string is parsed only once, which matters since many tweets share a timestamp.
+        Missing values become NaT; values not matching `date_format` raise a ValueError.
+        Series which already hold datetimes are only converted to UTC."""
+    if pd.api.types.is_datetime64_any_dtype(dates):
+        return dates.dt.tz_localize('UTC') if (dates.dt.tz is None) else dates.dt.tz_convert('UTC')
+
+    codes, unique_dates = pd.factorize(dates)
+    unique_dates = pd.Index(unique_dates)
+
+    if (date_format in date_format_parsers):
+        parsed_dates: pd.DatetimeIndex = date_format_parsers[date_format](unique_dates)
+    else:
+        parsed_dates: pd.DatetimeIndex = pd.DatetimeIndex(pd.to_datetime(unique_dates, format=date_format, utc=True))
+
+    return pd.Series(parsed_dates.take(codes, allow_fill=True, fill_value=pd.NaT), index=dates.index, name=dates.name)
+
+
+@instrumented('convert')
+def parse_date_columns(df: pd.DataFrame, date_formats: dict = date_column_formats) -> pd.DataFrame:
+    """Returns a copy of `df` with each column in `date_formats` (column name -> format) which is present
+        converted to UTC datetimes using `parse_datetime_column`."""
+    parsed_columns: dict = {
+        col: parse_datetime_column(df[col], date_format)
+        for (col, date_format) in date_formats.items() if (col in df.columns)
+        }
+
+    return df.assign(**parsed_columns)
+
+
+def _concat_compact(dfs: list) -> pd.DataFrame:
+    """Concatenates DataFrames read in compact mode. Categories are unified first, since pandas would
+        otherwise fall back to object dtype for categoricals whose categories differ between DataFrames."""
+    if (len(dfs) > 1):
+        for col in dfs[0].columns:
+            if isinstance(dfs[0][col].dtype, pd.CategoricalDtype):
+                categories = pd.api.types.union_categoricals([df[col] for df in dfs]).categories
+                for df in dfs:
+                    df[col] = df[col].cat.set_categories(categories)
+
+    return compact_dtypes(pd.concat(dfs))
+
+
+def drop_duplicate_tweets(df: pd.DataFrame, id_index: TweetIdIndex, keep: str = 'first',
+                            id_column: str = None) -> pd.DataFrame:
+    """Drops the rows of `df` whose tweet ID is already in `id_index`, and all but the `keep`='first' or 'last'
+        copy of IDs repeated within `df`, then adds the remaining IDs to `id_index`. Rows without an ID are kept.
+        `id_column` defaults to the first of `tweet_id_columns` present in `df`."""
+    id_column = next(col for col in tweet_id_columns if (col in df.columns)) if (id_column is None) else id_column
+    ids, is_valid = tweet_turing_dedup.get_tweet_ids(df[id_column])
+
+    return df[id_index.filter_new(ids, is_valid, keep=keep)]
+
+
+def _drop_duplicate_records(records: list, id_index: TweetIdIndex, keep: str = 'first',
+                            id_key: str = 'id') -> list:
+    """As `drop_duplicate_tweets`, for a list of tweet dicts (JSON records)."""
+    ids, is_valid = tweet_turing_dedup.get_tweet_ids([record.get(id_key) for record in records])
+    keep_mask: np.ndarray = id_index.filter_new(ids, is_valid, keep=keep)
+
+    return [record for (record, is_kept) in zip(records, keep_mask) if is_kept]
+
+
+def _drop_duplicates_in_order(parts: list, drop_function, id_index: TweetIdIndex, keep: str = 'first') -> list:
+    """Applies `drop_function` (`drop_duplicate_tweets` or `_drop_duplicate_records`) to each of `parts`
+        (per-file DataFrames or record lists, in file order). With keep='last', parts are processed from
+        last to first, so that the copy in the latest part wins."""
+    if (keep == 'last'):
+        return [drop_function(part, id_index, keep=keep) for part in parts[::-1]][::-1]
+
+    return [drop_function(part, id_index, keep=keep) for part in parts]
+
+
 ####################################
 #### MERGING AND FILE FUNCTIONS ####
 ####################################
 
-def get_json_files(path: str = "./data/") -> list:
-    """Used to generate a list of json files contained within a given path."""
-    # get list of JSON files in directory
-    file_list = []
-    try:
-        file_list= os.listdir(path)
-    except FileNotFoundError:
-        logger.exception(f"get_json_files(): provided path could not be found. path='{path}'")
-        return -1
+def _get_files_with_extension(path: str, extension: str, caller_name: str) -> list:
+    """Lists the files under directory `path` (including subdirectories) ending with `extension`, as
+        sorted paths joined onto `path`. Files are listed by a `tweet_turing_storage.LocalBackend` rooted
+        at `path`, as for any other local copy of the bucket. Raises FileNotFoundError if `path` is not
+        a directory."""
+    import tweet_turing_storage     # imports this module
 
-    # create list to store only json files
-    json_files = []
+    if not os.path.isdir(path):
+        logger.error(f"{caller_name}(): provided path could not be found. path='{path}'")
+        raise FileNotFoundError(f"{caller_name}(): provided path could not be found. path='{path}'")
 
-    for f in file_list:
-        if f.endswith('.json'):
-            if (path[-1] not in ["/", "\\"]):   # check if path includes a trailing slash
-                trailing_slash = "/"            # TODO: expand for windows backslashes?
-            else:
-                trailing_slash = ""
+    backend = tweet_turing_storage.LocalBackend(root_path=path)
+    trailing_slash: str = "" if (path[-1] in ["/", "\\"]) else "/"   # check if path includes a trailing slash
+
+    return [f"{path}{trailing_slash}{object_name}" for object_name in sorted(backend.list_object_states())
+            if object_name.endswith(extension)]
 
-            json_files.append(f"{path}{trailing_slash}{f}")
-    
-    return json_files
+
+@instrumented('list')
+def get_json_files(path: str = "./data/") -> list:
+    """Used to generate a list of json files contained within a given path. Raises FileNotFoundError
+        if the path could not be found."""
+    return _get_files_with_extension(path, '.json', 'get_json_files')
 
 
-def load_local_json(filepath: str, encoding: str = 'utf-8') -> list:
+@instrumented('parse', bytes_in=file_sizes('filepath'))
+def load_local_json(filepath: str, encoding: str = 'utf-8', json_backend: str = None,
+                    record_class: type = None) -> list:
     """Loads a local JSON file. Default encoding is 'utf-8'.
-        Returns a list of dicts representing the JSON data."""
+        The file is decoded with `json_backend` (default: the fastest installed, see tweet_turing_json.py).
+        If a `record_class` (e.g. `TweetRecord`) is provided, each tweet is converted to a compact typed record.
+        Returns a list of dicts (or records) representing the JSON data."""
     json_data: list = []
 
     try:
-        with open(file=filepath, mode='r', encoding=encoding) as json_file_handle:
-            json_data = json.load(json_file_handle)
+        json_data = tweet_turing_json.load_json_file(filepath, encoding=encoding, backend=json_backend)
     except Exception:
         logger.exception(f"load_local_json(): error loading JSON from file '{filepath}'")
         return -1
 
-    return json_data
+    return tweet_turing_json.convert_records(json_data, record_class) if (record_class is not None) else json_data
 
 
-def load_local_json_parquet(filepath: str, engine: str = 'pyarrow') -> list:
+@instrumented('parse', bytes_in=file_sizes('filepath'))
+def load_local_json_parquet(filepath: str, engine: str = 'pyarrow', compact: bool = False,
+                            parse_dates: bool = False, ipc_snapshot: bool = False) -> list:
     """A wrapper for pandas `read_parquet` function.
+        If `compact` is True, column types are reduced with `compact_dtypes`.
+        If `parse_dates` is True, timestamp columns are converted to UTC datetimes with `parse_date_columns`.
+        If `ipc_snapshot` is True, the file is loaded from a memory-mapped Arrow IPC copy next to it, which is
+        (re)generated whenever the parquet file changes (see tweet_turing_ipc.py).
         Returns a list of dicts consistent with JSON format."""
-    return pd.read_parquet(filepath, engine=engine)
+    if ipc_snapshot:
+        df: pd.DataFrame = tweet_turing_ipc.ipc_table_to_df(tweet_turing_ipc.get_parquet_ipc_table(filepath))
+    else:
+        df: pd.DataFrame = pd.read_parquet(filepath, engine=engine)
+
+    if parse_dates:
+        df = parse_date_columns(df)
+
+    return compact_dtypes(df) if compact else df
 
 
 def load_gcp_json(bucket: storage.Bucket, object_name: str):
@@ -135,98 +510,473 @@ def load_gcp_json(bucket: storage.Bucket, object_name: str):
     return get_gcp_object_as_json(bucket=bucket, object_name=object_name)
 
 
-def merge_json_files(file_list, output_filehandle = None) -> list:
+@instrumented('merge', bytes_in=file_sizes('file_list'))
+def merge_json_files(file_list, output_filehandle = None, id_index: TweetIdIndex = None,
+                        keep: str = 'first', json_backend: str = None, record_class: type = None) -> list:
     """Accepts a list of json files and concatenates them at the top-list level.
-        Returns a list of dicts consistent with JSON format."""
+        If an `id_index` is provided, duplicate tweets (by `id`) are dropped file by file as they are loaded,
+        keeping the `keep`='first' or 'last' copy; tweets whose ID is already in `id_index` are always dropped.
+        Files are decoded with `json_backend`, and converted to `record_class` records if provided
+        (see `load_local_json`).
+        Returns a list of dicts (or records) consistent with JSON format."""
     # initialize empty lists
     result = []
     json_data = []
 
-    # iterate over file_list, extending list `result`
-    for f in file_list:
+    # with keep='last', files are deduplicated from last to first, so that later copies win
+    reverse_files: bool = (id_index is not None) and (keep == 'last')
+    file_results: list = []
+
+    # iterate over file_list, collecting each file's records
+    for f in (file_list[::-1] if reverse_files else file_list):
         try:
-            with open(file=f, mode='r', encoding='utf-8') as fh:
-                json_data = json.load(fh)
+            json_data = tweet_turing_json.load_json_file(f, backend=json_backend)
         except Exception:
             logger.exception(f"merge_json_files(): error loading JSON from file '{f}'")
             return -1
-            
+
+        if (id_index is not None):
+            json_data = _drop_duplicate_records(json_data, id_index, keep=keep)
+        if (record_class is not None):
+            json_data = tweet_turing_json.convert_records(json_data, record_class)
+
+        file_results.append(json_data)
+
+    for json_data in (file_results[::-1] if reverse_files else file_results):
         result.extend(json_data)
-    
+
     # save to a file if output_filehandle was provided
     if output_filehandle is not None:
         # indicates to save the result to a file
-        json.dump(result, output_filehandle)
-    
+        json.dump(result, output_filehandle, default=tweet_turing_json.record_to_json)
+
     # return the result
     return result
 
 
-# TODO -> could combine this function with get_json_files, make file extension an argument
-def get_csv_files(path: str = "./data/"):
-    """Used to generate a list of CSV files contained within a given path."""
-    # get list of CSV files in directory
-    file_list = []
+def iter_json_array(file_handle, chunk_size: int = json_read_chunk_size):
+    """Incrementally decodes a JSON file whose top level is an array, yielding one
+        array element at a time. Only the current read buffer (roughly `chunk_size`
+        characters plus one element) is held in memory, never the whole file."""
+    decoder = json.JSONDecoder()
+    buffer: str = file_handle.read(chunk_size)
+    eof: bool = (buffer == "")
+    pos: int = 0
+    state: str = "start"    # one of: start, value_or_end, value, separator_or_end
+
+    while True:
+        # skip whitespace between tokens
+        while (pos < len(buffer)) and (buffer[pos] in " \t\n\r"):
+            pos += 1
+
+        # refill the buffer (dropping consumed text) if we ran out
+        if (pos == len(buffer)):
+            if eof:
+                raise ValueError("iter_json_array(): unexpected end of input inside JSON array")
+            buffer = file_handle.read(chunk_size)
+            eof = (buffer == "")
+            pos = 0
+            continue
+
+        char = buffer[pos]
+
+        if (state == "start"):
+            if (char != "["):
+                raise ValueError("iter_json_array(): expected JSON input to be a top-level array")
+            pos += 1
+            state = "value_or_end"
+        elif (state == "separator_or_end") or ((state == "value_or_end") and (char == "]")):
+            if (char == "]"):
+                return
+            if (char != ","):
+                raise ValueError(f"iter_json_array(): expected ',' or ']' but found {char!r}")
+            pos += 1
+            state = "value"
+        else:
+            try:
+                element, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                element, end = None, -1
+
+            # a parse failure, or a number followed only by number-like characters up to the
+            #   end of the buffer, may just mean the element is split across reads
+            split_number: bool = isinstance(element, (int, float)) and not eof \
+                and (buffer[end:].strip("0123456789.eE+-") == "")
+            if (end == -1) or split_number:
+                more: str = file_handle.read(chunk_size)
+                eof = (more == "")
+                buffer = buffer[pos:] + more
+                pos = 0
+                continue
+
+            yield element
+            pos = end
+            state = "separator_or_end"
+
+
+def iter_json_records(file_list, chunk_size: int = json_read_chunk_size):
+    """Streaming counterpart to `merge_json_files`. Yields the records (dicts) of each
+        JSON file in `file_list` one at a time, in file order, without ever holding
+        more than one file's read buffer in memory."""
+    for f in file_list:
+        try:
+            with open(file=f, mode='r', encoding='utf-8') as fh:
+                yield from iter_json_array(fh, chunk_size=chunk_size)
+        except Exception:
+            logger.exception(f"iter_json_records(): error loading JSON from file '{f}'")
+            raise
+
+
+def iter_unique_records(records, id_index: TweetIdIndex, batch_size: int = 10_000, id_key: str = 'id'):
+    """Yields the tweet dicts of `records` (e.g. from `iter_json_records`), minus those whose `id_key`
+        is already in `id_index` or was already yielded. IDs are checked `batch_size` records at a time,
+        so duplicates are dropped as data streams in."""
+    batch: list = []
+
+    for record in records:
+        batch.append(record)
+
+        if (len(batch) >= batch_size):
+            yield from _drop_duplicate_records(batch, id_index, id_key=id_key)
+            batch = []
+
+    if (len(batch) > 0):
+        yield from _drop_duplicate_records(batch, id_index, id_key=id_key)
+
+
+def iter_json_record_batches(file_list, batch_size: int = 10_000, schema: pa.Schema = None,
+                                id_index: TweetIdIndex = None):
+    """Groups the records from `iter_json_records` into pyarrow RecordBatches of up to
+        `batch_size` rows, all with the same `schema` (default: the raw tweet schema from
+        `get_nested_arrow_schema`). Fields missing from a record become nulls; fields not in
+        `schema` are dropped.
+        If an `id_index` is provided, duplicate tweets (by `id`) are dropped from each batch as it streams in,
+        keeping the first copy."""
+    schema = get_nested_arrow_schema() if (schema is None) else schema
+    batch: list = []
+    records = iter_json_records(file_list)
+
+    if (id_index is not None):
+        records = iter_unique_records(records, id_index, batch_size=batch_size)
+
+    for record in records:
+        batch.append(record)
+
+        if (len(batch) >= batch_size):
+            yield pa.RecordBatch.from_pylist(batch, schema=schema)
+            batch = []
+
+    if (len(batch) > 0):
+        yield pa.RecordBatch.from_pylist(batch, schema=schema)
+
+
+@instrumented('merge', bytes_in=file_sizes('file_list'), bytes_out=file_sizes('output_path'))
+def merge_json_files_streaming(file_list, output_path: str, output_format: str = 'parquet',
+                                batch_size: int = 10_000, schema: pa.Schema = None,
+                                id_index: TweetIdIndex = None) -> int:
+    """Bounded-memory alternative to `merge_json_files`. Streams the records of every file
+        in `file_list` straight to `output_path` as either Parquet (`output_format='parquet'`)
+        or JSON Lines (`output_format='jsonl'`). Peak memory stays at roughly one batch.
+        Parquet output has one `schema` throughout (default: see `iter_json_record_batches`).
+        If an `id_index` is provided, duplicate tweets are dropped as they stream in (keeping the first copy).
+        The output is written to a temporary file next to `output_path` and only renamed to `output_path`
+        once complete, so a failed merge never leaves a truncated file behind.
+        Returns the number of records written."""
+    if (output_format not in ('parquet', 'jsonl')):
+        raise ValueError(f"merge_json_files_streaming(): unsupported output_format '{output_format}', expected 'parquet' or 'jsonl'")
+
+    record_count: int = 0
+    temp_path: str = os.path.join(os.path.dirname(output_path), f".{os.path.basename(output_path)}.tmp")
+
     try:
-        file_list= os.listdir(path)
-    except FileNotFoundError:
-        logger.exception(f"get_csv_files(): provided path could not be found. path='{path}'")
-        return -1
+        if (output_format == 'jsonl'):
+            records = iter_json_records(file_list)
+            if (id_index is not None):
+                records = iter_unique_records(records, id_index, batch_size=batch_size)
 
-    # create list to store only csv files
-    csv_files = []
+            with open(file=temp_path, mode='w', encoding='utf-8') as out_fh:
+                record_count = write_json_records(records, out_fh, output_format='jsonl')
+        else:
+            schema = get_nested_arrow_schema() if (schema is None) else schema
+            with pq.ParquetWriter(temp_path, schema) as writer:
+                for record_batch in iter_json_record_batches(file_list, batch_size=batch_size, schema=schema,
+                                                                id_index=id_index):
+                    writer.write_batch(record_batch)
+                    record_count += record_batch.num_rows
+
+        os.replace(temp_path, output_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    return record_count
+
+
+def write_json_records(json_data, file_handle, output_format: str = 'json') -> int:
+    """Writes `json_data` to the text `file_handle` one record at a time, so the whole JSON text is never
+        held in memory. `json_data` is a list or any iterable of records (e.g. `iter_json_records`), written
+        as one JSON array (`output_format='json'`, same text as `json.dumps`) or as JSON Lines
+        (`output_format='jsonl'`). A dict is written as a single object. Typed records (see `make_record_class`)
+        are written as their dicts. Returns the number of records written."""
+    if (output_format not in gcp_json_content_types):
+        raise ValueError(f"write_json_records(): unsupported output_format '{output_format}', expected 'json' or 'jsonl'")
+
+    if isinstance(json_data, (dict, tweet_turing_json.TypedRecord)) and (output_format == 'json'):
+        # json.dump encodes and writes piece by piece
+        json.dump(json_data, file_handle, default=tweet_turing_json.record_to_json)
+        return 1
+
+    records = [json_data] if isinstance(json_data, (dict, tweet_turing_json.TypedRecord)) else json_data
+    record_count: int = 0
+
+    if (output_format == 'json'):
+        file_handle.write("[")
+
+    for record in records:
+        if (output_format == 'json') and (record_count > 0):
+            file_handle.write(", ")
+        file_handle.write(json.dumps(record, default=tweet_turing_json.record_to_json))
+        if (output_format == 'jsonl'):
+            file_handle.write("\n")
+        record_count += 1
+
+    if (output_format == 'json'):
+        file_handle.write("]")
+
+    return record_count
+
+
+def get_nested_arrow_schema(dtype_mapping: dict = authentic_df_eda_dtype_mapping,
+                            json_column_types: dict = authentic_json_column_types) -> pa.Schema:
+    """Builds the nested Arrow schema of raw tweet JSON from the flattened, dotted column names in
+        `dtype_mapping` (e.g. `author.public_metrics.followers_count` becomes field `followers_count` of
+        struct `public_metrics` of struct `author`). Column types come from `json_column_types` if present
+        there, otherwise from `dtype_mapping`. Columns of dtype 'object' must be in `json_column_types`."""
+    tree: dict = {}
+
+    for (col, dtype) in dtype_mapping.items():
+        arrow_type: pa.DataType = json_column_types[col] if (col in json_column_types) else _arrow_type_from_dtype(dtype)
+        *parents, name = col.split('.')
+        node: dict = tree
+        for parent in parents:
+            node = node.setdefault(parent, {})
+        node[name] = arrow_type
+
+    def to_fields(node: dict) -> list:
+        return [
+            pa.field(name, pa.struct(to_fields(child)) if isinstance(child, dict) else child)
+            for (name, child) in node.items()
+            ]
+
+    return pa.schema(to_fields(tree))
+
+
+def flatten_json_table(table: pa.Table, dtype_mapping: dict = authentic_df_eda_dtype_mapping) -> pa.Table:
+    """Flattens the struct columns of a nested table (see `get_nested_arrow_schema`) into dotted columns,
+        as `pd.json_normalize` would, keeping list columns as native Arrow lists.
+        Scalar columns are cast to their type in `dtype_mapping`, and columns are ordered as in `dtype_mapping`."""
+    while any(pa.types.is_struct(field.type) for field in table.schema):
+        table = table.flatten()
+
+    for (col, dtype) in dtype_mapping.items():
+        if (col in table.column_names) and (dtype != 'object'):
+            arrow_type: pa.DataType = _arrow_type_from_dtype(dtype)
+            if (table.schema.field(col).type != arrow_type):
+                table = table.set_column(table.column_names.index(col), col, table[col].cast(arrow_type))
+
+    return table.select([col for col in dtype_mapping if (col in table.column_names)])
+
+
+def iter_flat_json_batches(records, batch_size: int = 10_000,
+                            dtype_mapping: dict = authentic_df_eda_dtype_mapping,
+                            id_index: TweetIdIndex = None) -> pa.Table:
+    """Converts an iterable of raw tweet dicts (e.g. from `iter_json_records`) straight into typed, flattened
+        Arrow tables of up to `batch_size` rows, with the columns of `dtype_mapping`.
+        Fields missing from a record become nulls; fields not in `dtype_mapping` are dropped.
+        If an `id_index` is provided, duplicate tweets are dropped as they stream in (keeping the first copy)."""
+    schema: pa.Schema = get_nested_arrow_schema(dtype_mapping)
+    batch: list = []
+
+    if (id_index is not None):
+        records = iter_unique_records(records, id_index, batch_size=batch_size)
+
+    for record in records:
+        batch.append(record)
+
+        if (len(batch) >= batch_size):
+            yield flatten_json_table(pa.Table.from_pylist(batch, schema=schema), dtype_mapping)
+            batch = []
+
+    if (len(batch) > 0):
+        yield flatten_json_table(pa.Table.from_pylist(batch, schema=schema), dtype_mapping)
+
+
+@instrumented('merge', bytes_in=file_sizes('file_list'))
+def read_json_files_as_table(file_list, batch_size: int = 10_000,
+                                dtype_mapping: dict = authentic_df_eda_dtype_mapping,
+                                id_index: TweetIdIndex = None) -> pa.Table:
+    """Alternative to `merge_json_files` followed by `pd.json_normalize`. Streams the records of every
+        JSON file in `file_list` into one flattened Arrow table (see `iter_flat_json_batches`),
+        without building a list of dicts. Returns None if `file_list` is empty."""
+    if (len(file_list) == 0):
+        return None
 
-    for f in file_list:
-        if f.endswith('.csv'):
-            if (path[-1] not in ["/", "\\"]):   # check if path includes a trailing slash
-                trailing_slash = "/"            # TODO: expand for windows backslashes?
-            else:
-                trailing_slash = ""
+    return pa.concat_tables(
+        iter_flat_json_batches(iter_json_records(file_list), batch_size=batch_size, dtype_mapping=dtype_mapping,
+                                id_index=id_index)
+        )
+
+
+def json_table_to_df(table: pa.Table) -> pd.DataFrame:
+    """Converts a table from `read_json_files_as_table` to a pandas DataFrame. Strings use the pandas
+        "string" dtype; list columns stay Arrow-backed (`pd.ArrowDtype`) rather than Python objects."""
+    def types_mapper(arrow_type: pa.DataType):
+        if (arrow_type == pa.string()):
+            return pd.StringDtype()
+        if pa.types.is_list(arrow_type):
+            return pd.ArrowDtype(arrow_type)
+        return None
 
-            csv_files.append(f"{path}{trailing_slash}{f}")
-    
-    return csv_files
+    return table.to_pandas(types_mapper=types_mapper)
 
 
-def merge_csv_files(file_list) -> pd.DataFrame:
+@instrumented('list')
+def get_csv_files(path: str = "./data/") -> list:
+    """Used to generate a list of CSV files contained within a given path. Raises FileNotFoundError
+        if the path could not be found."""
+    return _get_files_with_extension(path, '.csv', 'get_csv_files')
+
+
+@instrumented('merge', bytes_in=file_sizes('file_list'))
+def merge_csv_files(file_list, compact: bool = False, parse_dates: bool = False,
+                    id_index: TweetIdIndex = None, keep: str = 'first') -> pd.DataFrame:
     """Accepts a list of csv files and concatenates them row-wise.
         Expects columns to be identical schema between CSV files.
+        If `compact` is True, columns are loaded with the memory-saving types of `compact_dtypes`.
+        If `parse_dates` is True, `publish_date` and `harvested_date` are converted to UTC datetimes.
+        If an `id_index` is provided, duplicate tweets (by `tweet_id`) are dropped file by file as they are
+        loaded, keeping the `keep`='first' or 'last' copy; tweets already in `id_index` are always dropped.
         Returns a pandas DataFrame of the merged CSV data."""
     # check for no files in file_list
     if (len(file_list) == 0):
         return None
-    
-    # create dataframe of first CSV
-    csv_df: pd.DataFrame = pd.read_csv(
-        file_list[0], 
-        encoding='utf-8', 
-        low_memory=False, 
-        dtype=csv_column_dtype_mapping
-        )
 
-    # now load and concatenate onto that csv_df as we go
-    if (len(file_list) == 1):
-        return csv_df
+    dtype_mapping: dict = csv_column_compact_dtype_mapping if compact else csv_column_dtype_mapping
 
-    for file in file_list[1:]:
+    # with keep='last', files are deduplicated from last to first, so that later copies win
+    reverse_files: bool = (id_index is not None) and (keep == 'last')
+
+    # collect every file's dataframe, then concatenate once at the end
+    #   (concatenating inside the loop re-copies all prior rows on every iteration)
+    csv_dfs: list = []
+
+    for file in (file_list[::-1] if reverse_files else file_list):
         new_df: pd.DataFrame = pd.read_csv(
-            file, 
-            encoding='utf-8', 
-            low_memory=False, 
-            dtype=csv_column_dtype_mapping
+            file,
+            encoding='utf-8',
+            low_memory=False,
+            dtype=dtype_mapping
             )
-        csv_df = pd.concat([csv_df, new_df])
+        if parse_dates:
+            new_df = parse_date_columns(new_df)
+        if (id_index is not None):
+            new_df = drop_duplicate_tweets(new_df, id_index, keep=keep)
+        csv_dfs.append(new_df)
 
-    return csv_df
+    if reverse_files:
+        csv_dfs.reverse()
+
+    if (len(csv_dfs) == 1):
+        return compact_dtypes(csv_dfs[0]) if compact else csv_dfs[0]
+
+    with measure('concat', 'merge_csv_files'):
+        return _concat_compact(csv_dfs) if compact else pd.concat(csv_dfs)
+
+
+def _arrow_type_from_dtype(dtype: str) -> pa.DataType:
+    """Translates a pandas dtype string (as used in `csv_column_dtype_mapping`) to a pyarrow type."""
+    if (dtype == "string"):
+        return pa.string()
 
+    return pa.from_numpy_dtype(np.dtype(dtype))
+
+
+def get_csv_dataset(file_list, dtype_mapping: dict = csv_column_dtype_mapping,
+                    filesystem = None) -> ds.Dataset:
+    """Creates a lazy, multi-file pyarrow Dataset over a list of CSV files sharing one schema.
+        Column types follow `dtype_mapping`; nothing is read until the dataset is scanned.
+        `filesystem` may be any pyarrow-compatible filesystem (defaults to local disk)."""
+    convert_options = pa_csv.ConvertOptions(
+        column_types={col: _arrow_type_from_dtype(dtype) for (col, dtype) in dtype_mapping.items()},
+        null_values=csv_null_values,
+        strings_can_be_null=True
+        )
+
+    csv_format = ds.CsvFileFormat(
+        parse_options=pa_csv.ParseOptions(newlines_in_values=True),   # tweet text may contain newlines
+        convert_options=convert_options
+        )
+
+    return ds.dataset(list(file_list), format=csv_format, filesystem=filesystem)
+
+
+@instrumented('merge', bytes_in=file_sizes('file_list'))
+def read_csv_dataset(file_list, usecols: list = None, filters = None,
+                        dtype_mapping: dict = csv_column_dtype_mapping, filesystem = None,
+                        use_threads: bool = True, compact: bool = False, parse_dates: bool = False,
+                        id_index: TweetIdIndex = None, keep: str = 'first') -> pd.DataFrame:
+    """Alternative to `merge_csv_files` which parses all CSV files in parallel (across cores)
+        and concatenates them once, without intermediate copies.
+        `usecols` limits which columns are materialized; `filters` drops rows while reading and
+        accepts either a pyarrow expression or a list of `(column, op, value)` tuples in the same
+        format as pandas' `read_parquet(filters=...)`, e.g. `[('account_category', '==', 'RightTroll')]`.
+        If `compact` is True, column types are reduced as in `compact_dtypes`.
+        If `parse_dates` is True, `publish_date` and `harvested_date` are converted to UTC datetimes.
+        If an `id_index` is provided, duplicate tweets are dropped before conversion to pandas (see `merge_csv_files`).
+        Returns a pandas DataFrame (with a fresh RangeIndex), or None if `file_list` is empty."""
+    # check for no files in file_list
+    if (len(file_list) == 0):
+        return None
+
+    if (filters is not None) and not isinstance(filters, ds.Expression):
+        filters = pq.filters_to_expression(filters)
+
+    dataset: ds.Dataset = get_csv_dataset(file_list, dtype_mapping=dtype_mapping, filesystem=filesystem)
+    with measure('parse', 'read_csv_dataset'):
+        table: pa.Table = dataset.to_table(columns=usecols, filter=filters, use_threads=use_threads)
+
+    if (id_index is not None):
+        ids, is_valid = tweet_turing_dedup.get_tweet_ids(table['tweet_id'])
+        table = table.filter(pa.array(id_index.filter_new(ids, is_valid, keep=keep)))
+
+    if compact:
+        # dictionary-encoded columns convert straight to categoricals, Arrow strings are kept as they are
+        for col in low_cardinality_columns:
+            if (col in table.column_names):
+                table = table.set_column(table.column_names.index(col), col, pc.dictionary_encode(table[col]))
+        csv_df: pd.DataFrame = compact_dtypes(table.to_pandas(types_mapper={pa.string(): pd.StringDtype('pyarrow')}.get))
+    else:
+        # keep pandas "string" dtype for string columns, consistent with `dtype_mapping`
+        csv_df: pd.DataFrame = table.to_pandas(types_mapper={pa.string(): pd.StringDtype()}.get)
 
-def get_gcp_storage_client(project_name: str = "ds-capstone-jmmr", 
-                            key_file: str = "../key/service_acct_key.json") -> storage.Client:
-    """Creates and returns a storage client object for use with the Google Cloud Storage 
+    return parse_date_columns(csv_df) if parse_dates else csv_df
+
+
+def get_gcp_storage_client(project_name: str = "ds-capstone-jmmr",
+                            key_file: str = "../key/service_acct_key.json",
+                            pool_size: int = None) -> storage.Client:
+    """Creates and returns a storage client object for use with the Google Cloud Storage
         client library. Enables access to cloud storage buckets within the specified `project_name`.
-        Authenticates with the supplied service account key in `key_file`."""
+        Authenticates with the supplied service account key in `key_file`.
+        If `pool_size` is provided, the client's HTTP connection pool is sized to keep that many
+        connections open, so it can be shared by that many concurrent download threads."""
+    storage = _import_optional("google.cloud.storage")
+    service_account = _import_optional("google.oauth2.service_account")
     credentials: service_account.Credentials = None
-    
+
     try:
         credentials = service_account.Credentials.from_service_account_file(key_file)
     except FileNotFoundError:
@@ -235,9 +985,15 @@ def get_gcp_storage_client(project_name: str = "ds-capstone-jmmr",
     except ValueError:
         logger.exception(f"get_gcp_storage_client(): provided key_file didn't use correct format. key_file='{key_file}'")
         return -1
-    
+
     storage_client: storage.Client = storage.Client(project=project_name, credentials=credentials)
 
+    if (pool_size is not None):
+        # default pool keeps 10 connections per host; more threads than that would discard connections
+        requests = _import_optional("requests")
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        storage_client._http.mount("https://", adapter)
+
     return storage_client
 
 
@@ -247,14 +1003,15 @@ def get_gcp_bucket(storage_client: storage.Client, bucket_name: str = "disinfo-d
         # indicates `get_gcp_storage_client()` had an error
         logger.exception(f"get_gcp_bucket(): provided storage_client had an issue. storage_client='{storage_client}'")
         return -1
-    
+
     return storage_client.get_bucket(bucket_name)
 
 
-def list_gcp_objects(storage_client: storage.Client, bucket_name: str = "disinfo-detector-tweet-turing-test", 
+@instrumented('list')
+def list_gcp_objects(storage_client: storage.Client, bucket_name: str = "disinfo-detector-tweet-turing-test",
                         obj_prefix: str = ""):
     """Retrieves and returns a list of the objects/blobs within a given GCP cloud storage bucket."""
-    # according to docs, `Bucket.list_blobs(...)` is deprecated, 
+    # according to docs, `Bucket.list_blobs(...)` is deprecated,
     #   with `Client.list_blobs()` called out as its replacement
     blob_list = storage_client.list_blobs(bucket_or_name=bucket_name, prefix=obj_prefix)
     blob_list_str = [obj.name for obj in blob_list if (obj.name != obj_prefix)]
@@ -262,28 +1019,40 @@ def list_gcp_objects(storage_client: storage.Client, bucket_name: str = "disinfo
     return blob_list_str
 
 
-def get_gcp_object_as_json(bucket: storage.Bucket, object_name: str) -> dict:
+def get_gcp_object_as_json(bucket: storage.Bucket, object_name: str, cache: GcpObjectCache = None,
+                            json_backend: str = None, record_class: type = None) -> dict:
     """Downloads the noted object from bucket and processes it as JSON text.
-        Returns a list of dicts consisent with JSON format."""
-    gcp_object: storage.Blob = bucket.get_blob(object_name)
+        If a `cache` is provided, the object is read from local disk unless it changed in the bucket.
+        The text is decoded with `json_backend`, and converted to `record_class` records if provided
+        (see `load_local_json`).
+        Returns a list of dicts (or records) consisent with JSON format."""
+    gcp_object_text: str = get_gcp_object_as_text(bucket=bucket, object_name=object_name, cache=cache)
 
-    if (gcp_object == None):
+    if (gcp_object_text == None):
         return None
-    
-    gcp_object_text: str = gcp_object.download_as_text()
 
-    return json.loads(gcp_object_text)
+    json_data = tweet_turing_json.decode_json(gcp_object_text, backend=json_backend)
+    del gcp_object_text     # release the text before any records are built
+
+    return tweet_turing_json.convert_records(json_data, record_class) if (record_class is not None) else json_data
 
 
-def get_gcp_object_as_text(bucket: storage.Bucket, object_name: str) -> str:
+@instrumented('download', rows=None)
+def get_gcp_object_as_text(bucket: storage.Bucket, object_name: str, cache: GcpObjectCache = None) -> str:
     """Downloads the noted object from bucket and processes it as plain text.
+        If a `cache` is provided, the object is read from local disk unless it changed in the bucket.
         Returns the plain text as a string."""
     gcp_object: storage.Blob = bucket.get_blob(object_name)
 
     if (gcp_object == None):
         return None
-    
+
+    if (cache is not None):
+        count_io(bytes_in=gcp_object.size)
+        return cache.get_text(gcp_object)
+
     gcp_object_text: str = gcp_object.download_as_text()
+    count_io(bytes_in=gcp_object.size)
 
     return gcp_object_text
 
@@ -294,90 +1063,405 @@ def get_gcp_object_as_blob(bucket: storage.Bucket, object_name: str) -> storage.
     return bucket.blob(object_name)    # using .blob() instead of .get_blob() to avoid downloading too early
 
 
-def merge_gcp_csv_files(bucket: storage.Bucket, object_list: list) -> pd.DataFrame:
+@instrumented('download')
+def get_gcp_object_as_csv_df(bucket: storage.Bucket, object_name: str, compact: bool = False) -> pd.DataFrame:
+    """Streams the noted CSV object from bucket into a pandas DataFrame, using the column types
+        in `csv_column_dtype_mapping` (or `csv_column_compact_dtype_mapping` if `compact` is True)."""
+    this_blob: storage.Blob = get_gcp_object_as_blob(bucket, object_name)
+
+    csv_df: pd.DataFrame = pd.read_csv(
+        this_blob.open("r", encoding='utf-8'),
+        encoding='utf-8',
+        low_memory=False,
+        dtype=csv_column_compact_dtype_mapping if compact else csv_column_dtype_mapping
+        )
+    count_io(bytes_in=this_blob.size)     # known once the blob has been opened
+
+    return csv_df
+
+
+@instrumented('download')
+def fetch_objects(object_list: list, fetch_function, max_workers: int = gcp_fetch_max_workers,
+                    max_retries: int = gcp_fetch_max_retries, retry_backoff: float = gcp_fetch_retry_backoff) -> list:
+    """Fetches many objects concurrently using a bounded pool of `max_workers` threads. Each object is
+        fetched with `fetch_function(object_name)` (e.g. a storage backend's reader, see tweet_turing_storage.py).
+        Transient failures (see `gcp_transient_errors`) are retried per object up to `max_retries`
+        times with exponential backoff; other errors, and transient ones once retries run out, are raised.
+        Returns the results in the same order as `object_list`, whatever order they complete in."""
+    transient_errors: tuple = _get_gcp_transient_errors()
+
+    def fetch_one(object_name: str):
+        for attempt in range(max_retries + 1):
+            try:
+                return fetch_function(object_name)
+            except transient_errors:
+                if (attempt == max_retries):
+                    logger.exception(f"fetch_objects(): giving up on object '{object_name}' after {attempt + 1} attempts")
+                    raise
+                logger.warning(f"fetch_objects(): transient error fetching '{object_name}', retrying (attempt {attempt + 1})")
+                time.sleep(retry_backoff * (2 ** attempt))
+
+    if (max_workers <= 1) or (len(object_list) <= 1):
+        return [fetch_one(obj) for obj in object_list]
+
+    # `map` yields results in submission order, regardless of completion order
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(fetch_one, object_list))
+
+
+def fetch_gcp_objects(bucket: storage.Bucket, object_list: list, fetch_function = get_gcp_object_as_json,
+                        max_workers: int = gcp_fetch_max_workers, max_retries: int = gcp_fetch_max_retries,
+                        retry_backoff: float = gcp_fetch_retry_backoff) -> list:
+    """Downloads many objects from bucket concurrently (see `fetch_objects`), with threads which all share
+        the bucket's (pooled) client. Each object is fetched with `fetch_function(bucket=bucket, object_name=...)`,
+        e.g. `get_gcp_object_as_json`. Returns the results in the same order as `object_list`."""
+    return fetch_objects(object_list, lambda object_name: fetch_function(bucket=bucket, object_name=object_name),
+                            max_workers=max_workers, max_retries=max_retries, retry_backoff=retry_backoff)
+
+
+@instrumented('merge')
+def merge_gcp_csv_files(bucket: storage.Bucket, object_list: list,
+                        max_workers: int = gcp_fetch_max_workers, compact: bool = False,
+                        parse_dates: bool = False, id_index: TweetIdIndex = None,
+                        keep: str = 'first') -> pd.DataFrame:
     """See `merge_csv_files`, this function performs the same task but on GCP objects
-        rather than local files."""
+        rather than local files. Objects are downloaded concurrently (see `fetch_gcp_objects`).
+        Returns -1 if an object could not be downloaded (e.g. missing, or still failing after retries)."""
     # check for no files in file_list
     if (len(object_list) == 0):
         return None
-    
-    # create dataframe of first CSV
-    this_blob: storage.Blob = get_gcp_object_as_blob(bucket, object_list[0])
-    csv_df: pd.DataFrame = pd.read_csv(
-        this_blob.open("r", encoding='utf-8'), 
-        encoding='utf-8', 
-        low_memory=False, 
-        dtype=csv_column_dtype_mapping
-        )
-    
-    # now load and concatenate onto that csv_df as we go
-    if (len(object_list) == 1):
-        return csv_df
 
-    for obj in object_list[1:]:
-        this_blob = get_gcp_object_as_blob(bucket, obj)
-        new_df: pd.DataFrame = pd.read_csv(
-            this_blob.open("r", encoding='utf-8'), 
-            encoding='utf-8', 
-            low_memory=False, 
-            dtype=csv_column_dtype_mapping
-            )
-        csv_df = pd.concat([csv_df, new_df])
+    fetch_function = functools.partial(get_gcp_object_as_csv_df, compact=compact)
+    try:
+        csv_dfs: list = fetch_gcp_objects(bucket, object_list, fetch_function=fetch_function,
+                                            max_workers=max_workers)
+    except Exception:
+        logger.exception(f"merge_gcp_csv_files(): error downloading objects from bucket '{bucket.name}'")
+        return -1
 
-    return csv_df
+    if parse_dates:
+        csv_dfs = [parse_date_columns(csv_df) for csv_df in csv_dfs]
+
+    if (id_index is not None):
+        csv_dfs = _drop_duplicates_in_order(csv_dfs, drop_duplicate_tweets, id_index, keep)
+
+    # concatenate once at the end
+    if (len(csv_dfs) == 1) and not compact:
+        return csv_dfs[0]
+
+    with measure('concat', 'merge_gcp_csv_files'):
+        return _concat_compact(csv_dfs) if compact else pd.concat(csv_dfs)
 
 
-def merge_gcp_json_files(bucket: storage.Bucket, object_list: list):
+def iter_gcp_json_records(bucket: storage.Bucket, object_list: list):
+    """Streaming counterpart to `merge_gcp_json_files`. Yields the records (dicts) of each
+        JSON object in `object_list` one at a time, reading each object as a stream.
+        Can feed `iter_flat_json_batches` to go straight from the bucket to Arrow."""
+    for object_name in object_list:
+        with get_gcp_object_as_blob(bucket, object_name).open("r", encoding='utf-8') as fh:
+            yield from iter_json_array(fh)
+
+
+@instrumented('merge')
+def merge_gcp_json_files(bucket: storage.Bucket, object_list: list,
+                            max_workers: int = gcp_fetch_max_workers, cache: GcpObjectCache = None,
+                            id_index: TweetIdIndex = None, keep: str = 'first', json_backend: str = None,
+                            record_class: type = None):
     """See `merge_json_files`, this function performs the same task but on GCP objects
-        rather than local files."""
-    # initialize empty lists
+        rather than local files. Objects are downloaded concurrently (see `fetch_gcp_objects`),
+        and read through `cache` if one is provided.
+        Returns -1 if an object could not be downloaded (e.g. missing, or still failing after retries)."""
+    # initialize empty list
     result = []
-    json_data = []
 
-    # iterate over file_list, extending list `result`
-    for obj in object_list:
-        json_data = get_gcp_object_as_json(bucket=bucket, object_name=obj)
+    fetch_function = functools.partial(get_gcp_object_as_json, cache=cache, json_backend=json_backend,
+                                        record_class=record_class)
+    try:
+        json_datas: list = fetch_gcp_objects(bucket, object_list, fetch_function=fetch_function,
+                                                max_workers=max_workers)
+    except Exception:
+        logger.exception(f"merge_gcp_json_files(): error downloading objects from bucket '{bucket.name}'")
+        return -1
+
+    missing_objects: list = [obj for (obj, json_data) in zip(object_list, json_datas) if (json_data is None)]
+    if (len(missing_objects) > 0):
+        logger.error(f"merge_gcp_json_files(): objects could not be found in bucket. objects={missing_objects}")
+        return -1
+
+    if (id_index is not None):
+        json_datas = _drop_duplicates_in_order(json_datas, _drop_duplicate_records, id_index, keep)
+
+    # iterate over downloaded objects (in `object_list` order), extending list `result`
+    for json_data in json_datas:
         result.extend(json_data)
-    
+
     # return the result
     return result
 
 
-def set_gcp_object_from_json(bucket: storage.Bucket, object_name: str, json_data: dict) -> None:
-    """Similar function to a 'File>Save', but accepts JSON data and 
-        writes it to a GCP bucket."""
+@instrumented('upload', rows=None)
+def set_gcp_object_from_json(bucket: storage.Bucket, object_name: str, json_data: dict,
+                                output_format: str = 'json', compress: bool = False,
+                                chunk_size: int = gcp_upload_chunk_size) -> None:
+    """Similar function to a 'File>Save', but accepts JSON data and
+        writes it to a GCP bucket, overwriting any existing object.
+        Records are encoded one at a time (see `write_json_records`) into a resumable upload sent in
+        requests of `chunk_size` bytes (a multiple of 256 KB), so peak memory is about one chunk rather than
+        the whole JSON text. `json_data` may be any iterable of records, written as a JSON array
+        (`output_format='json'`) or JSON Lines (`output_format='jsonl'`).
+        If `compress` is True, the object is gzip-compressed as it streams and stored with
+        `Content-Encoding: gzip`, so downloads (e.g. `get_gcp_object_as_json`) are decompressed transparently.
+        If an error occurs while writing, the upload is cancelled and no object is created."""
     new_blob: storage.Blob = bucket.blob(object_name)
-
-    # check if blob already exists
-    if (new_blob.exists()):
-        pass    # do nothing, overwrite old version
-
-    new_blob.upload_from_string(json.dumps(json_data))
-    
-    
-def set_gcp_object_from_df_as_parq(bucket: storage.Bucket, object_name: str, df: pd.DataFrame) -> None:
-    """Similar function to a 'File>Save', but accepts a pandas DataFrame and 
-        writes it to a GCP bucket."""
+    if compress:
+        new_blob.content_encoding = "gzip"
+
+    content_type: str = gcp_json_content_types.get(output_format)
+    with new_blob.open("wb", chunk_size=chunk_size, ignore_flush=True, content_type=content_type) as blob_fh:
+        byte_stream = gzip.GzipFile(fileobj=blob_fh, mode='wb', compresslevel=gcp_upload_compress_level) \
+                        if compress else blob_fh
+        text_fh = io.TextIOWrapper(byte_stream, encoding='utf-8')
+        record_count: int = write_json_records(json_data, text_fh, output_format=output_format)
+
+        text_fh.detach()        # flushes the text buffer without closing the upload
+        if compress:
+            byte_stream.close()     # writes the gzip trailer; leaves `blob_fh` open
+        count_io(rows=record_count, bytes_out=blob_fh.tell())
+
+
+@instrumented('upload', rows=lambda result, arguments: len(arguments['df']))
+def set_gcp_object_from_df_as_parq(bucket: storage.Bucket, object_name: str, df: pd.DataFrame,
+                                    chunk_size: int = gcp_upload_chunk_size) -> None:
+    """Similar function to a 'File>Save', but accepts a pandas DataFrame and
+        writes it to a GCP bucket, overwriting any existing object.
+        The parquet file is streamed as a resumable upload in requests of `chunk_size` bytes."""
     new_blob: storage.Blob = bucket.blob(object_name)
 
-    # check if blob already exists
-    if (new_blob.exists()):
-        pass    # do nothing, overwrite old version
+    with new_blob.open("wb", chunk_size=chunk_size, ignore_flush=True) as blob_fh:
+        df.to_parquet(blob_fh, engine='pyarrow', index=False, compression='gzip')
+        count_io(bytes_out=blob_fh.tell())
 
-    df.to_parquet(new_blob.open("wb"), engine='pyarrow', index=False, compression='gzip')
-    
 
-def get_gcp_object_from_parq_as_df(bucket: storage.Bucket, object_name: str) -> pd.DataFrame:
+@instrumented('download')
+def get_gcp_object_from_parq_as_df(bucket: storage.Bucket, object_name: str,
+                                    cache: GcpObjectCache = None, compact: bool = False,
+                                    parse_dates: bool = False, ipc_snapshot: bool = False,
+                                    ipc_dir: str = None) -> pd.DataFrame:
     """Loads from a GCP cloud storage parquet file containing a pandas DataFrame.
+        If a `cache` is provided, the file is read from local disk unless it changed in the bucket.
+        If `compact` is True, column types are reduced with `compact_dtypes`.
+        If `parse_dates` is True, timestamp columns are converted to UTC datetimes with `parse_date_columns`.
+        If `ipc_snapshot` is True, the object is loaded from a memory-mapped Arrow IPC copy in `ipc_dir` (default:
+        `tweet_turing_ipc.ipc_default_dir`, named after the bucket and object name), which is only downloaded and (re)generated when the object's
+        generation changes (see tweet_turing_ipc.py).
         Returns the DataFrame."""
-    gcp_object: storage.Blob = get_gcp_object_as_blob(bucket=bucket, object_name=object_name)
-    
-    if (gcp_object == None):
+    if ipc_snapshot:
+        gcp_object: storage.Blob = bucket.get_blob(object_name)     # metadata needed for source state
+
+        if (gcp_object == None):
+            return None
+
+        def load_function() -> pa.Table:
+            count_io(bytes_in=gcp_object.size)
+            return pq.read_table(cache.get_path(gcp_object) if (cache is not None) else gcp_object.open("rb"))
+
+        source_id: str = f"gs://{bucket.name}/{object_name}"
+        ipc_dir = tweet_turing_ipc.ipc_default_dir if (ipc_dir is None) else ipc_dir
+        new_df: pd.DataFrame = tweet_turing_ipc.ipc_table_to_df(tweet_turing_ipc.get_ipc_table(
+            tweet_turing_ipc.get_ipc_path(object_name, ipc_dir=ipc_dir, source_id=source_id),
+            {'source': source_id, 'generation': gcp_object.generation, 'size': gcp_object.size},
+            load_function
+            ))
+    elif (cache is not None):
+        gcp_object: storage.Blob = bucket.get_blob(object_name)     # metadata needed for cache key
+
+        if (gcp_object == None):
+            return None
+
+        new_df: pd.DataFrame = pd.read_parquet(cache.get_path(gcp_object), engine='pyarrow')
+        count_io(bytes_in=gcp_object.size)
+    else:
+        gcp_object: storage.Blob = get_gcp_object_as_blob(bucket=bucket, object_name=object_name)
+
+        if (gcp_object == None):
+            return None
+
+        new_df: pd.DataFrame = pd.read_parquet(gcp_object.open("rb"), engine='pyarrow')
+        count_io(bytes_in=gcp_object.size)
+
+    if parse_dates:
+        new_df = parse_date_columns(new_df)
+
+    return compact_dtypes(new_df) if compact else new_df
+
+
+############################
+#### SNAPSHOT FUNCTIONS ####
+############################
+
+def get_gcp_arrow_filesystem(key_file: str = "../key/service_acct_key.json") -> pa_fs.GcsFileSystem:
+    """Creates a pyarrow filesystem for GCP cloud storage, authenticated with the supplied service
+        account key in `key_file`. Paths on this filesystem take the form `<bucket_name>/<object_name>`.
+        Allows pyarrow to read only the needed parts of parquet files directly from a bucket."""
+    service_account = _import_optional("google.oauth2.service_account")
+    google_auth_requests = _import_optional("google.auth.transport.requests")
+
+    try:
+        credentials = service_account.Credentials.from_service_account_file(
+            key_file, scopes=["https://www.googleapis.com/auth/devstorage.read_write"])
+    except FileNotFoundError:
+        logger.exception(f"get_gcp_arrow_filesystem(): provided key_file could not be found. key_file='{key_file}'")
+        return -1
+    except ValueError:
+        logger.exception(f"get_gcp_arrow_filesystem(): provided key_file didn't use correct format. key_file='{key_file}'")
+        return -1
+
+    credentials.refresh(google_auth_requests.Request())
+
+    return pa_fs.GcsFileSystem(
+        access_token=credentials.token,
+        credential_token_expiration=credentials.expiry.replace(tzinfo=datetime.timezone.utc)    # expiry is naive UTC
+        )
+
+
+def get_publish_month(dates: pd.Series, date_format: str = None) -> pd.Series:
+    """Returns the `YYYY-MM` month of each value in `dates` as a "string" Series.
+        `dates` may already be datetimes, or strings parsed using `date_format` (inferred if None)."""
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = parse_datetime_column(dates, date_format) if (date_format is not None) \
+                    else pd.to_datetime(dates, utc=True)
+
+    return dates.dt.strftime('%Y-%m').astype('string')
+
+
+@instrumented('encode', rows=lambda result, arguments: len(arguments['df']))
+def write_parquet_snapshot(df: pd.DataFrame, root_path: str, partition_cols: list = snapshot_partition_columns,
+                            date_column: str = 'publish_date', date_format: str = None,
+                            compression: str = snapshot_compression, row_group_size: int = snapshot_row_group_size,
+                            filesystem: pa_fs.FileSystem = None, basename_template: str = 'part-{i}.parquet',
+                            existing_data_behavior: str = 'delete_matching', file_visitor = None) -> None:
+    """Writes `df` as a partitioned parquet snapshot under directory `root_path`, one directory level per
+        column in `partition_cols` (hive style, e.g. `data_source=Troll/publish_month=2016-10/`).
+        If `publish_month` is a partition column but not a column of `df`, it is derived from `date_column`.
+        Files use `compression` (zstd by default), row groups of up to `row_group_size` rows and column
+        statistics, so `read_parquet_snapshot` can skip partitions and row groups that don't match a filter.
+        To write to a GCP bucket, pass `filesystem=get_gcp_arrow_filesystem()` and `root_path='<bucket>/<prefix>'`.
+        By default, any existing partitions being written to are replaced; to append files to them instead, pass
+        `existing_data_behavior='overwrite_or_ignore'` with a unique `basename_template`.
+        `file_visitor` is called with each written file (see `pyarrow.dataset.write_dataset`).
+        The schema of the snapshot is kept in its `snapshot_schema_file`, as the union of the columns of every
+        call writing to `root_path` (e.g. troll and JSON tweets), so that readers need not open every file."""
+    if ('publish_month' in partition_cols) and ('publish_month' not in df.columns):
+        df = df.assign(publish_month=get_publish_month(df[date_column], date_format=date_format))
+
+    with measure('convert', 'write_parquet_snapshot'):
+        table: pa.Table = pa.Table.from_pandas(df, preserve_index=False)
+    parquet_format = ds.ParquetFileFormat()
+
+    written_file_sizes: list = []
+
+    def visit_file(written_file) -> None:
+        written_file_sizes.append(written_file.size)
+        if (file_visitor is not None):
+            file_visitor(written_file)
+
+    ds.write_dataset(
+        table,
+        root_path,
+        format=parquet_format,
+        partitioning=partition_cols,
+        partitioning_flavor='hive',
+        file_options=parquet_format.make_write_options(compression=compression, write_statistics=True),
+        min_rows_per_group=row_group_size,
+        max_rows_per_group=row_group_size,
+        basename_template=basename_template,
+        existing_data_behavior=existing_data_behavior,
+        file_visitor=visit_file,
+        filesystem=filesystem
+        )
+    count_io(bytes_out=sum(written_file_sizes))
+
+    schema_path: str = _get_snapshot_schema_path(root_path)
+    stored_schema: pa.Schema = _read_snapshot_schema(root_path, filesystem=filesystem)
+    schema: pa.Schema = table.schema
+    if (stored_schema is not None) and not stored_schema.remove_metadata().equals(schema.remove_metadata()):
+        # files with other columns: the pandas metadata of one write no longer describes the snapshot
+        schema = pa.unify_schemas([stored_schema, schema], promote_options='permissive').remove_metadata()
+    pq.write_metadata(schema, schema_path, filesystem=filesystem)
+
+
+def _get_snapshot_schema_path(root_path: str) -> str:
+    return f"{root_path.rstrip('/')}/{snapshot_schema_file}"
+
+
+def _read_snapshot_schema(root_path: str, filesystem: pa_fs.FileSystem = None) -> pa.Schema:
+    """Returns the schema stored by `write_parquet_snapshot` under `root_path`, or None if there is none
+        (e.g. a single parquet file, or a snapshot written by other tools)."""
+    try:
+        return pq.read_schema(_get_snapshot_schema_path(root_path), filesystem=filesystem)
+    except (OSError, pa.ArrowInvalid):
         return None
-    
-    new_df: pd.DataFrame = pd.read_parquet(gcp_object.open("rb"), engine='pyarrow')
-    
-    return new_df
+
+
+def get_parquet_snapshot_dataset(root_path: str, filesystem: pa_fs.FileSystem = None,
+                                    unify_schemas: bool = False) -> ds.Dataset:
+    """Opens a parquet snapshot written by `write_parquet_snapshot` (or a single parquet file) as a lazy
+        pyarrow Dataset. Nothing beyond the file listing and one schema is read until the dataset is scanned.
+        The schema is the one stored by `write_parquet_snapshot` (the union of the columns of every write,
+        e.g. troll and JSON tweets). Without one, it is that of the first file, unless `unify_schemas` is True:
+        then the footer of every file is read (one request per file on a bucket) and the schema is the union
+        of their columns, without the pandas metadata of any one file."""
+    schema: pa.Schema = _read_snapshot_schema(root_path, filesystem=filesystem)
+    dataset: ds.Dataset = ds.dataset(root_path, format='parquet', partitioning='hive', filesystem=filesystem,
+                                        schema=schema)
+    if (schema is not None) or not unify_schemas:
+        return dataset
+
+    schema = pa.unify_schemas(
+        [dataset.schema] + [fragment.physical_schema for fragment in dataset.get_fragments()],
+        promote_options='permissive'
+        )
+
+    return dataset if schema.equals(dataset.schema) else dataset.replace_schema(schema.remove_metadata())
+
+
+@instrumented('parse')
+def read_parquet_snapshot(root_path: str, columns: list = None, filters = None,
+                            filesystem: pa_fs.FileSystem = None, compact: bool = False,
+                            ipc_snapshot: bool = False, unify_schemas: bool = False) -> pd.DataFrame:
+    """Reads a parquet snapshot written by `write_parquet_snapshot`, locally or (with
+        `filesystem=get_gcp_arrow_filesystem()`) from a GCP bucket.
+        `columns` limits which columns are read. `filters` accepts either a pyarrow expression or a list
+        of `(column, op, value)` tuples, e.g. `[('data_source', '==', 'Troll'), ('publish_month', '>=', '2016-01')]`.
+        Only partitions and row groups which can match the filters are read.
+        If `compact` is True, column types are reduced with `compact_dtypes`.
+        If `ipc_snapshot` is True, the whole snapshot is loaded from a memory-mapped Arrow IPC copy (see
+        tweet_turing_ipc.py; next to `root_path`, or in `ipc_default_dir` for a bucket), which is (re)generated
+        whenever a file of the snapshot changes; `columns` and `filters` are then applied to the mapped table.
+        `unify_schemas` applies to snapshots without a stored schema (see `get_parquet_snapshot_dataset`),
+        and is always used when generating the IPC copy.
+        Returns a pandas DataFrame."""
+    if (filters is not None) and not isinstance(filters, ds.Expression):
+        filters = pq.filters_to_expression(filters)
+
+    if ipc_snapshot:
+        table: pa.Table = tweet_turing_ipc.get_parquet_ipc_table(root_path, filesystem=filesystem,
+                                                open_dataset=functools.partial(get_parquet_snapshot_dataset,
+                                                                                unify_schemas=True))
+        table = table.filter(filters) if (filters is not None) else table
+        df: pd.DataFrame = tweet_turing_ipc.ipc_table_to_df(table.select(columns) if (columns is not None) else table)
+
+        return compact_dtypes(df) if compact else df
+
+    dataset: ds.Dataset = get_parquet_snapshot_dataset(root_path, filesystem=filesystem, unify_schemas=unify_schemas)
+    table: pa.Table = dataset.to_table(columns=columns, filter=filters)
+
+    # list columns of JSON tweets stay Arrow-backed, as in `json_table_to_df` (their stored pandas
+    # dtype names, e.g. 'list<...>[pyarrow]', cannot be parsed back by pandas)
+    df: pd.DataFrame = table.to_pandas(types_mapper=lambda arrow_type: pd.ArrowDtype(arrow_type)
+                                        if pa.types.is_nested(arrow_type) else None)
+
+    return compact_dtypes(df) if compact else df
 
 
 #################################
@@ -403,7 +1487,7 @@ def get_post_type(tweet_series: pd.Series) -> str:
 
 
 def has_url(tweet_series: pd.Series, search_str: str = 'http') -> int:
-    """Looks for the text `http` in a tweet's content as a means of determining 
+    """Looks for the text `http` in a tweet's content as a means of determining
         whether it contains a URL."""
     if (tweet_series['content'] is not None):
         return int(search_str in tweet_series['content'])
@@ -411,20 +1495,68 @@ def has_url(tweet_series: pd.Series, search_str: str = 'http') -> int:
         return 0
 
 
+def _get_column(data, column_name: str) -> pd.Series:
+    """Returns `data[column_name]` if `data` is a DataFrame, otherwise assumes `data` is already the column."""
+    if isinstance(data, pd.DataFrame):
+        return data[column_name]
+
+    return pd.Series(data) if not isinstance(data, pd.Series) else data
+
+
+@instrumented('feature')
+def get_post_type_column(data) -> pd.Series:
+    """Column-level version of `get_post_type`. Accepts a DataFrame (or its `referenced_tweets` column)
+        and extracts the type of each tweet's first referenced tweet in a single pass over the column.
+        Missing values yield None, as in `get_post_type`. Returns a Series aligned to the input."""
+    ref_col: pd.Series = _get_column(data, 'referenced_tweets')
+
+    # Arrow-backed list<struct> columns (e.g. from `pd.read_parquet(dtype_backend='pyarrow')`) stay in Arrow
+    if isinstance(ref_col.dtype, pd.ArrowDtype):
+        first_ref = pc.list_element(pa.array(ref_col.array), 0)
+        post_types: list = pc.struct_field(first_ref, 'type').to_pylist()
+    else:
+        post_types = [
+            None if ((ref_twt is None) or (ref_twt is pd.NA) or (isinstance(ref_twt, float) and np.isnan(ref_twt)))
+            else ref_twt[0]['type']
+            for ref_twt in ref_col.to_numpy(dtype=object)
+        ]
+
+    return pd.Series(post_types, index=ref_col.index)
+
+
+@instrumented('feature')
+def is_retweet_column(data) -> pd.Series:
+    """Column-level version of `is_retweet`. Accepts a DataFrame (or its `referenced_tweets` column).
+        Returns an int64 Series of 1 (retweet or quote tweet) / 0 (otherwise).
+        Unlike `is_retweet`, missing `referenced_tweets` values yield 0 rather than raising an error."""
+    post_types: pd.Series = get_post_type_column(data)
+
+    return post_types.isin(['retweeted', 'quoted']).astype('int64')
+
+
+@instrumented('feature')
+def has_url_column(data, search_str: str = 'http') -> pd.Series:
+    """Column-level version of `has_url`. Accepts a DataFrame (or its `content` column) and uses a
+        vectorized substring search. Returns an int64 Series of 1 / 0; missing content yields 0."""
+    content: pd.Series = _get_column(data, 'content')
+
+    return content.str.contains(search_str, regex=False, na=False).astype('int64').rename(None)
+
+
 def convert_emoji_list(tweet_series: pd.Series) -> list:
     ''' The following converts a text string with emojis into a list of descriptive text strings.
         Duplicate emojis are captured as each emoji converts to 1 text string.'''
-    return demoji.findall_list(tweet_series['content'])
+    return _import_optional("demoji").findall_list(tweet_series['content'])
 
 
 def convert_emoji_text(tweet_series: pd.Series, enclosing_char: str = '') -> str:
     ''' The following converts an emoji in a text string to a str '''
-    return demoji.replace_with_desc(tweet_series['content'], enclosing_char)
+    return _import_optional("demoji").replace_with_desc(tweet_series['content'], enclosing_char)
 
 
 def remove_emoji_text(tweet_series: pd.Series) -> str:
     ''' The following removes emoji from a string. '''
-    return demoji.replace(tweet_series['content'], "")
+    return _import_optional("demoji").replace(tweet_series['content'], "")
 
 
 def emoji_count(tweet_series: pd.Series) -> int:
@@ -432,6 +1564,153 @@ def emoji_count(tweet_series: pd.Series) -> int:
     return len(tweet_series['emoji_text'])
 
 
+def _emoji_trie_to_regex(trie_node: dict) -> str:
+    """Converts a trie of emoji codepoints (nested dicts, `""` key marking the end of an emoji)
+        into a regex pattern string. Single-codepoint leaves are grouped into a character class.
+        Optional groups are greedy, so the pattern always prefers the longest emoji sequence,
+        the same behavior as demoji's longest-first alternation."""
+    is_terminal: bool = "" in trie_node
+    leaf_chars: list = []
+    branches: list = []
+
+    for char in sorted(c for c in trie_node if c != ""):
+        child: dict = trie_node[char]
+        if (list(child) == [""]):
+            leaf_chars.append(re.escape(char))
+        else:
+            branches.append(re.escape(char) + _emoji_trie_to_regex(child))
+
+    if (len(leaf_chars) == 1):
+        branches.append(leaf_chars[0])
+    elif (len(leaf_chars) > 1):
+        branches.append("[" + "".join(leaf_chars) + "]")
+
+    if (len(branches) == 0):
+        return ""
+
+    if (len(branches) == 1) and not is_terminal:
+        return branches[0]
+
+    return "(?:" + "|".join(branches) + ")" + ("?" if is_terminal else "")
+
+
+@functools.lru_cache(maxsize=None)
+def get_emoji_engine() -> tuple:
+    """Builds (once) the compiled emoji trie pattern, a cheap character-class pattern matching
+        every character an emoji can start with, and the emoji -> description mapping,
+        all derived from demoji's bundled emoji codes."""
+    demoji = _import_optional("demoji")
+    code_to_desc: dict = demoji._CODE_TO_DESC
+    if not code_to_desc:
+        demoji.set_emoji_pattern()      # older demoji versions load codes on demand
+        code_to_desc = demoji._CODE_TO_DESC
+
+    trie: dict = {}
+    for code in code_to_desc:
+        node: dict = trie
+        for char in code:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    # most first characters are above U+2000 and can be covered by one range; checking a
+    #   short class is far cheaper than trying the full trie at every position of a tweet
+    low_first_chars: list = sorted(c for c in trie if (ord(c) < 0x2000))
+    high_first_char: str = min(c for c in trie if (ord(c) >= 0x2000))
+    candidate_class: str = "[" + "".join(re.escape(c) for c in low_first_chars) \
+        + re.escape(high_first_char) + "-\U0010ffff]"
+
+    return (re.compile(_emoji_trie_to_regex(trie)), re.compile(candidate_class), code_to_desc)
+
+
+def _iter_emoji_matches(text: str, emoji_pattern: re.Pattern, candidate_pattern: re.Pattern):
+    """Yields (start, end, emoji) for each emoji in `text`, left to right and non-overlapping,
+        only attempting a trie match at positions where an emoji could start."""
+    candidate = candidate_pattern.search(text)
+
+    while (candidate is not None):
+        start: int = candidate.start()
+        match = emoji_pattern.match(text, start)
+
+        if (match is not None):
+            yield (start, match.end(), match.group())
+            candidate = candidate_pattern.search(text, match.end())
+        else:
+            candidate = candidate_pattern.search(text, start + 1)
+
+
+#   variation selectors stripped from replaced text (as demoji does)
+_EMOJI_VARIATION_SELECTORS: dict = str.maketrans("", "", "\ufe0e\ufe0f")
+
+
+def scan_emoji(text: str, enclosing_char: str, emoji_pattern: re.Pattern, candidate_pattern: re.Pattern,
+                code_to_desc: dict) -> tuple:
+    """Scans one tweet's text for emoji (see `extract_emoji_features`). Returns a tuple of
+        (list of emoji descriptions, text with emoji replaced by descriptions, text with emoji removed)."""
+    descriptions: list = []
+    demoji_parts: list = []
+    no_emoji_parts: list = []
+    last_end: int = 0
+
+    # single pass over the text, building all outputs from the match positions
+    for (start, end, emoji) in _iter_emoji_matches(text, emoji_pattern, candidate_pattern):
+        description: str = code_to_desc[emoji]
+        descriptions.append(description)
+        demoji_parts.extend([text[last_end:start], enclosing_char, description, enclosing_char])
+        no_emoji_parts.append(text[last_end:start])
+        last_end = end
+
+    if (len(descriptions) == 0):
+        no_emoji_text: str = text.translate(_EMOJI_VARIATION_SELECTORS)
+        return (descriptions, no_emoji_text, no_emoji_text)
+
+    demoji_parts.append(text[last_end:])
+    no_emoji_parts.append(text[last_end:])
+
+    return (descriptions, "".join(demoji_parts).translate(_EMOJI_VARIATION_SELECTORS),
+            "".join(no_emoji_parts).translate(_EMOJI_VARIATION_SELECTORS))
+
+
+@instrumented('feature')
+def extract_emoji_features(data, enclosing_char: str = '') -> pd.DataFrame:
+    """Batched, single-pass alternative to applying `convert_emoji_list`, `convert_emoji_text`,
+        `remove_emoji_text` and `emoji_count` separately. Accepts a DataFrame (or its `content` column)
+        and scans each tweet once with a precompiled emoji trie pattern.
+        Output matches demoji, except `content_demoji` for tweets containing both an emoji and a longer
+        sequence built from it (e.g. a ZWJ sequence): demoji's sequential `str.replace` can then split the
+        longer sequence, depending on set ordering, whereas this always substitutes the longest match.
+        Returns a DataFrame aligned to the input with columns:
+          - `emoji_text`: list of emoji descriptions (as `convert_emoji_list`)
+          - `content_demoji`: content with emoji replaced by descriptions (as `convert_emoji_text`)
+          - `content_no_emoji`: content with emoji removed (as `remove_emoji_text`)
+          - `emoji_count`: number of emoji (as `emoji_count`)
+        Missing content yields an empty list, None texts and a count of 0."""
+    content: pd.Series = _get_column(data, 'content')
+    emoji_pattern, candidate_pattern, code_to_desc = get_emoji_engine()
+
+    n_rows: int = len(content)
+    emoji_lists: list = [None] * n_rows
+    demoji_texts: list = [None] * n_rows
+    no_emoji_texts: list = [None] * n_rows
+    emoji_counts = np.zeros(n_rows, dtype='int64')
+
+    for (i, text) in enumerate(content.to_numpy(dtype=object)):
+        if not isinstance(text, str):
+            emoji_lists[i] = []
+            continue
+
+        emoji_lists[i], demoji_texts[i], no_emoji_texts[i] = scan_emoji(
+            text, enclosing_char, emoji_pattern, candidate_pattern, code_to_desc
+            )
+        emoji_counts[i] = len(emoji_lists[i])
+
+    return pd.DataFrame({
+        'emoji_text': emoji_lists,
+        'content_demoji': demoji_texts,
+        'content_no_emoji': no_emoji_texts,
+        'emoji_count': emoji_counts
+        }, index=content.index)
+
+
 def capture_emojis_list(series_emojis):
     """Extracts lists from a series of lists."""
     t=[]
@@ -442,7 +1721,7 @@ def capture_emojis_list(series_emojis):
 
 
 def flatten_emoji_list(_2d_list):
-    """This function takes a nested list of emoji text 
+    """This function takes a nested list of emoji text
         and flattens the list for a dataframe"""
     flat_list = []
     for element in _2d_list:
@@ -458,9 +1737,101 @@ def flatten_emoji_list(_2d_list):
 
 def print_emoji_top_10(emoji_flat_list):
     ''' This function takes a flattened list of emoji text and plot the value counts as a bar chart'''
-    flat_array = np.array((emoji_flat_list), dtype=object)
-    return pd.value_counts(flat_array).nlargest(10).plot(kind='barh',title='top 10 most frequently used emojis')
-    
+    return plot_top_emoji(tweet_turing_counters.ExactCounter().update(emoji_flat_list).top(10, item_name='emoji'))
+
+
+def _count_emoji_chunk(data) -> dict:
+    """Exact emoji counts (description -> count) of one chunk: a DataFrame with an `emoji_text` column
+        (lists of descriptions, see `extract_emoji_features`) or else a `content` column, or either column
+        on its own (a Series or Arrow array). List columns stored in Arrow are counted without leaving Arrow."""
+    if isinstance(data, (pa.Table, pa.RecordBatch)):
+        column_name: str = 'emoji_text' if ('emoji_text' in data.schema.names) else 'content'
+        column = data.column(column_name)
+    elif isinstance(data, pd.DataFrame):
+        column = data['emoji_text'] if ('emoji_text' in data.columns) else data['content']
+    else:
+        column = data
+
+    if isinstance(column, pd.Series) and isinstance(column.dtype, pd.ArrowDtype):
+        column = pa.array(column.array)
+
+    if isinstance(column, (pa.Array, pa.ChunkedArray)):
+        if pa.types.is_list(column.type) or pa.types.is_large_list(column.type):
+            value_counts: pa.StructArray = pc.value_counts(pc.list_flatten(column))
+            return dict(zip(value_counts.field('values').to_pylist(), value_counts.field('counts').to_pylist()))
+        column = column.to_pandas()
+
+    values: np.ndarray = column.to_numpy(dtype=object)
+    if not any(isinstance(value, str) for value in values):
+        # lists (or numpy arrays, as read back from parquet) of emoji descriptions
+        return collections.Counter(itertools.chain.from_iterable(value for value in values
+                                                                    if isinstance(value, (list, tuple, np.ndarray))))
+
+    # tweet text: match emoji directly, without building per-tweet lists
+    emoji_pattern, candidate_pattern, code_to_desc = get_emoji_engine()
+    counts: collections.Counter = collections.Counter()
+    for text in values:
+        if isinstance(text, str):
+            counts.update(code_to_desc[emoji] for (_, _, emoji) in _iter_emoji_matches(text, emoji_pattern,
+                                                                                        candidate_pattern))
+
+    return counts
+
+
+@instrumented('feature', rows=None)
+def count_emoji(data, capacity: int = None, chunk_size: int = emoji_count_chunk_size, counter = None):
+    """Streaming replacement for `capture_emojis_list` + `flatten_emoji_list` + value counts. Counts emoji
+        descriptions over `data` (see `_count_emoji_chunk` for the accepted inputs, including `content` text)
+        `chunk_size` rows at a time, or over an iterable of such chunks (e.g. record batches).
+        Counts are exact if `capacity` is None; otherwise at most `capacity` emoji are kept, with approximate
+        counts (see tweet_turing_counters.py). Counts are added to `counter` if one is provided.
+        Counters from separate partitions or workers can be combined with `counter.merge(other)`.
+        Returns the counter; see `get_top_emoji` for a DataFrame of the most frequent emoji."""
+    counter = tweet_turing_counters.make_counter(capacity) if (counter is None) else counter
+
+    if isinstance(data, (pd.DataFrame, pd.Series)):
+        chunks = (data.iloc[offset:(offset + chunk_size)] for offset in range(0, len(data), chunk_size))
+    elif isinstance(data, (pa.Table, pa.Array, pa.ChunkedArray)):
+        chunks = (data.slice(offset, chunk_size) for offset in range(0, len(data), chunk_size))
+    else:
+        chunks = data
+
+    for chunk in chunks:
+        counter.add_counts(_count_emoji_chunk(chunk))
+        count_io(rows=len(chunk))
+
+    return counter
+
+
+def count_snapshot_emoji(root_path: str, capacity: int = None, filters = None,
+                            filesystem: pa_fs.FileSystem = None, batch_size: int = emoji_count_chunk_size):
+    """Counts emoji (see `count_emoji`) over a parquet snapshot written by `write_parquet_snapshot`, reading
+        only the `emoji_text` column if the snapshot has one, or else `content`, one record batch at a time.
+        `filters` selects rows as in `read_parquet_snapshot`. Returns the counter."""
+    if (filters is not None) and not isinstance(filters, ds.Expression):
+        filters = pq.filters_to_expression(filters)
+
+    dataset: ds.Dataset = get_parquet_snapshot_dataset(root_path, filesystem=filesystem)
+    column_name: str = 'emoji_text' if ('emoji_text' in dataset.schema.names) else 'content'
+    batches = dataset.to_batches(columns=[column_name], filter=filters, batch_size=batch_size)
+
+    return count_emoji(batches, capacity=capacity)
+
+
+def get_top_emoji(data, n: int = 10, capacity: int = None) -> pd.DataFrame:
+    """Returns the `n` most frequent emoji as a DataFrame with columns `emoji` (description), `count`,
+        `error` (0 when counts are exact) and `share` (of all emoji counted). `data` is either a counter
+        returned by `count_emoji` / `count_snapshot_emoji`, or data to count with `count_emoji`."""
+    counter = data if hasattr(data, 'top') else count_emoji(data, capacity=capacity)
+
+    return counter.top(n, item_name='emoji')
+
+
+def plot_top_emoji(top_emoji_df: pd.DataFrame, title: str = 'top 10 most frequently used emojis'):
+    """Plots the output of `get_top_emoji` as a horizontal bar chart (most frequent first, as in
+        `print_emoji_top_10`). Returns the matplotlib Axes."""
+    return top_emoji_df.set_index('emoji')['count'].plot(kind='barh', title=title)
+
 
 if __name__ == '__main__':
     pass
\ No newline at end of file
@@ -0,0 +1,826 @@
+# tweet_turing_bench.py
+#   Reproducible benchmarks for the loaders and feature functions in tweet_turing.py
+#   and twittertext.py, run against a deterministic synthetic tweet corpus.
+#
+#   Example (from the `src` directory):
+#       python tweet_turing_bench.py --sizes 1000 10000 --output bench_results.json
+#
+#   Each benchmark case runs in a fresh process so that its peak resident memory (RSS)
+#   can be measured independently of the other cases. Results are written as JSON so
+#   that runs can be compared against each other.
+#
+#   JSON decoding backends (see tweet_turing_json.py) are compared per 100k tweets with:
+#       python tweet_turing_bench.py --sizes 100000 --benchmarks load_json_json load_json_orjson load_json_typed_records
+#
+#   Reloading a parquet file through its memory-mapped Arrow IPC copy (see tweet_turing_ipc.py) is compared with:
+#       python tweet_turing_bench.py --sizes 100000 --benchmarks load_parquet load_parquet_ipc
+#
+#   The fused text feature extractor (see tweet_turing_features.py) is compared with the separate passes it replaces:
+#       python tweet_turing_bench.py --sizes 100000 --benchmarks text_features_separate text_features_fused
+#
+#   Streaming stratified sampling (see tweet_turing_sampling.py) is compared with loading everything first with:
+#       python tweet_turing_bench.py --sizes 100000 --benchmarks merge_csv_then_sample sample_csv_files
+#
+#   Also includes an import-time regression check for tweet_turing.py:
+#       python tweet_turing_bench.py --check-import-time
+#
+#   and a check of the concurrent GCP download path (ordering, retries and failures) against a stub bucket:
+#       python tweet_turing_bench.py --check-gcp-fetch
+#
+#   and a check that the feature pipeline combines chunks whose inferred column types differ:
+#       python tweet_turing_bench.py --check-pipeline
+#
+
+# imports from Python standard library
+import argparse
+import csv
+import datetime
+import functools
+import gc
+import io
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+# imports requiring installation
+import pandas as pd                         # pip install pandas
+from tweet_counter import find_urls         # installed for twittertext.py
+
+# imports from tweet_turing.py, its helper modules and twittertext.py
+import tweet_turing as tur
+import tweet_turing_features
+import tweet_turing_json
+import tweet_turing_pipeline
+import tweet_turing_sampling
+import twittertext
+
+
+# module-level definitions
+default_sizes: list = [1_000, 10_000]
+default_seed: int = 42
+files_per_corpus: int = 4
+
+#   tweets per `account_category` drawn by the sampling benchmarks
+sample_size_per_stratum: int = 100
+
+#   `import tweet_turing` must stay under this time, and must not eagerly import these modules
+import_time_budget_seconds: float = 0.75
+lazily_imported_modules: list = ["google.cloud.storage", "google.oauth2", "google.api_core", "demoji",
+                                    "pyarrow.csv", "pyarrow.dataset", "pyarrow.fs", "pyarrow.parquet",
+                                    "tweet_turing_cache", "tweet_turing_counters", "tweet_turing_dedup",
+                                    "tweet_turing_ipc", "tweet_turing_json"]
+
+
+##################################
+#### SYNTHETIC DATA GENERATOR ####
+##################################
+
+#   building blocks for synthetic tweet text
+_WORDS: list = ("the news today about election vote people america police world media "
+                "fake story breaking watch video must read great trump clinton russia "
+                "tax health school war city state report live update").split()
+_EMOJI: list = ["😂", "❤️", "🔥", "👍", "🇺🇸", "🚨", "✅", "‼️", "✊", "💥", "🚫", "😭",
+                "😍", "👏", "😘", "🎉", "🙌", "👍🏽", "🙋🏻‍♀️", "#️⃣"]
+_DOMAINS: list = ["cnn.com", "foxnews.com", "bbc.co.uk", "rt.com", "nytimes.com", "youtube.com",
+                    "news.yahoo.com", "breitbart.com", "theguardian.com", "t.co"]
+_HANDLES: list = [f"user_{i}" for i in range(500)]
+_REGIONS: list = ["United States", "Unknown", "Russian Federation", "United Kingdom", "Germany"]
+_LANGUAGES: list = ["English", "Russian", "German", "Ukrainian", "Italian"]
+_ACCOUNT_CATEGORIES: list = ["RightTroll", "LeftTroll", "NewsFeed", "HashtagGamer", "Fearmonger", "NonEnglish"]
+_ACCOUNT_TYPES: list = ["Right", "Left", "local", "Hashtager", "Russian", "Koch"]
+_POST_TYPES: list = ["RETWEET", "QUOTE_TWEET", ""]
+
+
+def generate_tweet_text(rng: random.Random) -> str:
+    """Generates one synthetic tweet, sometimes prefixed with `RT @handle:` or `@handle`
+        and sometimes containing emoji, hashtags and URLs."""
+    parts: list = [rng.choice(_WORDS) for _ in range(rng.randint(3, 20))]
+
+    if (rng.random() < 0.3):
+        parts.insert(rng.randrange(len(parts) + 1), f"#{rng.choice(_WORDS)}")
+    if (rng.random() < 0.25):
+        for _ in range(rng.randint(1, 3)):
+            parts.insert(rng.randrange(len(parts) + 1), rng.choice(_EMOJI))
+    if (rng.random() < 0.4):
+        parts.append(f"https://{rng.choice(_DOMAINS)}/{rng.randrange(10 ** 6):x}")
+
+    prefix_roll: float = rng.random()
+    if (prefix_roll < 0.3):
+        parts.insert(0, f"RT @{rng.choice(_HANDLES)}:")
+    elif (prefix_roll < 0.4):
+        parts.insert(0, f"@{rng.choice(_HANDLES)}")
+
+    return " ".join(parts)
+
+
+def generate_troll_rows(n_rows: int, seed: int = default_seed) -> list:
+    """Generates synthetic rows (dicts) using the troll CSV schema in `csv_column_dtype_mapping`."""
+    rng = random.Random(seed)
+    rows: list = []
+
+    for _ in range(n_rows):
+        publish_date: str = f"{rng.randint(1, 12)}/{rng.randint(1, 28)}/{rng.randint(2015, 2017)} " \
+                            f"{rng.randint(0, 23)}:{rng.randint(0, 59):02d}"
+        rows.append({
+            "external_author_id": str(rng.randrange(10 ** 17, 10 ** 18)),
+            "author": rng.choice(_HANDLES).upper(),
+            "content": generate_tweet_text(rng),
+            "region": rng.choice(_REGIONS),
+            "language": rng.choice(_LANGUAGES),
+            "publish_date": publish_date,
+            "harvested_date": publish_date,
+            "following": rng.randrange(10_000),
+            "followers": rng.randrange(100_000),
+            "updates": rng.randrange(50_000),
+            "post_type": rng.choice(_POST_TYPES),
+            "account_type": rng.choice(_ACCOUNT_TYPES),
+            "retweet": rng.randint(0, 1),
+            "account_category": rng.choice(_ACCOUNT_CATEGORIES),
+            "new_june_2018": rng.randint(0, 1),
+            "alt_external_id": str(rng.randrange(10 ** 9)),
+            "tweet_id": str(rng.randrange(10 ** 17, 10 ** 18)),
+            "article_url": f"http://twitter.com/{rng.choice(_HANDLES)}/statuses/{rng.randrange(10 ** 17)}",
+            "tco1_step1": f"https://{rng.choice(_DOMAINS)}/" if (rng.random() < 0.5) else "",
+            "tco2_step1": "",
+            "tco3_step1": ""
+        })
+
+    return rows
+
+
+def generate_authentic_tweets(n_tweets: int, seed: int = default_seed) -> list:
+    """Generates synthetic nested tweet dicts in the Twitter API v2 shape which, once flattened
+        with `pd.json_normalize`, yields the columns in `authentic_df_eda_dtype_mapping`."""
+    rng = random.Random(seed)
+    tweets: list = []
+
+    for _ in range(n_tweets):
+        text: str = generate_tweet_text(rng)
+        author_id: str = str(rng.randrange(10 ** 6, 10 ** 18))
+        created_at: str = f"2022-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}T" \
+                            f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:{rng.randint(0, 59):02d}.000Z"
+        url: str = f"https://{rng.choice(_DOMAINS)}/{rng.randrange(10 ** 6):x}"
+
+        tweet: dict = {
+            "author_id": author_id,
+            "created_at": created_at,
+            "id": str(rng.randrange(10 ** 18, 2 * 10 ** 18)),
+            "text": text,
+            "lang": rng.choice(["en", "en", "en", "es", "ru"]),
+            "public_metrics": {
+                "retweet_count": rng.randrange(1_000),
+                "reply_count": rng.randrange(100),
+                "like_count": rng.randrange(5_000),
+                "quote_count": rng.randrange(50)
+            },
+            "author": {
+                "location": rng.choice(["Washington, DC", "New York", "London"]),
+                "name": rng.choice(_HANDLES).title(),
+                "username": rng.choice(_HANDLES),
+                "public_metrics": {
+                    "followers_count": rng.randrange(10 ** 7),
+                    "following_count": rng.randrange(10_000)
+                },
+                "entities": {"url": {"urls": [{"start": 0, "end": 23, "url": "https://t.co/abc",
+                                                "expanded_url": url, "display_url": url[8:]}]}},
+                "created_at": "2010-06-01T00:00:00.000Z",
+                "verified": rng.random() < 0.5
+            },
+            "context_annotations": [{
+                "domain": {"id": "10", "name": "Person", "description": "Named people in the world"},
+                "entity": {"id": str(rng.randrange(10 ** 6)), "name": rng.choice(_WORDS).title()}
+            }],
+            "entities": {
+                "annotations": [{"start": 0, "end": 5, "probability": 0.9, "type": "Place",
+                                    "normalized_text": rng.choice(_WORDS)}],
+                "mentions": [{"start": 3, "end": 12, "username": rng.choice(_HANDLES), "id": author_id}],
+                "hashtags": [{"start": 0, "end": 5, "tag": rng.choice(_WORDS)}],
+                "urls": [{"start": 0, "end": 23, "url": "https://t.co/abc", "expanded_url": url,
+                            "display_url": url[8:], "unwound_url": None}]
+            }
+        }
+
+        if text.startswith("RT @"):
+            tweet["referenced_tweets"] = [{"type": "retweeted", "id": str(rng.randrange(10 ** 18))}]
+        elif (rng.random() < 0.2):
+            tweet["referenced_tweets"] = [{"type": rng.choice(["quoted", "replied_to"]),
+                                            "id": str(rng.randrange(10 ** 18))}]
+
+        tweets.append(tweet)
+
+    return tweets
+
+
+def write_troll_csv_files(output_dir: str, n_rows: int, n_files: int = files_per_corpus,
+                            seed: int = default_seed) -> list:
+    """Writes `n_rows` synthetic troll tweets split across `n_files` CSV files. Returns the file paths."""
+    rows: list = generate_troll_rows(n_rows, seed=seed)
+    file_paths: list = []
+
+    for i in range(n_files):
+        file_path: str = os.path.join(output_dir, f"troll_{i:02d}.csv")
+        with open(file_path, mode="w", encoding="utf-8", newline="") as fh:
+            writer = csv.DictWriter(fh, fieldnames=list(tur.csv_column_dtype_mapping))
+            writer.writeheader()
+            writer.writerows(rows[i::n_files])
+        file_paths.append(file_path)
+
+    return file_paths
+
+
+def write_authentic_json_files(output_dir: str, n_tweets: int, n_files: int = files_per_corpus,
+                                seed: int = default_seed) -> list:
+    """Writes `n_tweets` synthetic authentic tweets split across `n_files` JSON files. Returns the file paths."""
+    tweets: list = generate_authentic_tweets(n_tweets, seed=seed)
+    file_paths: list = []
+
+    for i in range(n_files):
+        file_path: str = os.path.join(output_dir, f"tweets_{i:02d}.json")
+        with open(file_path, mode="w", encoding="utf-8") as fh:
+            json.dump(tweets[i::n_files], fh)
+        file_paths.append(file_path)
+
+    return file_paths
+
+
+def write_corpus(output_dir: str, size: int, seed: int = default_seed) -> dict:
+    """Writes a complete synthetic corpus of `size` troll and `size` authentic tweets into `output_dir`.
+        Returns a dict describing the corpus, as expected by the benchmark functions."""
+    os.makedirs(output_dir, exist_ok=True)
+
+    return {
+        "size": size,
+        "dir": output_dir,
+        "csv_files": write_troll_csv_files(output_dir, size, seed=seed),
+        "json_files": write_authentic_json_files(output_dir, size, seed=seed + 1)
+    }
+
+
+####################
+#### BENCHMARKS ####
+####################
+
+def _prepare_files(corpus: dict) -> dict:
+    """Benchmarks reading the corpus files need no preparation."""
+    return corpus
+
+
+def _prepare_content_df(corpus: dict) -> pd.DataFrame:
+    """Loads the troll CSVs (untimed) for benchmarks that operate on a `content` column."""
+    return tur.merge_csv_files(corpus["csv_files"]).reset_index(drop=True)
+
+
+def _prepare_parquet_file(corpus: dict, ipc_snapshot: bool = False) -> str:
+    """Writes the troll CSVs as a parquet file (untimed) for benchmarks that reload it. With `ipc_snapshot`,
+        its Arrow IPC copy is generated too, so that the benchmark measures reloading an unchanged file."""
+    parquet_path: str = os.path.join(corpus["dir"], "reload.parquet")
+    _prepare_content_df(corpus).to_parquet(parquet_path, engine="pyarrow", index=False)
+
+    if ipc_snapshot:
+        tur.load_local_json_parquet(parquet_path, ipc_snapshot=True)
+
+    return parquet_path
+
+
+def _bench_merge_json_files(corpus: dict) -> int:
+    return len(tur.merge_json_files(corpus["json_files"]))
+
+
+def _bench_load_json(corpus: dict, json_backend: str = None, record_class: type = None) -> int:
+    return len(tur.merge_json_files(corpus["json_files"], json_backend=json_backend, record_class=record_class))
+
+
+def _bench_merge_json_files_streaming(corpus: dict) -> int:
+    return tur.merge_json_files_streaming(corpus["json_files"], os.path.join(corpus["dir"], "streamed.parquet"))
+
+
+def _bench_json_normalize(corpus: dict) -> int:
+    return len(pd.json_normalize(tur.merge_json_files(corpus["json_files"])))
+
+
+def _bench_read_json_files_as_table(corpus: dict) -> int:
+    return len(tur.json_table_to_df(tur.read_json_files_as_table(corpus["json_files"])))
+
+
+def _bench_merge_csv_files(corpus: dict) -> int:
+    return len(tur.merge_csv_files(corpus["csv_files"]))
+
+
+def _bench_read_csv_dataset(corpus: dict) -> int:
+    return len(tur.read_csv_dataset(corpus["csv_files"]))
+
+
+def _bench_parquet_round_trip(df: pd.DataFrame) -> int:
+    with tempfile.TemporaryDirectory() as temp_dir:
+        parquet_path: str = os.path.join(temp_dir, "round_trip.parquet")
+        df.to_parquet(parquet_path, engine="pyarrow", index=False)
+        return len(tur.load_local_json_parquet(parquet_path))
+
+
+def _bench_load_parquet(parquet_path: str, ipc_snapshot: bool = False) -> int:
+    return len(tur.load_local_json_parquet(parquet_path, ipc_snapshot=ipc_snapshot))
+
+
+def _bench_char_count(df: pd.DataFrame) -> int:
+    return len(df.apply(twittertext.char_count, axis="columns"))
+
+
+def _bench_char_count_column(df: pd.DataFrame) -> int:
+    return len(twittertext.char_count_column(df))
+
+
+def _bench_reply_handle(df: pd.DataFrame) -> int:
+    return len(df.apply(twittertext.reply_handle, axis="columns"))
+
+
+def _bench_reply_handle_column(df: pd.DataFrame) -> int:
+    return len(twittertext.reply_handle_column(df))
+
+
+def _bench_retweet_handle_column(df: pd.DataFrame) -> int:
+    return len(twittertext.retweet_handle_column(df))
+
+
+def _bench_explode_url(df: pd.DataFrame) -> int:
+    urls: pd.Series = df["tco1_step1"].dropna()
+    return len(urls.apply(twittertext.explode_url))
+
+
+def _bench_explode_url_column(df: pd.DataFrame) -> int:
+    return len(twittertext.explode_url_column(df["tco1_step1"]))
+
+
+def _bench_emoji_functions(df: pd.DataFrame) -> int:
+    df = df.assign(emoji_text=df.apply(tur.convert_emoji_list, axis="columns"))
+    df.apply(tur.convert_emoji_text, axis="columns")
+    df.apply(tur.remove_emoji_text, axis="columns")
+    return len(df.apply(tur.emoji_count, axis="columns"))
+
+
+def _bench_extract_emoji_features(df: pd.DataFrame) -> int:
+    return len(tur.extract_emoji_features(df))
+
+
+def _bench_text_features_separate(df: pd.DataFrame) -> int:
+    # one pass over `content` per feature, as `extract_text_features` replaces
+    tur.has_url_column(df)
+    tur.extract_emoji_features(df)
+    twittertext.reply_handle_column(df)
+    twittertext.retweet_handle_column(df)
+    twittertext.char_count_column(df)
+    return len(df["content"].map(find_urls))
+
+
+def _bench_text_features_fused(df: pd.DataFrame) -> int:
+    return len(tweet_turing_features.extract_text_features(df))
+
+
+def _bench_merge_csv_then_sample(corpus: dict) -> int:
+    # loading the full corpus, then sampling in memory; shuffling before taking the head of each group
+    # keeps strata smaller than `sample_size_per_stratum` whole, where `.sample(n=...)` would raise
+    troll_df: pd.DataFrame = tur.merge_csv_files(corpus["csv_files"])
+    sample_df: pd.DataFrame = troll_df.sample(frac=1, random_state=default_seed) \
+                                .groupby("account_category", observed=True).head(sample_size_per_stratum)
+    return len(sample_df[["tweet_id", "content", "account_category"]])
+
+
+def _bench_sample_csv_files(corpus: dict) -> int:
+    return len(tweet_turing_sampling.sample_csv_files(
+        corpus["csv_files"], ["account_category"], sample_size_per_stratum,
+        columns=["tweet_id", "content", "account_category"], chunk_size=10_000
+        ))
+
+
+def _bench_to_datetime(df: pd.DataFrame) -> int:
+    # post-hoc conversion as previously done in the notebooks, with the format inferred
+    for col in ["publish_date", "harvested_date"]:
+        pd.to_datetime(df[col], utc=True)
+    return len(df)
+
+
+def _bench_parse_date_columns(df: pd.DataFrame) -> int:
+    return len(tur.parse_date_columns(df))
+
+
+#   name -> (untimed preparation function, timed benchmark function returning rows processed)
+BENCHMARKS: dict = {
+    "merge_json_files": (_prepare_files, _bench_merge_json_files),
+    "merge_json_files_streaming": (_prepare_files, _bench_merge_json_files_streaming),
+    **{f"load_json_{backend}": (_prepare_files, functools.partial(_bench_load_json, json_backend=backend))
+        for backend in tweet_turing_json.available_json_backends()},
+    "load_json_typed_records": (_prepare_files, functools.partial(_bench_load_json, record_class=tur.TweetRecord)),
+    "json_normalize": (_prepare_files, _bench_json_normalize),
+    "read_json_files_as_table": (_prepare_files, _bench_read_json_files_as_table),
+    "merge_csv_files": (_prepare_files, _bench_merge_csv_files),
+    "read_csv_dataset": (_prepare_files, _bench_read_csv_dataset),
+    "parquet_round_trip": (_prepare_content_df, _bench_parquet_round_trip),
+    "load_parquet": (_prepare_parquet_file, _bench_load_parquet),
+    "load_parquet_ipc": (functools.partial(_prepare_parquet_file, ipc_snapshot=True),
+                            functools.partial(_bench_load_parquet, ipc_snapshot=True)),
+    "char_count": (_prepare_content_df, _bench_char_count),
+    "char_count_column": (_prepare_content_df, _bench_char_count_column),
+    "reply_handle": (_prepare_content_df, _bench_reply_handle),
+    "reply_handle_column": (_prepare_content_df, _bench_reply_handle_column),
+    "retweet_handle_column": (_prepare_content_df, _bench_retweet_handle_column),
+    "explode_url": (_prepare_content_df, _bench_explode_url),
+    "explode_url_column": (_prepare_content_df, _bench_explode_url_column),
+    "emoji_functions": (_prepare_content_df, _bench_emoji_functions),
+    "extract_emoji_features": (_prepare_content_df, _bench_extract_emoji_features),
+    "text_features_separate": (_prepare_content_df, _bench_text_features_separate),
+    "text_features_fused": (_prepare_content_df, _bench_text_features_fused),
+    "merge_csv_then_sample": (_prepare_files, _bench_merge_csv_then_sample),
+    "sample_csv_files": (_prepare_files, _bench_sample_csv_files),
+    "to_datetime": (_prepare_content_df, _bench_to_datetime),
+    "parse_date_columns": (_prepare_content_df, _bench_parse_date_columns),
+}
+
+
+#########################
+#### GCP FETCH CHECK ####
+#########################
+
+class _StubBlob:
+    """Stands in for a `storage.Blob` of a `_StubBucket` (as used by `tweet_turing.get_gcp_object_as_text`
+        and `get_gcp_object_as_csv_df`)."""
+
+    def __init__(self, bucket, name: str):
+        self.bucket = bucket
+        self.name: str = name
+        self.generation: int = 1
+        self.etag: str = None
+
+    @property
+    def size(self) -> int:
+        return len(self.bucket.objects.get(self.name, "").encode('utf-8'))
+
+    def download_as_text(self) -> str:
+        return self.bucket.download(self.name)
+
+    def open(self, mode: str = "r", encoding: str = None):
+        return io.StringIO(self.bucket.download(self.name))
+
+
+class _StubBucket:
+    """Stands in for a `storage.Bucket` holding `objects` ({name: text}), without GCP. Downloading an object
+        first raises `failures[name]` transient errors (ConnectionError), then sleeps `delays[name]` seconds.
+        Missing objects raise FileNotFoundError, which is not transient (as GCP's NotFound).
+        Completed downloads are recorded in `completed`, in the order they finished."""
+
+    def __init__(self, objects: dict, delays: dict = None, failures: dict = None):
+        self.name: str = "stub-bucket"
+        self.objects: dict = objects
+        self.delays: dict = delays or {}
+        self.failures: dict = dict(failures or {})
+        self.completed: list = []
+        self._lock = threading.Lock()
+
+    def get_blob(self, name: str) -> _StubBlob:
+        return _StubBlob(self, name) if (name in self.objects) else None
+
+    def blob(self, name: str) -> _StubBlob:
+        return _StubBlob(self, name)
+
+    def download(self, name: str) -> str:
+        if (name not in self.objects):
+            raise FileNotFoundError(f"_StubBucket.download(): no object '{name}'")
+
+        with self._lock:
+            is_failing: bool = (self.failures.get(name, 0) > 0)
+            if is_failing:
+                self.failures[name] -= 1
+        if is_failing:
+            raise ConnectionError(f"_StubBucket.download(): transient error on object '{name}'")
+
+        time.sleep(self.delays.get(name, 0))
+        with self._lock:
+            self.completed.append(name)
+
+        return self.objects[name]
+
+
+def check_gcp_fetch(n_objects: int = 6, max_workers: int = 4) -> bool:
+    """Checks `tweet_turing.merge_gcp_json_files` / `merge_gcp_csv_files` against a stub bucket, where objects
+        complete in reverse order and one fails once with a transient error: results must be in `object_list`
+        order (with `max_workers` threads, and with one), and a missing object must make both return -1.
+        Prints the outcome and returns True if the check passed."""
+    json_names: list = [f"raw/json/tweets_{i}.json" for i in range(n_objects)]
+    csv_names: list = [f"raw/troll/tweets_{i}.csv" for i in range(n_objects)]
+    objects: dict = {}
+    for i in range(n_objects):
+        tweet_ids: list = [str((i * 10) + j) for j in range(3)]
+        objects[json_names[i]] = json.dumps([{'id': tweet_id} for tweet_id in tweet_ids])
+        objects[csv_names[i]] = "tweet_id,content\r\n" + "".join(f'{tweet_id},"tweet {tweet_id}"\r\n' for tweet_id in tweet_ids)
+    expected_ids: list = [str((i * 10) + j) for i in range(n_objects) for j in range(3)]
+
+    failures: list = []
+
+    for workers in [max_workers, 1]:
+        bucket = _StubBucket(
+            objects,
+            delays={name: 0.02 * (n_objects - (i % n_objects)) for (i, name) in enumerate(json_names + csv_names)},
+            failures={json_names[1]: 1, csv_names[1]: 1}
+            )
+
+        json_data = tur.merge_gcp_json_files(bucket, json_names, max_workers=workers)
+        if (json_data == -1) or ([record['id'] for record in json_data] != expected_ids):
+            failures.append(f"JSON records out of order or missing ({workers} workers)")
+
+        csv_df = tur.merge_gcp_csv_files(bucket, csv_names, max_workers=workers)
+        if isinstance(csv_df, int) or (csv_df['tweet_id'].astype(str).tolist() != expected_ids):
+            failures.append(f"CSV rows out of order or missing ({workers} workers)")
+
+        if any(count > 0 for count in bucket.failures.values()):
+            failures.append(f"transient failures were not retried ({workers} workers)")
+        if (workers > 1) and (bucket.completed[:n_objects] == json_names):
+            failures.append("downloads did not complete out of order, so ordering was not exercised")
+
+    logging.disable(logging.CRITICAL)   # the expected errors are logged with tracebacks
+    try:
+        if (tur.merge_gcp_json_files(bucket, json_names + ["raw/json/missing.json"], max_workers=max_workers) != -1):
+            failures.append("merge_gcp_json_files() did not return -1 for a missing object")
+        if not isinstance(tur.merge_gcp_csv_files(bucket, csv_names + ["raw/troll/missing.csv"],
+                                                    max_workers=max_workers), int):
+            failures.append("merge_gcp_csv_files() did not return -1 for a missing object")
+    finally:
+        logging.disable(logging.NOTSET)
+
+    passed: bool = (len(failures) == 0)
+    print(f"gcp fetch: {n_objects} JSON and CSV objects, {max_workers} and 1 workers, one transient failure each: "
+            f"{'; '.join(failures) or 'results in order, missing objects -> -1'} -> {'PASS' if passed else 'FAIL'}",
+            file=sys.stderr)
+
+    return passed
+
+
+##############################
+#### PIPELINE CHUNK CHECK ####
+##############################
+
+def _to_python_values(values: pd.Series) -> list:
+    """Returns the values of a feature column as plain Python values (lists, str, int or None), so that
+        columns with different dtypes (e.g. object vs Arrow-backed lists) can be compared."""
+    python_values: list = []
+
+    for value in values.tolist():
+        if isinstance(value, (list, tuple)) or hasattr(value, '__array__'):
+            python_values.append(list(value))
+        else:
+            python_values.append(None if pd.isna(value) else value)
+
+    return python_values
+
+
+def check_pipeline(chunk_size: int = 2) -> bool:
+    """Checks `tweet_turing_pipeline.run_feature_pipeline` on chunks whose inferred column types differ:
+        the first chunk has no emoji (`emoji_text` is `list<null>`) and no retweets (`post_type` is `null`),
+        later chunks have both. Results, with one worker and with two, must equal `compute_features` over
+        the whole DataFrame. Prints the outcome and returns True if the check passed."""
+    retweet: list = [{'type': 'retweeted', 'id': '1'}]
+    df = pd.DataFrame({
+        'content': ["no emoji here", "plain text", "hi 😀 there", "🎉 party", "still none", "😂😂"],
+        'referenced_tweets': [None, None, retweet, None, None, retweet]
+        })
+    features: list = ['emoji', 'post_type', 'has_url', 'char_count']
+    expected: pd.DataFrame = tweet_turing_pipeline.compute_features(df, features)
+
+    failures: list = []
+
+    for max_workers in [1, 2]:
+        try:
+            result: pd.DataFrame = tweet_turing_pipeline.run_feature_pipeline(df, features, chunk_size=chunk_size,
+                                                                                max_workers=max_workers)
+        except Exception as e:
+            failures.append(f"{type(e).__name__} with {max_workers} workers: {e}")
+            continue
+
+        for column in expected.columns:
+            if (_to_python_values(result[column]) != _to_python_values(expected[column])):
+                failures.append(f"column '{column}' differs with {max_workers} workers")
+
+    passed: bool = (len(failures) == 0)
+    print(f"pipeline: {len(df)} rows in chunks of {chunk_size}, first chunk without emoji or retweets: "
+            f"{'; '.join(failures) or 'results equal compute_features'} -> {'PASS' if passed else 'FAIL'}",
+            file=sys.stderr)
+
+    return passed
+
+
+#################
+#### RUNNING ####
+#################
+
+def _current_rss_bytes() -> int:
+    """Returns the current resident set size of this process in bytes (None if unavailable, i.e. not on Linux,
+        in which case no memory figures are reported)."""
+    try:
+        with open("/proc/self/statm", mode="r") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _reset_peak_rss() -> bool:
+    """Resets the peak RSS of this process (Linux `VmHWM`) to its current RSS. Returns False if not supported."""
+    try:
+        with open("/proc/self/clear_refs", mode="w") as fh:
+            fh.write("5")
+    except OSError:
+        return False
+
+    return (_peak_rss_bytes() is not None)
+
+
+def _peak_rss_bytes() -> int:
+    """Returns the peak resident set size of this process in bytes since the last `_reset_peak_rss`
+        (since the start of the process if never reset), None if unavailable."""
+    try:
+        with open("/proc/self/status", mode="r") as fh:
+            for line in fh:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    return None
+
+
+class _RssSampler(threading.Thread):
+    """Samples the current RSS every `interval` seconds until stopped, keeping the highest value seen.
+        Used where the peak RSS cannot be reset, so that a case is not charged for the memory of
+        whatever ran before it in the process."""
+
+    def __init__(self, interval: float = 0.001):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak: int = _current_rss_bytes()
+        self._stopped = threading.Event()
+
+    def run(self) -> None:
+        while not self._stopped.wait(self.interval):
+            self.peak = max(self.peak, _current_rss_bytes())
+
+    def stop(self) -> int:
+        self._stopped.set()
+        self.join()
+        self.peak = max(self.peak, _current_rss_bytes())
+        return self.peak
+
+
+def _run_case(name: str, corpus: dict) -> dict:
+    """Runs a single benchmark case. Intended to be called in a fresh process.
+        Memory is reported as the peak RSS while the benchmark function runs, and its increase over the
+        RSS right before (after preparing the inputs), so that preparation and imports are not counted."""
+    prepare_function, bench_function = BENCHMARKS[name]
+    prepared = prepare_function(corpus)
+    gc.collect()
+    rss_before: int = _current_rss_bytes()
+    sampler: _RssSampler = None
+
+    if (rss_before is not None) and (not _reset_peak_rss()):
+        sampler = _RssSampler()
+        sampler.start()
+
+    start: float = time.perf_counter()
+    rows: int = bench_function(prepared)
+    seconds: float = time.perf_counter() - start
+
+    if (rss_before is None):
+        rss_peak: int = None
+    else:
+        rss_peak = _peak_rss_bytes() if (sampler is None) else sampler.stop()
+    rss_increase: int = (rss_peak - rss_before) if (rss_peak is not None) else None
+
+    return {
+        "benchmark": name,
+        "size": corpus["size"],
+        "rows": rows,
+        "seconds": seconds,
+        "rows_per_second": (rows / seconds) if (seconds > 0) else None,
+        "peak_rss_bytes": rss_peak,
+        "peak_rss_increase_bytes": rss_increase,
+        "peak_rss_increase_bytes_per_100k_rows": (rss_increase * 100_000 / rows) if (rss_increase and rows) else None
+    }
+
+
+def run_benchmarks(sizes: list = default_sizes, names: list = None, seed: int = default_seed,
+                    work_dir: str = None) -> dict:
+    """Generates a synthetic corpus for each size and runs the selected benchmarks against it,
+        each case in its own process. A case that raises is recorded with its `error` and the
+        run moves on to the next case. Returns the results as a JSON-serializable dict."""
+    names = list(BENCHMARKS) if (names is None) else names
+    results: list = []
+    context = multiprocessing.get_context("spawn")
+
+    with tempfile.TemporaryDirectory(dir=work_dir) as temp_dir:
+        for size in sizes:
+            corpus: dict = write_corpus(os.path.join(temp_dir, f"corpus_{size}"), size, seed=seed)
+
+            for name in names:
+                try:
+                    with context.Pool(processes=1) as pool:
+                        result: dict = pool.apply(_run_case, (name, corpus))
+                except Exception as e:
+                    results.append({"benchmark": name, "size": size, "error": f"{type(e).__name__}: {e}"})
+                    print(f"{name:<28} size={size:<9,} FAILED: {type(e).__name__}: {e}", file=sys.stderr)
+                    continue
+
+                results.append(result)
+                print(f"{name:<28} size={size:<9,} {result['seconds']:>9.3f}s "
+                        f"{(result['rows_per_second'] or 0):>14,.0f} rows/s", file=sys.stderr)
+
+    return {
+        "meta": {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "pandas": pd.__version__,
+            "seed": seed
+        },
+        "results": results
+    }
+
+
+def measure_import_time(module_name: str = "tweet_turing", repeat: int = 5) -> dict:
+    """Imports `module_name` in `repeat` fresh interpreters (using `python -X importtime`) and reports
+        the fastest cumulative import time, plus which `lazily_imported_modules` were imported eagerly."""
+    script: str = f"import json, sys, {module_name}; " \
+                    f"print(json.dumps(sorted(m for m in {lazily_imported_modules!r} if m in sys.modules)))"
+    import_seconds: list = []
+    eager_modules: list = []
+
+    for _ in range(repeat):
+        completed = subprocess.run([sys.executable, "-X", "importtime", "-c", script], capture_output=True,
+                                    text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        
+        # lines look like: "import time:  self [us] | cumulative | imported package"
+        for line in completed.stderr.splitlines():
+            fields: list = line.split("|")
+            if (len(fields) == 3) and (fields[2].strip() == module_name):
+                import_seconds.append(int(fields[1]) / 1_000_000)
+        eager_modules = json.loads(completed.stdout)
+
+    return {
+        "module": module_name,
+        "seconds": min(import_seconds),
+        "eagerly_imported": eager_modules
+    }
+
+
+def check_import_time(budget_seconds: float = import_time_budget_seconds) -> bool:
+    """Checks that `import tweet_turing` stays under `budget_seconds` and leaves the optional
+        dependencies unimported. Prints the outcome and returns True if the check passed."""
+    result: dict = measure_import_time()
+    passed: bool = (result["seconds"] <= budget_seconds) and (len(result["eagerly_imported"]) == 0)
+
+    print(f"import {result['module']}: {result['seconds']:.3f}s (budget {budget_seconds:.3f}s), "
+            f"eagerly imported: {result['eagerly_imported'] or 'none'} -> {'PASS' if passed else 'FAIL'}",
+            file=sys.stderr)
+
+    return passed
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the Tweet Turing Test loaders and feature functions.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=default_sizes,
+                        help="corpus sizes (number of tweets of each kind) to benchmark")
+    parser.add_argument("--benchmarks", nargs="+", choices=list(BENCHMARKS), default=None,
+                        help="benchmarks to run (default: all)")
+    parser.add_argument("--seed", type=int, default=default_seed, help="seed for the synthetic corpus")
+    parser.add_argument("--output", default=None, help="file to write JSON results to (default: stdout)")
+    parser.add_argument("--check-import-time", action="store_true",
+                        help="only run the import-time regression check; exit status 1 if it fails")
+    parser.add_argument("--check-gcp-fetch", action="store_true",
+                        help="only run the concurrent GCP download check against a stub bucket; exit status 1 if it fails")
+    parser.add_argument("--check-pipeline", action="store_true",
+                        help="only run the feature pipeline chunk check; exit status 1 if it fails")
+    args = parser.parse_args(argv)
+
+    if args.check_import_time:
+        return 0 if check_import_time() else 1
+    if args.check_gcp_fetch:
+        return 0 if check_gcp_fetch() else 1
+    if args.check_pipeline:
+        return 0 if check_pipeline() else 1
+
+    results: dict = run_benchmarks(sizes=args.sizes, names=args.benchmarks, seed=args.seed)
+
+    if (args.output is None):
+        json.dump(results, sys.stdout, indent=2)
+    else:
+        with open(args.output, mode="w", encoding="utf-8") as fh:
+            json.dump(results, fh, indent=2)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
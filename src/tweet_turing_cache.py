@@ -0,0 +1,175 @@
+# tweet_turing_cache.py
+#   A read-through local disk cache for objects downloaded from GCP cloud storage,
+#   used by the `get_gcp_object_*` functions in tweet_turing.py.
+#
+#   Entries are keyed by bucket, object name and generation, so an object is only
+#   downloaded again once it has actually changed in the bucket.
+#
+
+# imports from Python standard library
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+
+# imports from tweet_turing_paths.py
+from tweet_turing_paths import local_cache_path
+
+
+# module-level definitions
+logger = logging.getLogger(__name__)
+
+#   default cap on the total size of cached objects
+cache_max_bytes: int = 20 * (1024 ** 3)    # 20 GB
+
+
+class GcpObjectCache:
+    """Read-through disk cache for GCP storage objects.
+        Entries live under `cache_dir` and are keyed by (bucket, object name, generation/etag).
+        Once the total size of entries exceeds `max_bytes`, the least recently used entries
+        are evicted. The total is tracked as entries are downloaded, and the directory is only
+        scanned on the first download and whenever the total exceeds `max_bytes` (entries added by
+        other processes are counted from then on). Entries are written to a temporary file and
+        atomically renamed into place, so concurrent processes sharing one `cache_dir` never see
+        partial entries."""
+
+    def __init__(self, cache_dir: str = local_cache_path, max_bytes: int = cache_max_bytes):
+        self.cache_dir: str = cache_dir
+        self.max_bytes: int = max_bytes
+        self.hits: int = 0
+        self.misses: int = 0
+        self.evictions: int = 0
+        self.bytes_from_cache: int = 0
+        self.bytes_downloaded: int = 0
+        self._total_bytes: int = None   # total size of entries, None until the directory is first scanned
+        self._lock = threading.Lock()
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get_path(self, blob) -> str:
+        """Returns the path of a local copy of `blob`, downloading it first if it is not cached.
+            `blob` must carry metadata (e.g. as returned by `Bucket.get_blob`), since its
+            generation or etag is part of the cache key."""
+        entry_path: str = self._entry_path(blob)
+
+        try:
+            entry_size: int = os.path.getsize(entry_path)
+            os.utime(entry_path)    # refresh modification time, which tracks recency for LRU eviction
+        except FileNotFoundError:
+            entry_size = None
+
+        if (entry_size is not None):
+            with self._lock:
+                self.hits += 1
+                self.bytes_from_cache += entry_size
+            return entry_path
+
+        # download into a temporary file in the same directory, then rename into place
+        temp_fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(temp_fd, "wb") as temp_fh:
+                blob.download_to_file(temp_fh)
+            os.replace(temp_path, entry_path)
+        except Exception:
+            logger.exception(f"GcpObjectCache.get_path(): error downloading object '{blob.name}'")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        entry_size = os.path.getsize(entry_path)
+        with self._lock:
+            self.misses += 1
+            self.bytes_downloaded += entry_size
+            needs_scan: bool = (self._total_bytes is None) or (self._total_bytes + entry_size > self.max_bytes)
+            if not needs_scan:
+                self._total_bytes += entry_size
+
+        if needs_scan:
+            self.evict(keep=entry_path)
+
+        return entry_path
+
+    def get_bytes(self, blob) -> bytes:
+        """Returns the contents of `blob` as bytes, reading from the cache when possible."""
+        with open(self.get_path(blob), "rb") as fh:
+            return fh.read()
+
+    def get_text(self, blob, encoding: str = "utf-8") -> str:
+        """Returns the contents of `blob` as text, reading from the cache when possible.
+            Line endings are kept as stored (e.g. `\\r\\n` in quoted CSV fields), as in a direct download."""
+        with open(self.get_path(blob), "r", encoding=encoding, newline='') as fh:
+            return fh.read()
+
+    def evict(self, keep: str = None) -> None:
+        """Removes least recently used entries until the cache fits within `max_bytes`.
+            The entry at path `keep` (if provided) is never removed."""
+        entries: list = []
+        total_bytes: int = 0
+
+        for entry in os.scandir(self.cache_dir):
+            if (not entry.is_file()) or entry.name.endswith(".tmp"):
+                continue
+            try:
+                stat_result = entry.stat()
+            except FileNotFoundError:
+                continue    # removed by another process
+            entries.append((stat_result.st_mtime, stat_result.st_size, entry.path))
+            total_bytes += stat_result.st_size
+
+        # oldest entries first
+        for (_, entry_size, entry_path) in sorted(entries):
+            if (total_bytes <= self.max_bytes):
+                break
+            if (entry_path == keep):
+                continue
+            try:
+                os.remove(entry_path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= entry_size
+            with self._lock:
+                self.evictions += 1
+
+        with self._lock:
+            self._total_bytes = total_bytes
+
+    def clear(self) -> None:
+        """Removes every entry from the cache."""
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file():
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+        with self._lock:
+            self._total_bytes = 0
+
+    def stats(self) -> dict:
+        """Returns hit/miss statistics for this cache instance as a dict."""
+        with self._lock:
+            lookups: int = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': (self.hits / lookups) if (lookups > 0) else 0.0,
+                'evictions': self.evictions,
+                'bytes_from_cache': self.bytes_from_cache,
+                'bytes_downloaded': self.bytes_downloaded
+            }
+
+    def _entry_path(self, blob) -> str:
+        """Builds the cache file path for `blob` from its bucket, name and generation (or etag)."""
+        if (blob.generation is None) and (blob.etag is None):
+            blob.reload()   # blob was referenced without metadata, fetch it
+
+        version: str = str(blob.generation) if (blob.generation is not None) else blob.etag
+        cache_key: str = f"{blob.bucket.name}/{blob.name}#{version}"
+        extension: str = os.path.splitext(blob.name)[1]
+
+        return os.path.join(self.cache_dir, hashlib.sha256(cache_key.encode('utf-8')).hexdigest() + extension)
+
+
+if __name__ == '__main__':
+    pass
@@ -0,0 +1,141 @@
+# tweet_turing_counters.py
+#   Mergeable frequency counters for streaming top-N aggregations (e.g. `count_emoji` in
+#   tweet_turing.py). Counts are added one chunk at a time, and counters built over separate
+#   partitions or in separate worker processes can be combined with `merge`.
+#
+#   `ExactCounter` keeps every distinct item. `SpaceSavingCounter` keeps at most `capacity`
+#   items (the Space-Saving heavy-hitters summary), so its memory use is bounded however many
+#   distinct items the stream has; its counts are upper bounds, with a per-item error bound.
+#
+
+# imports from Python standard library
+import collections
+import heapq
+import logging
+
+# imports requiring installation
+import pandas as pd                         # pip install pandas
+
+
+# module-level definitions
+logger = logging.getLogger(__name__)
+
+
+class ExactCounter:
+    """Exact item frequencies (a `collections.Counter`), with the same interface as `SpaceSavingCounter`."""
+
+    def __init__(self):
+        self.counts: collections.Counter = collections.Counter()
+        self.total: int = 0
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def update(self, items) -> 'ExactCounter':
+        """Counts each item of the iterable `items`. Returns the counter."""
+        return self.add_counts(collections.Counter(items))
+
+    def add_counts(self, counts: dict) -> 'ExactCounter':
+        """Adds a mapping of item -> count (e.g. the exact counts of one chunk). Returns the counter."""
+        self.counts.update(counts)
+        self.total += sum(counts.values())
+
+        return self
+
+    def merge(self, other: 'ExactCounter') -> 'ExactCounter':
+        """Adds the counts of `other`, e.g. a counter built over another partition. Returns the counter."""
+        if not isinstance(other, ExactCounter):
+            raise TypeError(f"ExactCounter.merge(): cannot merge {type(other).__name__} into an exact counter")
+
+        return self.add_counts(other.counts)
+
+    def top(self, n: int = None, item_name: str = 'item') -> pd.DataFrame:
+        """Returns the `n` most frequent items (all if None), most frequent first, as a DataFrame with
+            columns `item_name`, `count`, `error` (always 0) and `share` (count / total)."""
+        top_items: list = self.counts.most_common(n)
+
+        return pd.DataFrame({
+            item_name: [item for (item, _) in top_items],
+            'count': pd.array([count for (_, count) in top_items], dtype='int64'),
+            'error': pd.array([0] * len(top_items), dtype='int64'),
+            'share': [(count / self.total) for (_, count) in top_items]
+            })
+
+
+class SpaceSavingCounter:
+    """Approximate item frequencies keeping at most `capacity` items (Space-Saving).
+        Each chunk's exact counts are merged in with the mergeable-summary rule: an item missing from one
+        side is assumed to have that side's smallest kept count (0 while fewer than `capacity` items are
+        kept), and only the `capacity` largest estimates are kept. Every estimate is an upper bound on the
+        item's true count, and overestimates it by at most the item's `error`; items whose true count is
+        above `total / capacity` are kept. Use a capacity a few times larger than the N of the top-N wanted."""
+
+    def __init__(self, capacity: int = 1_000):
+        if (capacity < 1):
+            raise ValueError(f"SpaceSavingCounter(): capacity must be at least 1, got {capacity}")
+
+        self.capacity: int = capacity
+        self.counts: dict = {}
+        self.errors: dict = {}
+        self.total: int = 0
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def _min_count(self) -> int:
+        """Estimate for items not kept: 0 until the counter has ever been full."""
+        return min(self.counts.values()) if (len(self.counts) >= self.capacity) else 0
+
+    def _merge_summary(self, counts: dict, errors: dict, min_count: int, total: int) -> 'SpaceSavingCounter':
+        own_min: int = self._min_count()
+        merged_counts: dict = {}
+        merged_errors: dict = {}
+
+        for item in self.counts.keys() | counts.keys():
+            merged_counts[item] = self.counts.get(item, own_min) + counts.get(item, min_count)
+            merged_errors[item] = self.errors.get(item, own_min) + errors.get(item, min_count)
+
+        if (len(merged_counts) > self.capacity):
+            kept_items: list = heapq.nlargest(self.capacity, merged_counts, key=merged_counts.__getitem__)
+            merged_counts = {item: merged_counts[item] for item in kept_items}
+            merged_errors = {item: merged_errors[item] for item in kept_items}
+
+        self.counts = merged_counts
+        self.errors = merged_errors
+        self.total += total
+
+        return self
+
+    def update(self, items) -> 'SpaceSavingCounter':
+        """Counts each item of the iterable `items` (one chunk). Returns the counter."""
+        return self.add_counts(collections.Counter(items))
+
+    def add_counts(self, counts: dict) -> 'SpaceSavingCounter':
+        """Adds a mapping of item -> exact count (e.g. the counts of one chunk). Returns the counter."""
+        return self._merge_summary(counts, {}, 0, sum(counts.values()))
+
+    def merge(self, other) -> 'SpaceSavingCounter':
+        """Adds the counts of `other` (a `SpaceSavingCounter` or `ExactCounter`), e.g. a counter built over
+            another partition. Returns the counter."""
+        if isinstance(other, ExactCounter):
+            return self.add_counts(other.counts)
+
+        return self._merge_summary(other.counts, other.errors, other._min_count(), other.total)
+
+    def top(self, n: int = None, item_name: str = 'item') -> pd.DataFrame:
+        """Returns the `n` items with the largest estimated counts (all kept items if None), as a DataFrame
+            with columns `item_name`, `count` (upper bound), `error` (count - error is a lower bound)
+            and `share` (count / total)."""
+        top_items: list = sorted(self.counts.items(), key=lambda item_count: item_count[1], reverse=True)[:n]
+
+        return pd.DataFrame({
+            item_name: [item for (item, _) in top_items],
+            'count': pd.array([count for (_, count) in top_items], dtype='int64'),
+            'error': pd.array([self.errors[item] for (item, _) in top_items], dtype='int64'),
+            'share': [(count / self.total) for (_, count) in top_items]
+            })
+
+
+def make_counter(capacity: int = None):
+    """Returns an `ExactCounter` if `capacity` is None, otherwise a `SpaceSavingCounter` of that capacity."""
+    return ExactCounter() if (capacity is None) else SpaceSavingCounter(capacity)
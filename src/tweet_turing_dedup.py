@@ -0,0 +1,163 @@
+# tweet_turing_dedup.py
+#   A compact index of integer tweet IDs, used by the merge functions in tweet_turing.py
+#   to drop duplicate tweets (e.g. from overlapping API pulls, or re-downloaded shards)
+#   as data is loaded, rather than with `drop_duplicates` on the merged DataFrame.
+#
+#   IDs are kept in a sorted uint64 numpy array (8 bytes per tweet), and the index can
+#   be saved to / loaded from a `.npy` file so that it persists across incremental runs.
+#
+
+# imports from Python standard library
+import logging
+import os
+
+# imports requiring installation
+import numpy as np                          # pip install numpy
+import pandas as pd                         # pip install pandas
+import pyarrow as pa                        # pip install pyarrow
+import pyarrow.compute as pc
+
+
+# module-level definitions
+logger = logging.getLogger(__name__)
+
+#   policies for which copy of a duplicated tweet to keep
+dedup_keep_policies: list = ['first', 'last']
+
+#   tweet IDs as strings: up to 19 digits, so that any match fits in a uint64
+_tweet_id_pattern: str = r"^[0-9]{1,19}$"
+
+
+def get_tweet_ids(ids) -> tuple:
+    """Converts tweet IDs (strings or integers, e.g. a `tweet_id` / `id` column or a list) to uint64.
+        Returns a tuple of (uint64 array, boolean array which is False where the ID is missing).
+        Malformed IDs (e.g. non-numeric strings or negative numbers) are treated as missing."""
+    if isinstance(ids, pa.ChunkedArray):
+        id_array = ids.combine_chunks()
+    else:
+        id_array = pa.array(ids.array if isinstance(ids, pd.Series) else ids, from_pandas=True)
+
+    if pa.types.is_integer(id_array.type):
+        is_well_formed = pc.greater_equal(id_array, 0)
+    else:
+        id_array = pc.cast(id_array, pa.string())   # e.g. all-null columns
+        is_well_formed = pc.match_substring_regex(id_array, _tweet_id_pattern)
+
+    n_malformed: int = len(id_array) - id_array.null_count - pc.sum(is_well_formed, min_count=0).as_py()
+    if (n_malformed > 0):
+        logger.warning(f"get_tweet_ids(): {n_malformed} malformed tweet IDs treated as missing")
+        id_array = pc.if_else(is_well_formed, id_array, pa.scalar(None, id_array.type))
+
+    id_array = pc.cast(id_array, pa.uint64())
+    is_valid: np.ndarray = pc.is_valid(id_array).to_numpy(zero_copy_only=False)
+
+    return (pc.fill_null(id_array, 0).to_numpy(zero_copy_only=False), is_valid)
+
+
+class TweetIdIndex:
+    """Set of integer tweet IDs, stored as a sorted uint64 array. New IDs are collected in a small
+        sorted buffer which is merged into the main array once it grows past a fraction of its size.
+        Adding a batch sorts only the batch and merges it into the buffer, costing
+        O(batch size * log(batch size) + buffer size); merging the buffer costs O(index size), once
+        every `max(1_000_000, index size / 8)` IDs."""
+
+    def __init__(self, ids: np.ndarray = None):
+        self._ids: np.ndarray = np.unique(np.asarray(ids, dtype=np.uint64)) if (ids is not None) \
+                                    else np.empty(0, dtype=np.uint64)
+        self._pending: np.ndarray = np.empty(0, dtype=np.uint64)
+
+    def __len__(self) -> int:
+        return len(self._ids) + len(self._pending)
+
+    def __contains__(self, tweet_id) -> bool:
+        return bool(self.contains(np.array([tweet_id], dtype=np.uint64))[0])
+
+    @staticmethod
+    def _in_sorted(sorted_ids: np.ndarray, ids: np.ndarray) -> np.ndarray:
+        if (len(sorted_ids) == 0):
+            return np.zeros(len(ids), dtype=bool)
+
+        positions: np.ndarray = np.searchsorted(sorted_ids, ids)
+
+        return sorted_ids[np.minimum(positions, len(sorted_ids) - 1)] == ids
+
+    @classmethod
+    def _merge_sorted(cls, sorted_ids: np.ndarray, new_ids: np.ndarray) -> np.ndarray:
+        """Merges the sorted, distinct `new_ids` into the sorted, distinct `sorted_ids` (skipping those
+            already there) with one pass of inserts, rather than sorting both again."""
+        new_ids = new_ids[~cls._in_sorted(sorted_ids, new_ids)]
+
+        return np.insert(sorted_ids, np.searchsorted(sorted_ids, new_ids), new_ids)
+
+    def contains(self, ids: np.ndarray) -> np.ndarray:
+        """Returns a boolean array, True where the uint64 ID in `ids` is already in the index."""
+        return self._in_sorted(self._ids, ids) | self._in_sorted(self._pending, ids)
+
+    def add(self, ids: np.ndarray) -> None:
+        """Adds the uint64 IDs in `ids` to the index."""
+        self._pending = self._merge_sorted(self._pending, np.unique(np.asarray(ids, dtype=np.uint64)))
+
+        if (len(self._pending) > max(1_000_000, len(self._ids) // 8)):
+            self._ids = self._merge_sorted(self._ids, self._pending)
+            self._pending = np.empty(0, dtype=np.uint64)
+
+    def remove(self, ids: np.ndarray) -> None:
+        """Removes the uint64 IDs in `ids` from the index (IDs not in the index are ignored)."""
+        ids = np.asarray(ids, dtype=np.uint64)
+        self._ids = self._ids[~self._in_sorted(np.unique(ids), self._ids)] if (len(ids) > 0) else self._ids
+        self._pending = self._pending[~np.isin(self._pending, ids)]
+
+    def filter_new(self, ids: np.ndarray, is_valid: np.ndarray = None, keep: str = 'first') -> np.ndarray:
+        """Returns a boolean mask over `ids` keeping one copy of each ID not already in the index,
+            namely its `keep`='first' or 'last' occurrence within `ids`, then adds the kept IDs to the index.
+            Entries where `is_valid` is False (missing IDs) are always kept."""
+        if (keep not in dedup_keep_policies):
+            raise ValueError(f"filter_new(): unsupported keep policy '{keep}', expected one of {dedup_keep_policies}")
+
+        is_valid = np.ones(len(ids), dtype=bool) if (is_valid is None) else is_valid
+        valid_positions: np.ndarray = np.flatnonzero(is_valid)
+        valid_ids: np.ndarray = ids[valid_positions]
+
+        # position of the first (or last) occurrence of each distinct ID
+        if (keep == 'first'):
+            unique_ids, occurrence = np.unique(valid_ids, return_index=True)
+        else:
+            unique_ids, reversed_occurrence = np.unique(valid_ids[::-1], return_index=True)
+            occurrence = len(valid_ids) - 1 - reversed_occurrence
+
+        is_new: np.ndarray = ~self.contains(unique_ids)
+
+        keep_mask: np.ndarray = ~is_valid
+        keep_mask[valid_positions[occurrence[is_new]]] = True
+        self.add(unique_ids[is_new])
+
+        return keep_mask
+
+    def to_array(self) -> np.ndarray:
+        """Returns all IDs in the index as one sorted uint64 array."""
+        self._ids = self._merge_sorted(self._ids, self._pending)
+        self._pending = np.empty(0, dtype=np.uint64)
+
+        return self._ids
+
+    def save(self, path_or_file) -> None:
+        """Saves the index as a `.npy` file, to a path (written atomically) or an open binary file."""
+        if isinstance(path_or_file, (str, os.PathLike)):
+            temp_path: str = f"{path_or_file}.tmp"
+            with open(temp_path, mode='wb') as fh:
+                np.save(fh, self.to_array())
+            os.replace(temp_path, path_or_file)
+        else:
+            np.save(path_or_file, self.to_array())
+
+    @classmethod
+    def load(cls, path_or_file) -> 'TweetIdIndex':
+        """Loads an index saved with `save`, from a path or an open binary file.
+            Returns an empty index if the path does not exist."""
+        if isinstance(path_or_file, (str, os.PathLike)) and not os.path.exists(path_or_file):
+            return cls()
+
+        index = cls()
+        index._ids = np.load(path_or_file)
+
+        return index
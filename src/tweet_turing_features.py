@@ -0,0 +1,118 @@
+# tweet_turing_features.py
+#   A fused extractor for the text features derived from each tweet's `content`, which
+#   otherwise takes one pass over the column per feature (`has_url_column`,
+#   `extract_emoji_features`, `reply_handle_column`, `retweet_handle_column`,
+#   `char_count_column` and URL extraction for `explode_url_column`).
+#
+#   `fill_text_features` walks each tweet's text once and writes every feature into
+#   preallocated output arrays (see `allocate_text_features`), so callers can fill one
+#   set of arrays chunk by chunk, e.g. from the batches of a snapshot.
+#   `extract_text_features` returns the features of a column as a DataFrame.
+#
+#   Example:
+#       features_df = extract_text_features(merged_df)
+#       url_parts_df = explode_url_column(features_df['urls'].str[0])
+#
+
+# imports from Python standard library
+import logging
+import re
+
+# imports requiring installation
+import numpy as np                          # pip install numpy
+import pandas as pd                         # pip install pandas
+
+# imports from tweet_turing.py and twittertext.py
+import tweet_turing as tur
+from tweet_turing_metrics import instrumented
+from twittertext import VALID_REPLY_PATTERN, URL_MATCH, TWITTER_URL_SIZE, TWITTER_STANDARD_CHAR_LIMIT, is_valid_tld
+
+
+# module-level definitions
+logger = logging.getLogger(__name__)
+
+#   output arrays filled by `fill_text_features`: column name -> numpy dtype
+text_feature_dtypes: dict = {
+    'has_url': 'int64',             # as `has_url` / `has_url_column`
+    'urls': 'object',               # list of valid URLs, as `tweet_counter.find_urls` (used by `char_count`)
+    'reply_handle': 'object',       # as `reply_handle_column` (None where not a reply)
+    'retweet_handle': 'object',     # as `retweet_handle_column` (None where not a retweet)
+    'emoji_text': 'object',         # the columns of `extract_emoji_features`
+    'content_demoji': 'object',
+    'content_no_emoji': 'object',
+    'emoji_count': 'int64',
+    'char_count': 'int64'           # as `char_count` / `char_count_column`
+    }
+
+#   characters counted twice by `char_count` (as `tweet_counter.count_tweet`)
+_WIDE_CHAR_PATTERN: re.Pattern = re.compile(f"[{chr(TWITTER_STANDARD_CHAR_LIMIT + 1)}-\U0010ffff]")
+
+
+def allocate_text_features(n_rows: int) -> dict:
+    """Returns the output arrays for `fill_text_features`: {column name: empty array of `n_rows`}."""
+    return {name: np.empty(n_rows, dtype=dtype) for (name, dtype) in text_feature_dtypes.items()}
+
+
+def fill_text_features(texts, out: dict, start: int = 0, enclosing_char: str = '',
+                        search_str: str = 'http') -> None:
+    """Computes the text features of each tweet in `texts` (an array or list of str, missing values as
+        None / NA) in a single pass over its text, writing row i into position `start + i` of each array
+        in `out` (see `allocate_text_features`). Missing texts get the same values as in the column-level
+        functions: 0, empty lists and None."""
+    emoji_pattern, candidate_pattern, code_to_desc = tur.get_emoji_engine()
+    reply_match = VALID_REPLY_PATTERN.match
+    wide_chars = _WIDE_CHAR_PATTERN.findall
+    find_urls = URL_MATCH.findall
+
+    has_url_out, urls_out = out['has_url'], out['urls']
+    reply_out, retweet_out = out['reply_handle'], out['retweet_handle']
+    emoji_text_out, demoji_out, no_emoji_out = out['emoji_text'], out['content_demoji'], out['content_no_emoji']
+    emoji_count_out, char_count_out = out['emoji_count'], out['char_count']
+
+    for (i, text) in enumerate(texts, start=start):
+        if not isinstance(text, str):
+            has_url_out[i], urls_out[i], reply_out[i], retweet_out[i] = (0, [], None, None)
+            emoji_text_out[i], demoji_out[i], no_emoji_out[i] = ([], None, None)
+            emoji_count_out[i], char_count_out[i] = (0, 0)
+            continue
+
+        has_url_out[i] = int(search_str in text)
+
+        # reply and retweet handles, both anchored at the start of the text
+        match = reply_match(text)
+        reply_out[i] = match.group(1) if (match is not None) else None
+        match = reply_match(text[3:]) if text.startswith("RT ") else None
+        retweet_out[i] = match.group(1) if (match is not None) else None
+
+        # emoji descriptions and replaced texts
+        descriptions, demoji_out[i], no_emoji_out[i] = tur.scan_emoji(
+            text, enclosing_char, emoji_pattern, candidate_pattern, code_to_desc
+            )
+        emoji_text_out[i] = descriptions
+        emoji_count_out[i] = len(descriptions)
+
+        # valid URLs are removed from the text and counted at a fixed width, wide characters count twice
+        urls: list = [url for url in find_urls(text) if is_valid_tld(url)] if ("." in text) else []
+        urls_out[i] = urls
+        for url in urls:
+            text = text.replace(url, "")
+        char_count_out[i] = len(text) + (0 if text.isascii() else len(wide_chars(text))) + (len(urls) * TWITTER_URL_SIZE)
+
+
+@instrumented('feature')
+def extract_text_features(data, enclosing_char: str = '', search_str: str = 'http') -> pd.DataFrame:
+    """Fused alternative to the column-level text feature functions. Accepts a DataFrame (or its `content`
+        column) and scans each tweet once (see `fill_text_features`).
+        Returns a DataFrame aligned to the input with the columns of `text_feature_dtypes`, matching
+        `has_url_column`, `reply_handle_column` / `retweet_handle_column` ("string" dtype, NA where absent),
+        `extract_emoji_features` and `char_count_column`, plus the list of valid URLs of each tweet."""
+    content: pd.Series = tur._get_column(data, 'content')
+    out: dict = allocate_text_features(len(content))
+
+    fill_text_features(content.to_numpy(dtype=object), out, enclosing_char=enclosing_char, search_str=search_str)
+
+    features_df = pd.DataFrame(out, index=content.index)
+    for column in ['reply_handle', 'retweet_handle']:
+        features_df[column] = features_df[column].astype("string")
+
+    return features_df
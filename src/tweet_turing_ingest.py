@@ -0,0 +1,401 @@
+# tweet_turing_ingest.py
+#   Incremental ingestion of raw tweet files (local or GCP objects) into a partitioned
+#   parquet snapshot (see `tweet_turing.write_parquet_snapshot`).
+#
+#   Example:
+#       ingest_local_files(get_csv_files(local_data_paths['troll']), '../data/snapshot/tweets/', data_source='Troll')
+#
+#   A manifest (`_manifest.json`, in the snapshot's root) records every ingested input
+#   (size, mtime or generation, row count) and, for every snapshot file, which inputs
+#   its rows came from. Each run only loads inputs which are new or changed since the
+#   last run, appends them as new files in their partitions, and removes the rows of
+#   changed inputs from the files they were written to. Small files are periodically
+#   compacted, so run time grows with the new data rather than with the whole snapshot.
+#
+#   With `deduplicate=True`, an index of the tweet IDs in the snapshot (`_tweet_ids.npy`,
+#   see tweet_turing_dedup.py) is kept next to the manifest, and tweets already in the
+#   snapshot are dropped from new inputs before they are written.
+#
+
+# imports from Python standard library
+import functools
+import json
+import logging
+import os
+import posixpath
+import uuid
+
+# imports requiring installation
+import pandas as pd                         # pip install pandas
+import pyarrow as pa                        # pip install pyarrow
+import pyarrow.fs as pa_fs
+import pyarrow.parquet as pq
+
+# imports from tweet_turing.py, tweet_turing_dedup.py and tweet_turing_metrics.py
+import tweet_turing as tur
+from tweet_turing_dedup import TweetIdIndex, get_tweet_ids
+from tweet_turing_metrics import instrumented
+
+
+# module-level definitions
+logger = logging.getLogger(__name__)
+
+#   files starting with '_' are ignored when the snapshot is read as a dataset
+manifest_file_name: str = "_manifest.json"
+manifest_version: int = 1
+id_index_file_name: str = "_tweet_ids.npy"
+
+#   raw inputs which can be loaded (see `load_local_input`); other objects under a prefix are skipped
+input_extensions: tuple = ('.csv', '.json')
+
+#   a partition is compacted once it holds this many files smaller than `compaction_small_file_rows`
+compaction_min_files: int = 8
+compaction_small_file_rows: int = tur.snapshot_row_group_size
+
+
+##################
+#### MANIFEST ####
+##################
+
+def load_manifest(root_path: str, filesystem: pa_fs.FileSystem = None) -> dict:
+    """Loads the manifest of the snapshot under `root_path`, or returns an empty manifest if there is none.
+        The manifest holds:
+          - `inputs`: input path -> {'size', 'mtime' or 'generation', 'row_count'}
+          - `files`: snapshot file path (relative to `root_path`) -> list of [input path, row count] segments,
+            in the order the rows appear in the file"""
+    filesystem = pa_fs.LocalFileSystem() if (filesystem is None) else filesystem
+    manifest_path: str = posixpath.join(root_path, manifest_file_name)
+
+    if (filesystem.get_file_info(manifest_path).type == pa_fs.FileType.NotFound):
+        return {'version': manifest_version, 'inputs': {}, 'files': {}}
+
+    with filesystem.open_input_stream(manifest_path) as fh:
+        return json.loads(fh.read())
+
+
+def save_manifest(manifest: dict, root_path: str, filesystem: pa_fs.FileSystem = None) -> None:
+    """Writes `manifest` under `root_path`. The new manifest is written under a temporary name
+        and then moved into place, so an interrupted run never leaves a partial manifest."""
+    filesystem = pa_fs.LocalFileSystem() if (filesystem is None) else filesystem
+    manifest_path: str = posixpath.join(root_path, manifest_file_name)
+    temp_path: str = manifest_path + ".tmp"
+
+    filesystem.create_dir(root_path, recursive=True)
+    with filesystem.open_output_stream(temp_path) as fh:
+        fh.write(json.dumps(manifest, indent=1).encode('utf-8'))
+    filesystem.move(temp_path, manifest_path)
+
+
+def load_id_index(root_path: str, filesystem: pa_fs.FileSystem = None) -> TweetIdIndex:
+    """Loads the index of tweet IDs in the snapshot under `root_path`, or returns an empty index if there is none."""
+    filesystem = pa_fs.LocalFileSystem() if (filesystem is None) else filesystem
+    index_path: str = posixpath.join(root_path, id_index_file_name)
+
+    if (filesystem.get_file_info(index_path).type == pa_fs.FileType.NotFound):
+        return TweetIdIndex()
+
+    with filesystem.open_input_file(index_path) as fh:
+        return TweetIdIndex.load(fh)
+
+
+def save_id_index(id_index: TweetIdIndex, root_path: str, filesystem: pa_fs.FileSystem = None) -> None:
+    """Writes `id_index` under `root_path`, via a temporary file as in `save_manifest`."""
+    filesystem = pa_fs.LocalFileSystem() if (filesystem is None) else filesystem
+    index_path: str = posixpath.join(root_path, id_index_file_name)
+    temp_path: str = index_path + ".tmp"
+
+    filesystem.create_dir(root_path, recursive=True)
+    with filesystem.open_output_stream(temp_path) as fh:
+        id_index.save(fh)
+    filesystem.move(temp_path, index_path)
+
+
+def get_local_file_states(file_list) -> dict:
+    """Returns {path: {'size', 'mtime'}} for local files, as compared against the manifest."""
+    file_states: dict = {}
+
+    for path in file_list:
+        file_stat: os.stat_result = os.stat(path)
+        file_states[os.path.normpath(path)] = {'size': file_stat.st_size, 'mtime': file_stat.st_mtime_ns}
+
+    return file_states
+
+
+def get_gcp_object_states(storage_client, bucket_name: str = "disinfo-detector-tweet-turing-test",
+                            obj_prefix: str = "") -> dict:
+    """Returns {object name: {'size', 'generation'}} for the objects under `obj_prefix`, from a single listing
+        (see `tweet_turing.list_gcp_objects`). An object's generation changes whenever it is overwritten."""
+    blob_list = storage_client.list_blobs(bucket_or_name=bucket_name, prefix=obj_prefix)
+
+    return {
+        blob.name: {'size': blob.size, 'generation': blob.generation}
+        for blob in blob_list if (blob.name != obj_prefix)
+        }
+
+
+#################
+#### LOADING ####
+#################
+
+def load_local_input(path: str) -> pd.DataFrame:
+    """Loads one raw input file: a troll CSV (see `tweet_turing.merge_csv_files`)
+        or a JSON file of tweets (see `tweet_turing.read_json_files_as_table`)."""
+    if path.endswith('.csv'):
+        return tur.merge_csv_files([path])
+    if path.endswith('.json'):
+        return tur.json_table_to_df(tur.read_json_files_as_table([path]))
+
+    raise ValueError(f"load_local_input(): unsupported file type '{path}', expected .csv or .json")
+
+
+def load_gcp_input(bucket, object_name: str) -> pd.DataFrame:
+    """GCP counterpart to `load_local_input`, reading a CSV or JSON object from `bucket`."""
+    if object_name.endswith('.csv'):
+        return tur.get_gcp_object_as_csv_df(bucket, object_name)
+    if object_name.endswith('.json'):
+        records = tur.iter_gcp_json_records(bucket, [object_name])
+        return tur.json_table_to_df(pa.concat_tables(tur.iter_flat_json_batches(records)))
+
+    raise ValueError(f"load_gcp_input(): unsupported object type '{object_name}', expected .csv or .json")
+
+
+###################################
+#### SNAPSHOT FILE MAINTENANCE ####
+###################################
+
+def _relative_path(root_path: str, path: str) -> str:
+    return posixpath.relpath(path, root_path.rstrip('/'))
+
+
+def _write_file(table: pa.Table, path: str, filesystem: pa_fs.FileSystem) -> None:
+    """(Re)writes one snapshot file. The file is written under a temporary name ignored by dataset
+        discovery, then moved into place."""
+    temp_path: str = posixpath.join(posixpath.dirname(path), '.' + posixpath.basename(path) + '.tmp')
+
+    pq.write_table(table, temp_path, filesystem=filesystem, compression=tur.snapshot_compression,
+                    row_group_size=tur.snapshot_row_group_size)
+    filesystem.move(temp_path, path)
+
+
+def _remove_input_rows(manifest: dict, input_key: str, root_path: str, filesystem: pa_fs.FileSystem,
+                        id_index: TweetIdIndex = None) -> None:
+    """Removes the rows of `input_key` from every snapshot file they were written to, deleting files
+        left empty, and updates `manifest` to match. The tweet IDs of removed rows are also removed
+        from `id_index`, if provided."""
+    for (rel_path, segments) in list(manifest['files'].items()):
+        if not any((key == input_key) for (key, _) in segments):
+            continue
+
+        path: str = posixpath.join(root_path, rel_path)
+        kept_segments: list = [[key, n_rows] for (key, n_rows) in segments if (key != input_key)]
+
+        if (len(kept_segments) == 0) and (id_index is None):
+            filesystem.delete_file(path)
+            del manifest['files'][rel_path]
+            continue
+
+        table: pa.Table = pq.read_table(path, filesystem=filesystem)
+        kept_tables: list = []
+        offset: int = 0
+        for (key, n_rows) in segments:
+            if (key != input_key):
+                kept_tables.append(table.slice(offset, n_rows))
+            elif (id_index is not None):
+                id_column: str = next(col for col in tur.tweet_id_columns if (col in table.column_names))
+                ids, is_valid = get_tweet_ids(table[id_column].slice(offset, n_rows))
+                id_index.remove(ids[is_valid])
+            offset += n_rows
+
+        if (len(kept_tables) == 0):
+            filesystem.delete_file(path)
+            del manifest['files'][rel_path]
+            continue
+
+        _write_file(pa.concat_tables(kept_tables), path, filesystem)
+        manifest['files'][rel_path] = kept_segments
+
+
+def _write_input(df: pd.DataFrame, input_key: str, root_path: str, partition_cols: list,
+                    filesystem: pa_fs.FileSystem) -> dict:
+    """Appends `df` (the rows of one input) to the snapshot as new files in their partitions.
+        Returns {written file path (relative to `root_path`): row count}."""
+    if ('publish_month' in partition_cols) and ('publish_month' not in df.columns):
+        date_column: str = 'publish_date' if ('publish_date' in df.columns) else 'created_at'
+        df = df.assign(publish_month=tur.get_publish_month(
+            df[date_column], date_format=tur.date_column_formats.get(date_column)
+            ))
+
+    written_files: dict = {}
+
+    def file_visitor(written_file) -> None:
+        written_files[_relative_path(root_path, written_file.path)] = written_file.metadata.num_rows
+
+    tur.write_parquet_snapshot(
+        df, root_path, partition_cols=partition_cols, filesystem=filesystem,
+        basename_template=f"part-{uuid.uuid4().hex[:16]}-{{i}}.parquet",
+        existing_data_behavior='overwrite_or_ignore',
+        file_visitor=file_visitor
+        )
+
+    return written_files
+
+
+@instrumented('encode')
+def compact_snapshot(root_path: str, manifest: dict = None, min_files: int = compaction_min_files,
+                        small_file_rows: int = compaction_small_file_rows,
+                        filesystem: pa_fs.FileSystem = None) -> int:
+    """Merges the small files (fewer than `small_file_rows` rows) of each partition into one file, for every
+        partition holding at least `min_files` of them. Row order and the manifest's segments are preserved.
+        If `manifest` is not provided it is loaded and saved again here.
+        Returns the number of files that were merged away."""
+    filesystem = pa_fs.LocalFileSystem() if (filesystem is None) else filesystem
+    save: bool = (manifest is None)
+    manifest = load_manifest(root_path, filesystem) if save else manifest
+
+    small_files: dict = {}
+    for (rel_path, segments) in manifest['files'].items():
+        if (sum(n_rows for (_, n_rows) in segments) < small_file_rows):
+            small_files.setdefault(posixpath.dirname(rel_path), []).append(rel_path)
+
+    files_merged: int = 0
+
+    for (partition_dir, rel_paths) in small_files.items():
+        if (len(rel_paths) < min_files):
+            continue
+
+        tables: list = [pq.read_table(posixpath.join(root_path, rel_path), filesystem=filesystem)
+                        for rel_path in rel_paths]
+        compacted_rel_path: str = posixpath.join(partition_dir, f"part-compacted-{uuid.uuid4().hex[:16]}.parquet")
+        _write_file(pa.concat_tables(tables, promote_options='default'),
+                    posixpath.join(root_path, compacted_rel_path), filesystem)
+
+        manifest['files'][compacted_rel_path] = [segment for rel_path in rel_paths
+                                                    for segment in manifest['files'][rel_path]]
+        for rel_path in rel_paths:
+            filesystem.delete_file(posixpath.join(root_path, rel_path))
+            del manifest['files'][rel_path]
+
+        files_merged += len(rel_paths)
+
+    if save and (files_merged > 0):
+        save_manifest(manifest, root_path, filesystem)
+
+    return files_merged
+
+
+###################
+#### INGESTION ####
+###################
+
+@instrumented('ingest', rows=lambda result, arguments: result['rows_written'])
+def ingest_inputs(input_states: dict, root_path: str, load_function,
+                    partition_cols: list = tur.snapshot_partition_columns, data_source: str = None,
+                    deduplicate: bool = False, compact: bool = True, filesystem: pa_fs.FileSystem = None) -> dict:
+    """Brings the snapshot under `root_path` up to date with the inputs in `input_states` (see
+        `get_local_file_states` / `get_gcp_object_states`). Only inputs which are new, or whose state differs
+        from the manifest, are loaded with `load_function(input path) -> DataFrame` and appended; the previous
+        rows of changed inputs are removed first. Inputs absent from `input_states` are left as they are.
+        If `data_source` is provided, it fills the `data_source` column where inputs lack one (or a value),
+        e.g. the empty `data_source` column of flattened JSON tweets.
+        If `deduplicate` is True, tweets whose ID is already in the snapshot are dropped (the copy already
+        in the snapshot is kept), as are repeated IDs within an input.
+        The manifest is saved after each input, so an interrupted run resumes where it stopped.
+        Returns a summary dict of input and row counts."""
+    filesystem = pa_fs.LocalFileSystem() if (filesystem is None) else filesystem
+    manifest: dict = load_manifest(root_path, filesystem)
+    id_index: TweetIdIndex = load_id_index(root_path, filesystem) if deduplicate else None
+    summary: dict = {'new': 0, 'changed': 0, 'unchanged': 0, 'rows_written': 0, 'duplicates_dropped': 0,
+                        'files_compacted': 0}
+
+    for (input_key, state) in input_states.items():
+        previous_state: dict = manifest['inputs'].get(input_key)
+
+        if (previous_state is not None) and all((previous_state.get(k) == v) for (k, v) in state.items()):
+            summary['unchanged'] += 1
+            continue
+
+        try:
+            df: pd.DataFrame = load_function(input_key)
+        except Exception:
+            logger.exception(f"ingest_inputs(): error loading input '{input_key}'")
+            raise
+
+        if (data_source is not None):
+            # flattened JSON tweets have a `data_source` column, but it is empty
+            df = df.assign(data_source=df['data_source'].fillna(data_source) if ('data_source' in df.columns)
+                                        else data_source)
+
+        if (previous_state is not None):
+            _remove_input_rows(manifest, input_key, root_path, filesystem, id_index=id_index)
+            summary['changed'] += 1
+        else:
+            summary['new'] += 1
+
+        if (id_index is not None):
+            n_loaded: int = len(df)
+            df = tur.drop_duplicate_tweets(df, id_index)
+            summary['duplicates_dropped'] += n_loaded - len(df)
+
+        if (len(df) > 0):
+            for (rel_path, n_rows) in _write_input(df, input_key, root_path, partition_cols, filesystem).items():
+                manifest['files'][rel_path] = [[input_key, n_rows]]
+
+        manifest['inputs'][input_key] = {**state, 'row_count': len(df)}
+        summary['rows_written'] += len(df)
+        if (id_index is not None):
+            save_id_index(id_index, root_path, filesystem)
+        save_manifest(manifest, root_path, filesystem)
+
+    if compact:
+        summary['files_compacted'] = compact_snapshot(root_path, manifest, filesystem=filesystem)
+        if (summary['files_compacted'] > 0):
+            save_manifest(manifest, root_path, filesystem)
+
+    return summary
+
+
+def ingest_local_files(file_list, root_path: str, load_function = load_local_input,
+                        partition_cols: list = tur.snapshot_partition_columns, data_source: str = None,
+                        deduplicate: bool = False, compact: bool = True,
+                        filesystem: pa_fs.FileSystem = None) -> dict:
+    """Incrementally ingests local CSV / JSON files (e.g. from `tweet_turing.get_csv_files`) into the
+        snapshot under `root_path`. Files are compared by size and modification time. See `ingest_inputs`."""
+    return ingest_inputs(get_local_file_states(file_list), root_path, load_function,
+                            partition_cols=partition_cols, data_source=data_source,
+                            deduplicate=deduplicate, compact=compact, filesystem=filesystem)
+
+
+def ingest_gcp_objects(storage_client, bucket, obj_prefix: str, root_path: str,
+                        partition_cols: list = tur.snapshot_partition_columns, data_source: str = None,
+                        deduplicate: bool = False, compact: bool = True,
+                        filesystem: pa_fs.FileSystem = None) -> dict:
+    """Incrementally ingests the CSV / JSON objects under `obj_prefix` (e.g. a value of `gcp_data_paths`)
+        in `bucket` into the snapshot under `root_path`, skipping any other objects. Objects are compared by
+        size and generation. To keep the snapshot in the bucket too, pass
+        `filesystem=tweet_turing.get_gcp_arrow_filesystem()`. See `ingest_inputs`."""
+    object_states: dict = {
+        name: state for (name, state) in get_gcp_object_states(storage_client, bucket.name, obj_prefix).items()
+        if name.endswith(input_extensions)
+        }
+
+    return ingest_inputs(object_states, root_path, functools.partial(load_gcp_input, bucket),
+                            partition_cols=partition_cols, data_source=data_source,
+                            deduplicate=deduplicate, compact=compact, filesystem=filesystem)
+
+
+def ingest_storage_objects(backend, obj_prefix: str, root_path: str,
+                            partition_cols: list = tur.snapshot_partition_columns, data_source: str = None,
+                            deduplicate: bool = False, compact: bool = True,
+                            filesystem: pa_fs.FileSystem = None) -> dict:
+    """Incrementally ingests the CSV / JSON objects under `obj_prefix` of a storage backend (see
+        tweet_turing_storage.py), e.g. the bucket or a local copy of it, into the snapshot under `root_path`.
+        To keep the snapshot in the same storage, pass `*backend.get_arrow_location(...)` as `filesystem`
+        and `root_path`. See `ingest_inputs`."""
+    object_states: dict = {
+        name: state for (name, state) in backend.list_object_states(obj_prefix).items()
+        if name.endswith(input_extensions)
+        }
+
+    return ingest_inputs(object_states, root_path, backend.load_input_df,
+                            partition_cols=partition_cols, data_source=data_source,
+                            deduplicate=deduplicate, compact=compact, filesystem=filesystem)
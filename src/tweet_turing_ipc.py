@@ -0,0 +1,216 @@
+# tweet_turing_ipc.py
+#   Arrow IPC (Feather v2) copies of parquet files and snapshots, for fast reloads of the
+#   same unchanged data (see `ipc_snapshot=True` on the parquet loaders in tweet_turing.py).
+#
+#   Reading parquet decompresses and decodes every column on each load. An uncompressed IPC
+#   file has the same layout on disk as in memory, so it is memory-mapped instead of read:
+#   loading takes milliseconds, pages are only read from disk once a column is used, and
+#   processes on one machine loading the same file share its pages in the OS page cache
+#   rather than each holding its own decoded copy. (`ipc_compression='lz4'` makes files
+#   smaller, but then each process decompresses its own copy.)
+#
+#   Each IPC file records the state of its source (its location, plus file sizes and modification
+#   times or the GCP object generation) in its schema metadata, and `get_ipc_table` regenerates it
+#   whenever that state has changed. Copies in a shared directory (`ipc_default_dir`, for sources not
+#   on local disk) are named after a digest of their source's full location, so sources with the
+#   same name in other directories or buckets do not overwrite each other's copies. Files are
+#   written to a temporary file and renamed into place, so processes still using the previous
+#   version are unaffected.
+#
+
+# imports from Python standard library
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+# imports requiring installation
+import pandas as pd                         # pip install pandas
+import pyarrow as pa                        # pip install pyarrow
+import pyarrow.dataset as ds
+import pyarrow.fs as pa_fs
+
+# imports from tweet_turing_metrics.py and tweet_turing_paths.py
+from tweet_turing_metrics import instrumented, count_io
+from tweet_turing_paths import local_snapshot_paths
+
+
+# module-level definitions
+logger = logging.getLogger(__name__)
+
+#   compression of IPC files: None (memory-mapped without copies) or 'lz4' / 'zstd' (smaller, decompressed on load)
+ipc_compression: str = None
+ipc_file_extension: str = '.arrow'
+
+#   directory for IPC copies of sources which are not on local disk (e.g. GCP objects)
+ipc_default_dir: str = local_snapshot_paths['parq_snapshot']
+
+#   URI schemes of source locations, by pyarrow filesystem type name where they differ (GCP objects are
+#       located as 'gs://<bucket>/<object name>' whether read through pyarrow or the GCP client library)
+_uri_schemes: dict = {'gcs': 'gs'}
+
+#   schema metadata key holding the state of the source an IPC file was generated from
+_source_state_key: bytes = b'tweet_turing.ipc_source_state'
+
+
+def get_source_id(source_path: str, filesystem: pa_fs.FileSystem = None) -> str:
+    """Returns the full location of `source_path`: its absolute path on local disk, or e.g.
+        'gs://<bucket>/<object name>' on another `filesystem` (see `_uri_schemes`)."""
+    if (filesystem is None) or isinstance(filesystem, pa_fs.LocalFileSystem):
+        return os.path.abspath(source_path)
+
+    scheme: str = _uri_schemes.get(filesystem.type_name, filesystem.type_name)
+
+    return f"{scheme}://{source_path.lstrip('/')}"
+
+
+def get_ipc_path(source_path: str, ipc_dir: str = None, source_id: str = None) -> str:
+    """Returns the path of the IPC copy of the parquet file or snapshot directory `source_path`: next to it
+        (e.g. `tweets.parquet` -> `tweets.parquet.arrow`, `tweets/` -> `tweets.arrow`), or in `ipc_dir` if
+        provided, named after a digest of `source_id` (its full location, by default the absolute
+        `source_path`; see `get_source_id`), e.g. `tweets.parquet-1a2b3c4d5e6f7a8b.arrow`."""
+    source_path = source_path.rstrip("/\\")
+    source_name: str = os.path.basename(source_path)
+
+    if (ipc_dir is None):
+        return os.path.join(os.path.dirname(source_path), source_name + ipc_file_extension)
+
+    source_id = os.path.abspath(source_path) if (source_id is None) else source_id
+    digest: str = hashlib.sha1(source_id.encode('utf-8')).hexdigest()[:16]
+
+    return os.path.join(ipc_dir, f"{source_name}-{digest}{ipc_file_extension}")
+
+
+def get_parquet_source_state(source_path: str, filesystem: pa_fs.FileSystem = None) -> dict:
+    """Returns the state of a parquet file (its location, size and modification time), or of a snapshot
+        directory (its location, the number of parquet files under it and a digest of their paths, sizes
+        and modification times). Raises a FileNotFoundError if `source_path` does not exist."""
+    source_id: str = get_source_id(source_path, filesystem=filesystem)
+    if (filesystem is None):
+        filesystem, source_path = pa_fs.LocalFileSystem(), os.path.abspath(source_path)
+
+    source_info: pa_fs.FileInfo = filesystem.get_file_info(source_path)
+
+    if (source_info.type == pa_fs.FileType.NotFound):
+        raise FileNotFoundError(f"get_parquet_source_state(): provided path could not be found. path='{source_path}'")
+    if (source_info.type == pa_fs.FileType.File):
+        return {'source': source_id, 'size': source_info.size, 'mtime_ns': source_info.mtime_ns}
+
+    file_infos: list = sorted(
+        (info for info in filesystem.get_file_info(pa_fs.FileSelector(source_path, recursive=True))
+            if (info.type == pa_fs.FileType.File) and info.path.endswith('.parquet')),
+        key=lambda info: info.path
+        )
+    digest = hashlib.sha1()
+    for info in file_infos:
+        digest.update(f"{info.path}\t{info.size}\t{info.mtime_ns}\n".encode('utf-8'))
+
+    return {'source': source_id, 'files': len(file_infos), 'digest': digest.hexdigest()}
+
+
+def read_ipc_source_state(ipc_path: str) -> dict:
+    """Returns the source state recorded in an IPC file by `write_ipc_file`, or None if the file
+        does not exist, cannot be read, or has no recorded state."""
+    try:
+        with pa.memory_map(ipc_path) as source:
+            metadata: dict = pa.ipc.open_file(source).schema.metadata or {}
+    except (FileNotFoundError, pa.ArrowInvalid):
+        return None
+
+    source_state: bytes = metadata.get(_source_state_key)
+
+    return json.loads(source_state) if (source_state is not None) else None
+
+
+@instrumented('encode', rows=lambda result, arguments: arguments['table'].num_rows)
+def write_ipc_file(table: pa.Table, ipc_path: str, source_state: dict = None,
+                    compression: str = ipc_compression) -> None:
+    """Writes `table` as an Arrow IPC file at `ipc_path` (atomically), recording `source_state` in its schema
+        metadata. Columns are combined into a single chunk where possible, so that they can be converted
+        to pandas without copies once memory-mapped."""
+    if (source_state is not None):
+        table = table.replace_schema_metadata({
+            **(table.schema.metadata or {}), _source_state_key: json.dumps(source_state)
+            })
+
+    try:
+        table = table.combine_chunks()
+    except pa.ArrowInvalid:
+        pass    # e.g. over 2 GB of text in one column: keep the existing chunks
+
+    ipc_dir: str = os.path.dirname(os.path.abspath(ipc_path))
+    os.makedirs(ipc_dir, exist_ok=True)
+    temp_fd, temp_path = tempfile.mkstemp(dir=ipc_dir, prefix=f".{os.path.basename(ipc_path)}.", suffix=".tmp")
+
+    try:
+        with os.fdopen(temp_fd, mode='wb') as fh:
+            with pa.ipc.new_file(fh, table.schema, options=pa.ipc.IpcWriteOptions(compression=compression)) as writer:
+                writer.write_table(table)
+        os.replace(temp_path, ipc_path)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(temp_path)
+        raise
+
+    count_io(bytes_out=os.path.getsize(ipc_path))
+
+
+@instrumented('parse')
+def read_ipc_table(ipc_path: str, columns: list = None) -> pa.Table:
+    """Memory-maps an Arrow IPC file as a pyarrow Table (only `columns`, if provided). Uncompressed
+        columns are not copied into memory: they stay backed by the file's pages in the OS page cache."""
+    with pa.memory_map(ipc_path) as source:
+        table: pa.Table = pa.ipc.open_file(source).read_all()
+
+    return table.select(columns) if (columns is not None) else table
+
+
+def ipc_table_to_df(table: pa.Table) -> pd.DataFrame:
+    """Converts a memory-mapped table to a pandas DataFrame with as few copies as possible: single-chunk
+        numeric columns without nulls become views of the mapped pages (`split_blocks`), and text and
+        list columns stay Arrow-backed ("string" dtype / `pd.ArrowDtype`)."""
+    def types_mapper(arrow_type: pa.DataType):
+        if (arrow_type in (pa.string(), pa.large_string())):
+            return pd.StringDtype()
+        if pa.types.is_nested(arrow_type):
+            return pd.ArrowDtype(arrow_type)
+        return None
+
+    return table.to_pandas(split_blocks=True, types_mapper=types_mapper)
+
+
+def get_ipc_table(ipc_path: str, source_state: dict, load_function, columns: list = None,
+                    compression: str = ipc_compression) -> pa.Table:
+    """Returns the memory-mapped table of the IPC file at `ipc_path` (see `read_ipc_table`). If the file is
+        missing, or was generated from a source state other than `source_state`, it is first (re)generated
+        from the table returned by `load_function()`."""
+    if (read_ipc_source_state(ipc_path) != source_state):
+        logger.info(f"get_ipc_table(): generating IPC file '{ipc_path}' from its changed or new source")
+        write_ipc_file(load_function(), ipc_path, source_state=source_state, compression=compression)
+
+    return read_ipc_table(ipc_path, columns=columns)
+
+
+def get_parquet_ipc_table(source_path: str, ipc_path: str = None, columns: list = None,
+                            filesystem: pa_fs.FileSystem = None, compression: str = ipc_compression,
+                            open_dataset = None) -> pa.Table:
+    """Returns a parquet file or snapshot directory (e.g. from `tweet_turing.write_parquet_snapshot`, with its
+        hive partition columns) as the memory-mapped table of its IPC copy, which is regenerated first if the
+        source has changed. The copy is at `ipc_path`, by default next to a local source (see `get_ipc_path`)
+        or in `ipc_default_dir` for a source on another `filesystem` (e.g. a GCP bucket).
+        `open_dataset(source_path, filesystem=...)` opens the source when the copy is regenerated
+        (e.g. `tweet_turing.get_parquet_snapshot_dataset`; by default a hive-partitioned parquet dataset)."""
+    if (ipc_path is None):
+        is_local: bool = (filesystem is None) or isinstance(filesystem, pa_fs.LocalFileSystem)
+        ipc_path = get_ipc_path(source_path, ipc_dir=None if is_local else ipc_default_dir,
+                                source_id=get_source_id(source_path, filesystem=filesystem))
+
+    def load_function() -> pa.Table:
+        if (open_dataset is not None):
+            return open_dataset(source_path, filesystem=filesystem).to_table()
+        return ds.dataset(source_path, format='parquet', partitioning='hive', filesystem=filesystem).to_table()
+
+    return get_ipc_table(ipc_path, get_parquet_source_state(source_path, filesystem=filesystem), load_function,
+                            columns=columns, compression=compression)
@@ -0,0 +1,200 @@
+# tweet_turing_json.py
+#   Pluggable JSON decoding for the JSON loaders in tweet_turing.py, and compact typed
+#   records for decoded tweets.
+#
+#   Decoding uses the fastest installed backend of `json_backends` (orjson, then ujson),
+#   falling back to the standard library's `json`. Backends are imported on first use.
+#   The cyclic garbage collector is paused while decoding: decoded JSON cannot contain
+#   reference cycles, and collections triggered by the millions of new dicts and lists
+#   otherwise take about as long as the decoding itself.
+#
+#   Typed records (see `make_record_class`) keep only a fixed set of fields of each tweet
+#   in `__slots__` attributes, instead of the nested dicts of every field in the API
+#   response, e.g. `tweet_turing.TweetRecord` for the fields in `authentic_df_eda_dtype_mapping`.
+#
+
+# imports from Python standard library
+import contextlib
+import functools
+import gc
+import importlib
+import importlib.util
+import logging
+
+
+# module-level definitions
+logger = logging.getLogger(__name__)
+
+#   JSON decoding backends, in order of preference
+json_backends: list = ['orjson', 'ujson', 'json']
+
+#   backend used when none is requested (None: the first installed backend of `json_backends`)
+default_json_backend: str = None
+
+
+##################
+#### DECODING ####
+##################
+
+def available_json_backends() -> list:
+    """Returns the backends of `json_backends` which are installed, without importing them."""
+    return [backend for backend in json_backends if (importlib.util.find_spec(backend) is not None)]
+
+
+def resolve_json_backend(backend: str = None) -> str:
+    """Returns the name of the backend to use for `backend`: itself if given, else `default_json_backend`,
+        else the first installed backend of `json_backends`."""
+    backend = default_json_backend if (backend is None) else backend
+
+    if (backend is None):
+        return available_json_backends()[0]
+    if (backend not in json_backends):
+        raise ValueError(f"resolve_json_backend(): unknown JSON backend '{backend}', expected one of {json_backends}")
+
+    return backend
+
+
+@functools.lru_cache(maxsize=None)
+def _get_loads(backend: str):
+    return importlib.import_module(backend).loads
+
+
+@contextlib.contextmanager
+def paused_gc():
+    """Context manager disabling the cyclic garbage collector (if enabled) for its duration.
+        Only for code building many objects which cannot form reference cycles."""
+    was_enabled: bool = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()
+
+
+def get_json_loads(backend: str = None):
+    """Returns the `loads` function of JSON `backend` (see `resolve_json_backend`). Every backend's `loads`
+        accepts str or UTF-8 bytes, and raises a ValueError on invalid JSON."""
+    return _get_loads(resolve_json_backend(backend))
+
+
+def decode_json(json_text, backend: str = None):
+    """Decodes JSON `json_text` (str or UTF-8 bytes) with `backend`, with the garbage collector paused."""
+    loads = get_json_loads(backend)
+
+    with paused_gc():
+        return loads(json_text)
+
+
+def load_json_file(file_path: str, encoding: str = 'utf-8', backend: str = None):
+    """Reads and decodes the JSON file at `file_path` with `backend`. UTF-8 files are passed to
+        the decoder as bytes, skipping the intermediate Python string."""
+    with open(file=file_path, mode='rb') as fh:
+        json_bytes: bytes = fh.read()
+
+    if (encoding.lower().replace('-', '').replace('_', '') != 'utf8'):
+        return decode_json(json_bytes.decode(encoding), backend=backend)
+
+    return decode_json(json_bytes, backend=backend)
+
+
+#######################
+#### TYPED RECORDS ####
+#######################
+
+class TypedRecord:
+    """Base class of the record classes created by `make_record_class`."""
+    __slots__ = ()
+    _fields: tuple = ()         # attribute names
+    _paths: tuple = ()          # dotted field paths, in the same order as `_fields`
+    _split_paths: tuple = ()
+
+    @classmethod
+    def from_dict(cls, record: dict) -> 'TypedRecord':
+        """Builds a record from a decoded (nested) tweet dict. Missing fields are set to None.
+            (Overridden by a faster, generated version in classes created by `make_record_class`.)"""
+        instance = cls.__new__(cls)
+
+        for (field, keys) in zip(cls._fields, cls._split_paths):
+            value = record
+            for key in keys:
+                value = value.get(key) if isinstance(value, dict) else None
+            setattr(instance, field, value)
+
+        return instance
+
+    def get(self, path: str, default = None):
+        """Returns the field with dotted path `path` (e.g. 'public_metrics.like_count'), like `dict.get`
+            on a flattened tweet, so records can be used where code expects `record.get('id')`."""
+        value = getattr(self, path.replace('.', '__'), None)
+        return default if (value is None) else value
+
+    def to_dict(self) -> dict:
+        """Returns the record as a flat dict keyed by dotted field path (as `pd.json_normalize` would)."""
+        return {path: getattr(self, field) for (path, field) in zip(self._paths, self._fields)}
+
+    def __eq__(self, other) -> bool:
+        return (type(self) is type(other)) and all(getattr(self, f) == getattr(other, f) for f in self._fields)
+
+    def __repr__(self) -> str:
+        fields: str = ", ".join(f"{field}={getattr(self, field)!r}" for field in self._fields)
+        return f"{type(self).__name__}({fields})"
+
+
+def _make_from_dict(record_class: type):
+    """Generates `from_dict` for `record_class` as straight-line code, one assignment per field
+        (as `collections.namedtuple` does), which is several times faster than walking each path in a loop.
+        Falls back to the generic `TypedRecord.from_dict` if a nested field is not an object."""
+    lines: list = ["def from_dict(cls, record):", "    instance = new(cls)", "    try:"]
+    for (field, keys) in zip(record_class._fields, record_class._split_paths):
+        value: str = "record"
+        for key in keys[:-1]:
+            value = f"({value}.get({key!r}) or empty)"
+        lines.append(f"        instance.{field} = {value}.get({keys[-1]!r})")
+    lines.extend(["    except AttributeError:", "        return generic_from_dict(cls, record)", "    return instance"])
+
+    namespace: dict = {'new': object.__new__, 'empty': {}, 'generic_from_dict': TypedRecord.from_dict.__func__}
+    exec("\n".join(lines), namespace)
+
+    return classmethod(namespace['from_dict'])
+
+
+def make_record_class(class_name: str, field_paths: list, module: str = __name__) -> type:
+    """Creates a `TypedRecord` subclass with one `__slots__` attribute per dotted path in `field_paths`,
+        e.g. 'author.public_metrics.followers_count' is stored as attribute `author__public_metrics__followers_count`.
+        `module` should be the module the class is assigned in, so that records can be pickled."""
+    fields: tuple = tuple(path.replace('.', '__') for path in field_paths)
+
+    if not all(field.isidentifier() for field in fields):
+        raise ValueError(f"make_record_class(): field paths must be dotted Python identifiers, got {list(field_paths)}")
+
+    record_class: type = type(class_name, (TypedRecord,), {
+        '__slots__': fields,
+        '__module__': module,
+        '_fields': fields,
+        '_paths': tuple(field_paths),
+        '_split_paths': tuple(tuple(path.split('.')) for path in field_paths)
+        })
+    record_class.from_dict = _make_from_dict(record_class)
+
+    return record_class
+
+
+def convert_records(records: list, record_class: type) -> list:
+    """Replaces each decoded tweet dict in `records` with a `record_class` record, in place,
+        so that each dict can be freed as soon as it has been converted. Returns `records`."""
+    from_dict = record_class.from_dict
+
+    with paused_gc():
+        for (i, record) in enumerate(records):
+            records[i] = from_dict(record)
+
+    return records
+
+
+def record_to_json(obj) -> dict:
+    """`default` function for `json.dump` / `json.dumps`, writing typed records as flat dicts."""
+    if isinstance(obj, TypedRecord):
+        return obj.to_dict()
+
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
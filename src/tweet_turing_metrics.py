@@ -0,0 +1,308 @@
+# tweet_turing_metrics.py
+#   Opt-in instrumentation of the loaders and feature functions in tweet_turing.py and
+#   twittertext.py: wall time, rows processed, bytes read/written and peak memory per call.
+#
+#   Example:
+#       enable_instrumentation(trace_memory=True, sinks=[jsonl_sink('../data/metrics.jsonl')])
+#       merged_df = merge_csv_files(get_csv_files(local_data_paths['troll']))
+#       print(summarize_records())
+#
+#   Functions are wrapped with `@instrumented(stage)`, and steps inside a function can be
+#   timed with `with measure(stage, name):`. While instrumentation is disabled (the default)
+#   a wrapped call costs one extra function call and a flag check, and nothing is recorded.
+#
+
+# imports from Python standard library
+import contextlib
+import functools
+import inspect
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource     # not available on Windows; peak RSS is then reported as None
+except ImportError:
+    resource = None
+
+# imports requiring installation
+import pandas as pd                         # pip install pandas
+
+
+# module-level definitions
+logger = logging.getLogger(__name__)
+
+_enabled: bool = False
+_trace_memory: bool = False
+_records: list = []
+_sinks: list = []
+_records_lock = threading.Lock()
+_call_stack = threading.local()     # per-thread stack of the records of calls in progress
+
+
+##########################
+#### ENABLE / RESULTS ####
+##########################
+
+def enable_instrumentation(trace_memory: bool = False, sinks: list = None) -> None:
+    """Starts recording instrumented calls. If `trace_memory` is True, the peak memory allocated by Python
+        during each call is measured with `tracemalloc`, which slows down allocation-heavy code noticeably.
+        Each record is also passed to every callable in `sinks` (see `jsonl_sink`, `logging_sink`)."""
+    global _enabled, _trace_memory, _sinks
+
+    _trace_memory = trace_memory
+    _sinks = list(sinks) if (sinks is not None) else []
+
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+    _enabled = True
+
+
+def disable_instrumentation() -> None:
+    """Stops recording instrumented calls. Records collected so far are kept (see `reset_records`)."""
+    global _enabled
+
+    _enabled = False
+
+    if _trace_memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def is_instrumentation_enabled() -> bool:
+    return _enabled
+
+
+def get_records() -> list:
+    """Returns a copy of the records collected so far, one dict per instrumented call or step."""
+    with _records_lock:
+        return list(_records)
+
+
+def reset_records() -> None:
+    with _records_lock:
+        _records.clear()
+
+
+def get_records_df() -> pd.DataFrame:
+    """Returns the records collected so far as a DataFrame, one row per instrumented call or step."""
+    return pd.DataFrame(get_records(), columns=[
+        'stage', 'name', 'depth', 'start_time', 'wall_seconds', 'rows', 'bytes_in', 'bytes_out',
+        'peak_memory_bytes', 'max_rss_bytes', 'error'
+        ])
+
+
+def summarize_records(records: list = None) -> pd.DataFrame:
+    """Aggregates `records` (default: all records collected so far) per stage and function:
+        number of calls and errors, total and mean wall time, rows and bytes processed,
+        throughput and the largest peak memory of any call. Sorted by total wall time."""
+    records_df: pd.DataFrame = get_records_df() if (records is None) else pd.DataFrame(records)
+
+    if (len(records_df) == 0):
+        return pd.DataFrame()
+
+    summary: pd.DataFrame = records_df.groupby(['stage', 'name'], sort=False).agg(
+        calls=('wall_seconds', 'size'),
+        errors=('error', 'count'),
+        total_seconds=('wall_seconds', 'sum'),
+        mean_seconds=('wall_seconds', 'mean'),
+        rows=('rows', 'sum'),
+        bytes_in=('bytes_in', 'sum'),
+        bytes_out=('bytes_out', 'sum'),
+        peak_memory_bytes=('peak_memory_bytes', 'max')
+        )
+    summary['rows_per_second'] = summary['rows'] / summary['total_seconds']
+    summary['mb_per_second'] = (summary['bytes_in'] + summary['bytes_out']) / summary['total_seconds'] / 1e6
+
+    return summary.sort_values('total_seconds', ascending=False)
+
+
+###############
+#### SINKS ####
+###############
+
+def jsonl_sink(path: str):
+    """Returns a sink appending each record as one JSON line to the file at `path`."""
+    sink_lock = threading.Lock()
+
+    def write_record(record: dict) -> None:
+        with sink_lock:
+            with open(path, mode='a', encoding='utf-8') as fh:
+                fh.write(json.dumps(record, default=str) + "\n")
+
+    return write_record
+
+
+def logging_sink(sink_logger: logging.Logger = logger, level: int = logging.INFO):
+    """Returns a sink logging a one-line summary of each record."""
+    def log_record(record: dict) -> None:
+        sink_logger.log(level, f"{record['stage']} {record['name']}: {record['wall_seconds']:.3f}s "
+                                f"rows={record['rows']} bytes_in={record['bytes_in']} "
+                                f"bytes_out={record['bytes_out']} peak_memory={record['peak_memory_bytes']}")
+
+    return log_record
+
+
+###################
+#### RECORDING ####
+###################
+
+def _get_call_stack() -> list:
+    if not hasattr(_call_stack, 'records'):
+        _call_stack.records = []
+
+    return _call_stack.records
+
+
+def _max_rss_bytes() -> int:
+    if (resource is None):
+        return None
+
+    max_rss: int = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    return max_rss if (sys.platform == 'darwin') else (max_rss * 1024)     # kilobytes on Linux
+
+
+def _start_record(stage: str, name: str) -> dict:
+    call_stack: list = _get_call_stack()
+    record: dict = {
+        'stage': stage, 'name': name, 'depth': len(call_stack), 'start_time': time.time(),
+        'wall_seconds': None, 'rows': None, 'bytes_in': None, 'bytes_out': None,
+        'peak_memory_bytes': None, 'max_rss_bytes': None, 'error': None
+        }
+
+    if _trace_memory and tracemalloc.is_tracing():
+        # keep the enclosing call's peak before the peak is reset for this call
+        current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+        if (len(call_stack) > 0) and ('_peak_traced' in call_stack[-1]):
+            call_stack[-1]['_peak_traced'] = max(call_stack[-1]['_peak_traced'], peak_bytes)
+        tracemalloc.reset_peak()
+        record['_start_traced'] = current_bytes
+        record['_peak_traced'] = current_bytes
+
+    call_stack.append(record)
+    record['_start_counter'] = time.perf_counter()
+
+    return record
+
+
+def _finish_record(record: dict) -> None:
+    record['wall_seconds'] = time.perf_counter() - record.pop('_start_counter')
+    call_stack: list = _get_call_stack()
+    call_stack.pop()
+
+    if ('_peak_traced' in record):
+        peak_bytes: int = max(record.pop('_peak_traced'), tracemalloc.get_traced_memory()[1])
+        record['peak_memory_bytes'] = peak_bytes - record.pop('_start_traced')
+        if (len(call_stack) > 0) and ('_peak_traced' in call_stack[-1]):
+            call_stack[-1]['_peak_traced'] = max(call_stack[-1]['_peak_traced'], peak_bytes)
+
+    record['max_rss_bytes'] = _max_rss_bytes()
+
+    with _records_lock:
+        _records.append(record)
+
+    for sink in _sinks:
+        try:
+            sink(record)
+        except Exception:
+            logger.exception(f"_finish_record(): error in metrics sink {sink!r}")
+
+
+def count_io(rows: int = None, bytes_in: int = None, bytes_out: int = None) -> None:
+    """Adds rows / bytes to the innermost instrumented call in progress (in this thread), for values only
+        known inside the function, e.g. the size of a downloaded object. Does nothing when disabled."""
+    if not _enabled:
+        return
+
+    call_stack: list = _get_call_stack()
+    if (len(call_stack) == 0):
+        return
+
+    for (key, value) in [('rows', rows), ('bytes_in', bytes_in), ('bytes_out', bytes_out)]:
+        if (value is not None):
+            call_stack[-1][key] = (call_stack[-1][key] or 0) + value
+
+
+@contextlib.contextmanager
+def measure(stage: str, name: str):
+    """Context manager recording one step inside a function (e.g. `with measure('concat', 'merge_csv_files'):`),
+        nested under the enclosing instrumented call. Use `count_io` inside it to add rows / bytes."""
+    if not _enabled:
+        yield
+        return
+
+    record: dict = _start_record(stage, name)
+    try:
+        yield
+    except BaseException as e:
+        record['error'] = type(e).__name__
+        raise
+    finally:
+        _finish_record(record)
+
+
+def default_rows(result, arguments: dict) -> int:
+    """Rows processed by a call, taken from its result: the length of a DataFrame, Series, table or list,
+        or the result itself if it is a count. None otherwise."""
+    if isinstance(result, bool):
+        return None
+    if isinstance(result, int):
+        return result if (result >= 0) else None
+    if hasattr(result, '__len__') and not isinstance(result, (str, bytes, dict)):
+        return len(result)
+
+    return None
+
+
+def file_sizes(argument_name: str):
+    """Returns a byte counter for `instrumented` summing the sizes of the local file(s) in argument `argument_name`."""
+    def count_bytes(result, arguments: dict) -> int:
+        paths = arguments.get(argument_name)
+        paths = [paths] if isinstance(paths, (str, os.PathLike)) else paths
+        return sum(os.path.getsize(path) for path in paths if os.path.isfile(path))
+
+    return count_bytes
+
+
+def instrumented(stage: str, rows = default_rows, bytes_in = None, bytes_out = None):
+    """Decorator recording each call of the decorated function while instrumentation is enabled.
+        `stage` groups functions in the summary (e.g. 'list', 'download', 'parse', 'merge', 'encode', 'feature').
+        `rows`, `bytes_in` and `bytes_out` are optional callables `(result, arguments) -> int`, where `arguments`
+        maps parameter names to the call's arguments. They are skipped for values already set with `count_io`."""
+    def decorator(function):
+        name: str = function.__name__
+        signature: inspect.Signature = inspect.signature(function)
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+
+            record: dict = _start_record(stage, name)
+            try:
+                result = function(*args, **kwargs)
+            except BaseException as e:
+                record['error'] = type(e).__name__
+                _finish_record(record)
+                raise
+
+            try:
+                arguments: dict = signature.bind(*args, **kwargs).arguments
+                for (key, counter) in [('rows', rows), ('bytes_in', bytes_in), ('bytes_out', bytes_out)]:
+                    if (counter is not None) and (record[key] is None):
+                        record[key] = counter(result, arguments)
+            except Exception:
+                logger.exception(f"instrumented(): error counting rows/bytes for '{name}'")
+
+            _finish_record(record)
+
+            return result
+
+        return wrapper
+
+    return decorator
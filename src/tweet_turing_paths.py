@@ -35,6 +35,12 @@ gcp_snapshot_paths = {
     "parq_snapshot": "snapshot/"
 }
 
+#   local copy of the GCP bucket, with each object stored at its object name (see tweet_turing_storage.py)
+local_bucket_path: str = "../data/bucket/"
+
 gcp_project_name: str = "ds-capstone-jmmr"
 gcp_bucket_name: str = "disinfo-detector-tweet-turing-test"
 gcp_key_file: str = "../key/service_acct_key.json"
+
+#   local read-through cache of GCP objects (see tweet_turing_cache.py)
+local_cache_path: str = "../data/cache/"
@@ -0,0 +1,205 @@
+# tweet_turing_pipeline.py
+#   Chunked, multi-process extraction of per-tweet features (see `FEATURES`) from a
+#   DataFrame or a parquet snapshot written by `tweet_turing.write_parquet_snapshot`.
+#
+#   Example:
+#       features_df = run_feature_pipeline(merged_df, ['is_retweet', 'has_url', 'emoji'])
+#
+#   Worker processes are initialized once: the regex, emoji and TLD tables are built
+#   per worker rather than per chunk. Input DataFrames are written once to an Arrow IPC
+#   file which every worker memory-maps, so chunks are sliced zero-copy instead of
+#   being pickled to each worker; parquet snapshots are read by the workers directly,
+#   one row group per chunk. Results come back as Arrow IPC buffers, in input order.
+#
+
+# imports from Python standard library
+import logging
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+# imports requiring installation
+import pandas as pd                         # pip install pandas
+import pyarrow as pa                        # pip install pyarrow
+import pyarrow.parquet as pq
+
+# imports from tweet_turing.py, twittertext.py and tweet_turing_metrics.py
+import tweet_turing as tur
+import twittertext
+from tweet_turing_metrics import instrumented
+
+
+# module-level definitions
+logger = logging.getLogger(__name__)
+
+pipeline_chunk_size: int = 50_000
+
+#   per-worker state, set by `_init_worker`
+_worker_table: pa.Table = None
+_worker_features: list = None
+
+
+##################
+#### FEATURES ####
+##################
+
+def _explode_url_feature(df: pd.DataFrame) -> pd.DataFrame:
+    return twittertext.explode_url_column(df['tco1_step1'])
+
+
+#   name -> (input columns, column-level function returning a Series or DataFrame aligned to its input)
+FEATURES: dict = {
+    'is_retweet': (['referenced_tweets'], tur.is_retweet_column),
+    'post_type': (['referenced_tweets'], tur.get_post_type_column),
+    'has_url': (['content'], tur.has_url_column),
+    'emoji': (['content'], tur.extract_emoji_features),
+    'char_count': (['content'], twittertext.char_count_column),
+    'reply_handle': (['content'], twittertext.reply_handle_column),
+    'retweet_handle': (['content'], twittertext.retweet_handle_column),
+    'explode_url': (['tco1_step1'], _explode_url_feature),
+}
+
+
+def get_feature_columns(features: list) -> list:
+    """Returns the input columns needed to compute `features`, in a stable order."""
+    columns: list = []
+
+    for name in features:
+        if (name not in FEATURES):
+            raise ValueError(f"get_feature_columns(): unknown feature '{name}', expected one of {list(FEATURES)}")
+        columns.extend(col for col in FEATURES[name][0] if (col not in columns))
+
+    return columns
+
+
+def compute_features(df: pd.DataFrame, features: list) -> pd.DataFrame:
+    """Computes `features` over `df` in the current process. Single-column features are named after
+        the feature, multi-column features (`emoji`, `explode_url`) keep their own column names.
+        Returns a DataFrame aligned to `df`."""
+    feature_dfs: list = []
+
+    for name in features:
+        result = FEATURES[name][1](df)
+        feature_dfs.append(result.to_frame(name) if isinstance(result, pd.Series) else result)
+
+    return pd.concat(feature_dfs, axis='columns').set_axis(df.index, axis='index')
+
+
+########################
+#### WORKER PROCESS ####
+########################
+
+def _table_to_df(table: pa.Table) -> pd.DataFrame:
+    """Converts an input chunk to pandas, keeping list columns Arrow-backed so that the
+        column-level functions can use their Arrow fast paths."""
+    def types_mapper(arrow_type: pa.DataType):
+        if pa.types.is_string(arrow_type) or pa.types.is_large_string(arrow_type):
+            return pd.StringDtype()
+        if pa.types.is_list(arrow_type):
+            return pd.ArrowDtype(arrow_type)
+        return None
+
+    return table.to_pandas(types_mapper=types_mapper)
+
+
+def _init_worker(ipc_path: str, features: list) -> None:
+    """Runs once per worker: memory-maps the input table (if any) and builds the lookup tables
+        the features need, so that no chunk pays for them."""
+    global _worker_table, _worker_features
+
+    _worker_features = features
+    _worker_table = None if (ipc_path is None) else pa.ipc.open_file(pa.memory_map(ipc_path, 'r')).read_all()
+
+    if (features is None):
+        return
+    if ('emoji' in features):
+        tur.get_emoji_engine()
+    if ('explode_url' in features):
+        twittertext.explode_url("https://www.example.com/")
+
+
+def _run_chunk(task: tuple) -> pa.Buffer:
+    """Computes the worker's features for one chunk, either `('slice', offset, length)` of the
+        memory-mapped input table, or `('row_group', path, row_group, columns)` of a parquet file.
+        Returns the features as an Arrow IPC stream buffer."""
+    if (task[0] == 'slice'):
+        table: pa.Table = _worker_table.slice(task[1], task[2])
+    else:
+        table: pa.Table = pq.ParquetFile(task[1]).read_row_group(task[2], columns=task[3])
+
+    features_df: pd.DataFrame = compute_features(_table_to_df(table), _worker_features)
+    features_table: pa.Table = pa.Table.from_pandas(features_df, preserve_index=False)
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, features_table.schema) as writer:
+        writer.write_table(features_table)
+
+    return sink.getvalue()
+
+
+#######################
+#### PIPELINE RUNS ####
+#######################
+
+def _get_snapshot_tasks(root_path: str, columns: list) -> list:
+    """Lists one `('row_group', ...)` task per row group of each file in a parquet snapshot,
+        in the same (sorted) file order as `tweet_turing.read_parquet_snapshot`."""
+    tasks: list = []
+
+    for path in tur.get_parquet_snapshot_dataset(root_path).files:
+        for row_group in range(pq.ParquetFile(path).num_row_groups):
+            tasks.append(('row_group', path, row_group, columns))
+
+    return tasks
+
+
+def _write_ipc_file(table: pa.Table, path: str, chunk_size: int) -> None:
+    with pa.OSFile(path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=chunk_size)
+
+
+@instrumented('feature')
+def run_feature_pipeline(source, features: list, chunk_size: int = pipeline_chunk_size,
+                            max_workers: int = None) -> pd.DataFrame:
+    """Computes `features` (names in `FEATURES`) over `source`, either a DataFrame or the root path of
+        a local parquet snapshot, split into chunks processed by a pool of `max_workers` processes
+        (default: one per core). DataFrames are split into chunks of `chunk_size` rows; snapshots are
+        split by row group.
+        Rows are returned in input order regardless of the number of workers. Returns a DataFrame
+        indexed like `source` (a RangeIndex for snapshots)."""
+    columns: list = get_feature_columns(features)
+    max_workers = os.cpu_count() if (max_workers is None) else max_workers
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if isinstance(source, pd.DataFrame):
+            index: pd.Index = source.index
+            ipc_path: str = os.path.join(temp_dir, "pipeline_input.arrow")
+            _write_ipc_file(pa.Table.from_pandas(source[columns], preserve_index=False), ipc_path, chunk_size)
+            tasks: list = [('slice', offset, chunk_size) for offset in range(0, len(source), chunk_size)]
+        else:
+            index = None
+            ipc_path = None
+            tasks = _get_snapshot_tasks(source, columns)
+
+        if (max_workers <= 1) or (len(tasks) <= 1):
+            _init_worker(ipc_path, features)
+            buffers: list = [_run_chunk(task) for task in tasks]
+            _init_worker(None, None)    # release the memory-mapped input before it is deleted
+        else:
+            with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_init_worker, initargs=(ipc_path, features)) as executor:
+                buffers = list(executor.map(_run_chunk, tasks))     # map yields results in task order
+
+    if (len(buffers) == 0):
+        return compute_features(pd.DataFrame({col: pd.Series(dtype=object) for col in columns}), features)
+
+    # each chunk's column types are inferred on their own, e.g. `list<null>` for `emoji_text` in a chunk
+    # without emoji, or `null` for an all-None `post_type`: promote them to the common type
+    features_table: pa.Table = pa.concat_tables(
+        (pa.ipc.open_stream(buffer).read_all() for buffer in buffers), promote_options='permissive'
+        )
+    features_df: pd.DataFrame = _table_to_df(features_table)
+
+    return features_df if (index is None) else features_df.set_axis(index, axis='index')
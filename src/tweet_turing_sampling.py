@@ -0,0 +1,344 @@
+# tweet_turing_sampling.py
+#   Streaming stratified sampling of tweets (e.g. balanced troll vs. authentic samples, by
+#   `data_source` or `account_category`), without loading the full corpus to call `df.sample`.
+#
+#   Each tweet gets a pseudo-random priority computed only from its ID and the seed, and each
+#   stratum keeps the `n` tweets with the smallest priorities seen so far (a bottom-k sample,
+#   i.e. reservoir sampling keyed by a hash). Files, chunks and snapshot partitions are read
+#   one at a time and only the sampled rows are kept, so memory grows with the sample size
+#   rather than the corpus. Since a tweet's priority does not depend on the order in which
+#   rows are read, samples built over separate inputs can be merged, and a sample is the same
+#   whatever the chunk size or number of workers (`max_workers`). Rows without a usable ID are
+#   keyed by their input and row number instead, so that they are sampled like any other row.
+#
+#   Example:
+#       sample_df = sample_parquet_snapshot('../data/snapshot/tweets/', strata=['data_source'], n=10_000,
+#                                           columns=['tweet_id', 'id', 'content', 'data_source'])
+#
+
+# imports from Python standard library
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+# imports requiring installation
+import numpy as np                          # pip install numpy
+import pandas as pd                         # pip install pandas
+import pyarrow as pa                        # pip install pyarrow
+import pyarrow.dataset as ds
+import pyarrow.fs as pa_fs
+import pyarrow.parquet as pq
+
+# imports from tweet_turing.py and its helper modules
+import tweet_turing as tur
+from tweet_turing_dedup import get_tweet_ids
+from tweet_turing_metrics import instrumented, file_sizes
+
+
+# module-level definitions
+logger = logging.getLogger(__name__)
+
+default_sample_seed: int = 42
+
+#   columns identifying a tweet, in order of preference (troll CSVs use `tweet_id`, JSON tweets `id`)
+sample_key_columns: list = ['tweet_id', 'id']
+
+#   rows per chunk when streaming CSV / JSON inputs
+sample_chunk_size: int = 100_000
+
+_priority_column: str = '__sample_priority'
+
+
+def get_sample_priorities(keys, seed: int = default_sample_seed) -> np.ndarray:
+    """Returns the sampling priority (uint64) of each key in `keys` (e.g. a tweet ID column), a keyed hash of
+        the key's text and `seed`. The same tweet has the same priority in every input, run and process."""
+    hash_key: str = hashlib.blake2b(str(seed).encode('utf-8'), digest_size=8).hexdigest()   # 16 characters
+    key_text: np.ndarray = pd.Series(keys).astype('string').to_numpy(dtype=object, na_value="")
+
+    return pd.util.hash_array(key_text, hash_key=hash_key, categorize=False)
+
+
+def _get_sample_keys(df: pd.DataFrame, key_column: str = None, source: str = None, row_offset: int = 0) -> pd.Series:
+    """Returns the key of each row: `key_column` if provided, otherwise the first well-formed tweet ID
+        among the `sample_key_columns` in `df`. Rows without a key (missing, empty or malformed IDs) are
+        keyed by `source` (the input they were read from) and their row number in it, starting from
+        `row_offset` for the first row of `df`, rather than all sharing one key and one priority."""
+    if (key_column is not None):
+        keys: pd.Series = df[key_column].astype('string')
+        keys = keys.mask(keys.str.strip() == "")
+    else:
+        present_columns: list = [column for column in sample_key_columns if (column in df.columns)]
+        if (len(present_columns) == 0):
+            raise ValueError(f"_get_sample_keys(): no key column found, expected one of {sample_key_columns}")
+
+        keys = None
+        for column in present_columns:
+            column_keys: pd.Series = df[column].astype('string')
+            column_keys = column_keys.where(get_tweet_ids(column_keys)[1])
+            keys = column_keys if (keys is None) else keys.fillna(column_keys)
+
+    is_missing: np.ndarray = keys.isna().to_numpy(dtype=bool)
+    if is_missing.any():
+        row_numbers: np.ndarray = np.arange(row_offset, row_offset + len(df))[is_missing]
+        keys[is_missing] = [f"{source or ''}#{row_number}" for row_number in row_numbers]
+
+    return keys
+
+
+class StratifiedSample:
+    """Bottom-k stratified sample: for each combination of values of the `strata` columns, keeps the `n` rows
+        with the smallest priority (see `get_sample_priorities`). `n` is either the number of rows per stratum, or
+        a dict {stratum value (a tuple if several strata columns): number of rows}, which skips strata not in it.
+        Rows are added chunk by chunk with `update`, and samples built over other inputs are added with `merge`."""
+
+    def __init__(self, strata: list, n, seed: int = default_sample_seed, key_column: str = None,
+                    columns: list = None):
+        if isinstance(n, dict) and (len(strata) == 1):
+            n = {(key[0] if isinstance(key, tuple) else key): count for (key, count) in n.items()}
+
+        self.strata: list = list(strata)
+        self.n = n
+        self.seed: int = seed
+        self.key_column: str = key_column
+        self.columns: list = columns
+        self.rows_seen: int = 0
+        self._kept: pd.DataFrame = None
+        self._source_rows: dict = {}    # source -> rows seen from it, for the keys of rows without an ID
+
+    def _get_strata_index(self, keys) -> pd.Index:
+        if (len(self.strata) == 1):
+            return pd.Index(keys)
+
+        return pd.MultiIndex.from_tuples(keys, names=self.strata)
+
+    def _lookup(self, df: pd.DataFrame, values: pd.Series) -> pd.Series:
+        """Returns `values` (indexed by stratum) for the stratum of each row of `df`, NA where it has none."""
+        values.index = values.index.set_names(self.strata)
+        return df[self.strata].join(values.rename('__value'), on=self.strata)['__value']
+
+    def _select(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Keeps the rows of `df` with the smallest priorities of each stratum."""
+        df = df.sort_values(_priority_column, kind='stable')
+        rank: np.ndarray = df.groupby(self.strata, observed=True, dropna=False, sort=False).cumcount().to_numpy()
+
+        if isinstance(self.n, dict):
+            limits = pd.Series(list(self.n.values()), index=self._get_strata_index(list(self.n)), dtype='Int64')
+            is_kept: np.ndarray = (rank < self._lookup(df, limits)).fillna(False).to_numpy(dtype=bool)
+        else:
+            is_kept = rank < self.n
+
+        return df[is_kept]
+
+    def _drop_rejected(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Drops the rows of `df` which cannot enter the sample: those whose priority is above the largest
+            priority kept in their stratum, once that stratum is full."""
+        if (self._kept is None) or (len(self._kept) == 0):
+            return df
+
+        kept_strata = self._kept.groupby(self.strata, observed=True, dropna=False)[_priority_column]
+        full_strata: pd.Series = kept_strata.max()[kept_strata.size() >= self._get_limits(kept_strata.size())]
+        if (len(full_strata) == 0):
+            return df
+
+        thresholds: pd.Series = self._lookup(df, full_strata.astype('UInt64'))
+
+        return df[(pd.Series(df[_priority_column].to_numpy(), index=df.index, dtype='UInt64') < thresholds)
+                    .fillna(True).to_numpy(dtype=bool)]
+
+    def _get_limits(self, strata_sizes: pd.Series) -> np.ndarray:
+        if not isinstance(self.n, dict):
+            return np.full(len(strata_sizes), self.n)
+
+        return np.array([self.n.get(key, 0) for key in strata_sizes.index])
+
+    def _add_candidates(self, df: pd.DataFrame) -> 'StratifiedSample':
+        df = self._drop_rejected(df)
+        if (len(df) > 0) or (self._kept is None):
+            self._kept = self._select(pd.concat([self._kept, df]) if (self._kept is not None) else df)
+
+        return self
+
+    def update(self, df: pd.DataFrame, source: str = None) -> 'StratifiedSample':
+        """Adds the rows of a chunk `df` (a DataFrame or pyarrow Table / RecordBatch) read from `source`
+            (e.g. a file path), whose chunks must be added in order. Returns the sample."""
+        if isinstance(df, pa.RecordBatch):
+            df = pa.Table.from_batches([df])
+        if isinstance(df, pa.Table):
+            df = tur.json_table_to_df(df.replace_schema_metadata())    # stored pandas metadata may list unread columns
+
+        row_offset: int = self._source_rows.get(source, 0)
+        self._source_rows[source] = row_offset + len(df)
+        self.rows_seen += len(df)
+        columns: list = list(df.columns) if (self.columns is None) \
+                            else [column for column in dict.fromkeys(self.columns + self.strata) if (column in df.columns)]
+        keys: pd.Series = _get_sample_keys(df, self.key_column, source=source, row_offset=row_offset)
+        df = df[columns].assign(**{_priority_column: get_sample_priorities(keys, seed=self.seed)})
+
+        return self._add_candidates(df)
+
+    def merge(self, other: 'StratifiedSample') -> 'StratifiedSample':
+        """Adds the rows kept by `other`, a sample with the same strata, `n` and seed built over other inputs.
+            Returns the sample."""
+        if (other.strata != self.strata) or (other.seed != self.seed) or (other.n != self.n):
+            raise ValueError("StratifiedSample.merge(): samples must have the same strata, n and seed")
+
+        self.rows_seen += other.rows_seen
+
+        return self._add_candidates(other._kept) if (other._kept is not None) else self
+
+    def to_df(self) -> pd.DataFrame:
+        """Returns the sampled rows, ordered by stratum and then priority (so the same rows always come
+            in the same order), with a new RangeIndex."""
+        if (self._kept is None):
+            return pd.DataFrame(columns=self.columns)
+
+        return self._kept.sort_values(self.strata + [_priority_column], kind='stable') \
+                    .drop(columns=_priority_column).reset_index(drop=True)
+
+
+def _fill_data_source(df: pd.DataFrame, data_source: str) -> pd.DataFrame:
+    """Fills missing `data_source` values with `data_source` (as `tweet_turing_ingest.ingest_inputs` does)."""
+    if (data_source is None):
+        return df
+    if ('data_source' not in df.columns):
+        return df.assign(data_source=data_source)
+
+    return df.assign(data_source=df['data_source'].fillna(data_source))
+
+
+def _get_read_columns(columns: list, strata: list, available_columns: list, key_column: str = None) -> list:
+    """Returns the columns to read from an input: the requested ones, the strata and the key columns."""
+    if (columns is None):
+        return None
+
+    key_columns: list = [key_column] if (key_column is not None) else sample_key_columns
+    wanted: list = list(dict.fromkeys(columns + strata + key_columns))
+
+    return [column for column in wanted if (column in available_columns)]
+
+
+def _sample_inputs(inputs: list, sample_input, strata: list, n, seed: int, key_column: str, columns: list,
+                    max_workers: int) -> pd.DataFrame:
+    """Samples each input with `sample_input(input, sample)` into its own `StratifiedSample`, using up to
+        `max_workers` threads, then merges them. Returns the sampled rows."""
+    def sample_one(one_input) -> StratifiedSample:
+        return sample_input(one_input, StratifiedSample(strata, n, seed=seed, key_column=key_column, columns=columns))
+
+    if (max_workers > 1) and (len(inputs) > 1):
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            input_samples: list = list(executor.map(sample_one, inputs))
+    else:
+        input_samples = [sample_one(one_input) for one_input in inputs]
+
+    sample = StratifiedSample(strata, n, seed=seed, key_column=key_column, columns=columns)
+    for input_sample in input_samples:
+        sample.merge(input_sample)
+
+    logger.info(f"_sample_inputs(): sampled {len(sample._kept) if (sample._kept is not None) else 0} "
+                f"of {sample.rows_seen} rows from {len(inputs)} inputs")
+
+    return sample.to_df()
+
+
+@instrumented('merge')
+def sample_dataframes(chunks, strata: list, n, seed: int = default_sample_seed, columns: list = None,
+                        key_column: str = None) -> pd.DataFrame:
+    """Samples an iterable of DataFrames (or pyarrow Tables / RecordBatches), e.g. the chunks of a larger
+        file, keeping `n` rows per stratum of the `strata` columns (see `StratifiedSample`).
+        Only `columns` are kept (all columns if None). Returns a DataFrame of the sampled rows."""
+    sample = StratifiedSample(strata, n, seed=seed, key_column=key_column, columns=columns)
+    for chunk in chunks:
+        sample.update(chunk)
+
+    return sample.to_df()
+
+
+@instrumented('merge', bytes_in=file_sizes('file_list'))
+def sample_csv_files(file_list: list, strata: list, n, seed: int = default_sample_seed, columns: list = None,
+                        key_column: str = None, data_source: str = None, chunk_size: int = sample_chunk_size,
+                        max_workers: int = 1) -> pd.DataFrame:
+    """Samples troll CSV files (see `merge_csv_files`), reading each in chunks of `chunk_size` rows and only
+        the requested `columns` (plus strata and key). `data_source` fills missing `data_source` values, e.g.
+        `strata=['data_source']` with `data_source='Troll'`. Files are read by up to `max_workers` threads.
+        Returns a DataFrame of the sampled rows, the same for any `chunk_size` or `max_workers`."""
+    def sample_file(file_path: str, sample: StratifiedSample) -> StratifiedSample:
+        usecols: list = _get_read_columns(columns, strata, list(tur.csv_column_dtype_mapping), key_column)
+        with pd.read_csv(file_path, encoding='utf-8', dtype=tur.csv_column_dtype_mapping, usecols=usecols,
+                            chunksize=chunk_size) as reader:
+            for chunk in reader:
+                sample.update(_fill_data_source(chunk, data_source), source=file_path)
+
+        return sample
+
+    return _sample_inputs(file_list, sample_file, strata, n, seed, key_column, columns, max_workers)
+
+
+@instrumented('merge', bytes_in=file_sizes('file_list'))
+def sample_json_files(file_list: list, strata: list, n, seed: int = default_sample_seed, columns: list = None,
+                        key_column: str = None, data_source: str = None, chunk_size: int = sample_chunk_size,
+                        max_workers: int = 1) -> pd.DataFrame:
+    """Samples JSON files of tweets, streaming each file's records (see `iter_flat_json_batches`) in batches
+        of `chunk_size`, flattened to the columns of `authentic_df_eda_dtype_mapping`. See `sample_csv_files`."""
+    def sample_file(file_path: str, sample: StratifiedSample) -> StratifiedSample:
+        records = tur.iter_json_records([file_path])
+        for table in tur.iter_flat_json_batches(records, batch_size=chunk_size):
+            read_columns: list = _get_read_columns(columns, strata, table.column_names, key_column)
+            table = table.select(read_columns) if (read_columns is not None) else table
+            sample.update(_fill_data_source(tur.json_table_to_df(table), data_source), source=file_path)
+
+        return sample
+
+    return _sample_inputs(file_list, sample_file, strata, n, seed, key_column, columns, max_workers)
+
+
+@instrumented('merge')
+def sample_storage_objects(backend, object_list: list, strata: list, n, seed: int = default_sample_seed,
+                            columns: list = None, key_column: str = None, data_source: str = None,
+                            chunk_size: int = sample_chunk_size, max_workers: int = 1) -> pd.DataFrame:
+    """Samples the CSV and JSON objects of a storage backend (see tweet_turing_storage.py), e.g. the GCP
+        bucket instead of `merge_gcp_json_files` / `merge_csv_files`. Objects are streamed, not downloaded
+        whole. See `sample_csv_files`."""
+    def sample_object(object_name: str, sample: StratifiedSample) -> StratifiedSample:
+        if object_name.endswith('.csv'):
+            usecols: list = _get_read_columns(columns, strata, list(tur.csv_column_dtype_mapping), key_column)
+            with backend.open_input(object_name) as fh:
+                with pd.read_csv(fh, encoding='utf-8', dtype=tur.csv_column_dtype_mapping, usecols=usecols,
+                                    chunksize=chunk_size) as reader:
+                    for chunk in reader:
+                        sample.update(_fill_data_source(chunk, data_source), source=object_name)
+        elif object_name.endswith('.json'):
+            for table in tur.iter_flat_json_batches(backend.iter_json_records([object_name]), batch_size=chunk_size):
+                read_columns: list = _get_read_columns(columns, strata, table.column_names, key_column)
+                table = table.select(read_columns) if (read_columns is not None) else table
+                sample.update(_fill_data_source(tur.json_table_to_df(table), data_source), source=object_name)
+        else:
+            raise ValueError(f"sample_storage_objects(): unsupported object type '{object_name}', expected .csv or .json")
+
+        return sample
+
+    return _sample_inputs(object_list, sample_object, strata, n, seed, key_column, columns, max_workers)
+
+
+@instrumented('merge')
+def sample_parquet_snapshot(root_path: str, strata: list, n, seed: int = default_sample_seed, columns: list = None,
+                            key_column: str = None, filters = None, filesystem: pa_fs.FileSystem = None,
+                            chunk_size: int = sample_chunk_size, max_workers: int = 1) -> pd.DataFrame:
+    """Samples a parquet snapshot (see `write_parquet_snapshot`) or parquet file, streaming the record batches
+        of each file, with only the requested `columns` (plus strata and key) read and only the partitions and
+        row groups matching `filters` (see `read_parquet_snapshot`). Files are read by up to `max_workers` threads.
+        Returns a DataFrame of the sampled rows, the same for any `chunk_size` or `max_workers`."""
+    if (filters is not None) and not isinstance(filters, ds.Expression):
+        filters = pq.filters_to_expression(filters)
+
+    dataset: ds.Dataset = tur.get_parquet_snapshot_dataset(root_path, filesystem=filesystem, unify_schemas=True)
+    read_columns: list = _get_read_columns(columns, strata, dataset.schema.names, key_column)
+
+    def sample_fragment(fragment, sample: StratifiedSample) -> StratifiedSample:
+        for batch in fragment.to_batches(schema=dataset.schema, columns=read_columns, filter=filters,
+                                            batch_size=chunk_size):
+            sample.update(pa.Table.from_batches([batch]), source=fragment.path)
+
+        return sample
+
+    return _sample_inputs(list(dataset.get_fragments(filter=filters)), sample_fragment, strata, n, seed,
+                            key_column, columns, max_workers)
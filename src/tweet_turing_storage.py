@@ -0,0 +1,423 @@
+# tweet_turing_storage.py
+#   One interface over where the project's data is stored: the GCP cloud storage bucket
+#   (`GcsBackend`) or a local directory laid out like the bucket (`LocalBackend`), so that the
+#   same code runs against the bucket or, offline, against a local copy of it.
+#
+#   Example:
+#       backend = get_storage_backend('local')      # or get_storage_backend('gcs')
+#       troll_df = backend.merge_csv(backend.list_objects(gcp_data_paths['troll'], suffix='.csv'))
+#       filesystem, root_path = backend.get_arrow_location(gcp_snapshot_paths['parq_snapshot'] + "tweets/")
+#       snapshot_df = tur.read_parquet_snapshot(root_path, filesystem=filesystem)
+#
+#   Objects are named as in the bucket (e.g. `raw/troll/IRAhandle_tweets_1.csv`, see `gcp_data_paths`
+#   and `gcp_snapshot_paths`), and `LocalBackend` stores each object at that relative path under its
+#   root directory (`local_bucket_path` by default). `copy_objects` mirrors a prefix of the bucket to
+#   local disk. `LocalBackend` reads Parquet and Arrow IPC files through memory maps.
+#
+#   Objects may carry a content encoding (gzip, see `compress=True`) and custom metadata, stored by
+#   GCS with the object and by `LocalBackend` in a hidden sidecar file next to it (`.<name>.meta.json`),
+#   written before the object itself is replaced.
+#
+
+# imports from Python standard library
+import contextlib
+import gzip
+import io
+import json
+import logging
+import os
+import shutil
+
+# imports requiring installation
+import pandas as pd                         # pip install pandas
+import pyarrow as pa                        # pip install pyarrow
+import pyarrow.fs as pa_fs
+
+# imports from tweet_turing.py and its helper modules
+import tweet_turing as tur
+from tweet_turing_cache import GcpObjectCache
+from tweet_turing_dedup import TweetIdIndex
+from tweet_turing_json import decode_json, convert_records
+from tweet_turing_metrics import instrumented, count_io
+from tweet_turing_paths import gcp_bucket_name, gcp_key_file, gcp_project_name, local_bucket_path
+
+
+# module-level definitions
+logger = logging.getLogger(__name__)
+
+storage_backend_kinds: list = ['gcs', 'local']
+
+#   suffix of the sidecar files holding the content encoding and metadata of `LocalBackend` objects
+_metadata_file_suffix: str = ".meta.json"
+
+#   object metadata key recording the state of the source an object was copied from (see `copy_objects`)
+_source_state_key: str = "tweet_turing-source-state"
+
+
+class StorageBackend:
+    """Base class of the storage backends. Subclasses implement `list_object_states`, `open_input`,
+        `open_output`, `get_metadata` and `get_arrow_location`; the readers, writers and merges are built on those."""
+    max_workers: int = 1
+
+    def list_object_states(self, prefix: str = "") -> dict:
+        """Returns {object name: state} for every object whose name starts with `prefix`, where state is a
+            dict which changes whenever the object is overwritten (e.g. size and generation / mtime)."""
+        raise NotImplementedError
+
+    def open_input(self, object_name: str):
+        """Opens the object for reading as a binary file (a context manager)."""
+        raise NotImplementedError
+
+    def open_output(self, object_name: str, content_encoding: str = None, metadata: dict = None):
+        """Opens the object for writing as a binary file (a context manager). The object is replaced when
+            the file is closed, and left unchanged if an error is raised inside the `with` block.
+            `content_encoding='gzip'` records that the bytes written are gzip-compressed (they are then
+            decompressed by `open_input`), and `metadata` is stored with the object (str values)."""
+        raise NotImplementedError
+
+    def get_metadata(self, object_name: str) -> dict:
+        """Returns the metadata stored with the object by `open_output`, or an empty dict if there is none
+            (or no such object)."""
+        raise NotImplementedError
+
+    def get_arrow_location(self, object_name: str) -> tuple:
+        """Returns (pyarrow filesystem, path) of the object or prefix, e.g. for `tweet_turing.read_parquet_snapshot`,
+            `write_parquet_snapshot` or the ingestion functions (`filesystem=...`)."""
+        raise NotImplementedError
+
+    @instrumented('list')
+    def list_objects(self, prefix: str = "", suffix: str = None) -> list:
+        """Returns the sorted names of the objects under `prefix`, optionally only those ending with `suffix`
+            (e.g. '.csv'). Returns an empty list if there are none."""
+        return sorted(name for name in self.list_object_states(prefix) if (suffix is None) or name.endswith(suffix))
+
+    @instrumented('download', rows=None)
+    def read_bytes(self, object_name: str) -> bytes:
+        with self.open_input(object_name) as fh:
+            object_bytes: bytes = fh.read()
+        count_io(bytes_in=len(object_bytes))
+
+        return object_bytes
+
+    @instrumented('parse')
+    def read_json(self, object_name: str, json_backend: str = None, record_class: type = None):
+        """Reads and decodes a JSON object, see `tweet_turing.load_local_json`."""
+        json_data = decode_json(self.read_bytes(object_name), backend=json_backend)
+
+        return convert_records(json_data, record_class) if (record_class is not None) else json_data
+
+    def iter_json_records(self, object_list: list):
+        """Yields the records of each JSON object in `object_list` one at a time (see `tweet_turing.iter_json_records`)."""
+        for object_name in object_list:
+            with self.open_input(object_name) as fh:
+                yield from tur.iter_json_array(io.TextIOWrapper(fh, encoding='utf-8'))
+
+    @instrumented('parse')
+    def read_csv_df(self, object_name: str, compact: bool = False) -> pd.DataFrame:
+        """Reads a troll CSV object, with the column types of `tweet_turing.merge_csv_files`."""
+        with self.open_input(object_name) as fh:
+            return pd.read_csv(fh, encoding='utf-8', low_memory=False,
+                                dtype=tur.csv_column_compact_dtype_mapping if compact else tur.csv_column_dtype_mapping)
+
+    @instrumented('parse')
+    def read_parquet_df(self, object_name: str, columns: list = None, compact: bool = False,
+                        parse_dates: bool = False) -> pd.DataFrame:
+        """Reads a parquet object (only `columns`, if provided), see `tweet_turing.load_local_json_parquet`."""
+        filesystem, path = self.get_arrow_location(object_name)
+        df: pd.DataFrame = pd.read_parquet(path, engine='pyarrow', columns=columns, filesystem=filesystem)
+
+        if parse_dates:
+            df = tur.parse_date_columns(df)
+
+        return tur.compact_dtypes(df) if compact else df
+
+    @instrumented('parse')
+    def read_arrow_table(self, object_name: str) -> pa.Table:
+        """Reads an Arrow IPC (Feather v2) object as a pyarrow Table."""
+        filesystem, path = self.get_arrow_location(object_name)
+
+        with filesystem.open_input_file(path) as fh:
+            return pa.ipc.open_file(fh).read_all()
+
+    def load_input_df(self, object_name: str) -> pd.DataFrame:
+        """Loads one raw input object, a troll CSV or a JSON file of tweets, as in
+            `tweet_turing_ingest.load_local_input` (usable as its `load_function`)."""
+        if object_name.endswith('.csv'):
+            return self.read_csv_df(object_name)
+        if object_name.endswith('.json'):
+            records = self.iter_json_records([object_name])
+            return tur.json_table_to_df(pa.concat_tables(tur.iter_flat_json_batches(records)))
+
+        raise ValueError(f"load_input_df(): unsupported object type '{object_name}', expected .csv or .json")
+
+    def _fetch_objects(self, object_list: list, fetch_function) -> list:
+        """Reads each object with `fetch_function(object_name)`, concurrently with `max_workers` threads and
+            retries (see `tweet_turing.fetch_objects`). Results are in `object_list` order."""
+        return tur.fetch_objects(object_list, fetch_function, max_workers=self.max_workers)
+
+    @instrumented('merge')
+    def merge_csv(self, object_list: list, compact: bool = False, parse_dates: bool = False,
+                    id_index: TweetIdIndex = None, keep: str = 'first') -> pd.DataFrame:
+        """Reads and concatenates troll CSV objects, see `tweet_turing.merge_csv_files`.
+            Returns None if `object_list` is empty."""
+        if (len(object_list) == 0):
+            return None
+
+        csv_dfs: list = self._fetch_objects(object_list, lambda name: self.read_csv_df(name, compact=compact))
+
+        if parse_dates:
+            csv_dfs = [tur.parse_date_columns(csv_df) for csv_df in csv_dfs]
+        if (id_index is not None):
+            csv_dfs = tur._drop_duplicates_in_order(csv_dfs, tur.drop_duplicate_tweets, id_index, keep)
+
+        return tur._concat_compact(csv_dfs) if compact else pd.concat(csv_dfs)
+
+    @instrumented('merge')
+    def merge_json(self, object_list: list, id_index: TweetIdIndex = None, keep: str = 'first',
+                    json_backend: str = None, record_class: type = None) -> list:
+        """Reads and concatenates JSON objects, see `tweet_turing.merge_json_files`."""
+        json_datas: list = self._fetch_objects(object_list, lambda name: self.read_json(name, json_backend=json_backend))
+
+        if (id_index is not None):
+            json_datas = tur._drop_duplicates_in_order(json_datas, tur._drop_duplicate_records, id_index, keep)
+
+        result: list = []
+        for json_data in json_datas:
+            result.extend(convert_records(json_data, record_class) if (record_class is not None) else json_data)
+
+        return result
+
+    @instrumented('upload', rows=None)
+    def write_json(self, object_name: str, json_data, output_format: str = 'json', compress: bool = False) -> None:
+        """Writes JSON data record by record, see `tweet_turing.set_gcp_object_from_json`."""
+        with self.open_output(object_name, content_encoding='gzip' if compress else None) as fh:
+            byte_stream = gzip.GzipFile(fileobj=fh, mode='wb', compresslevel=tur.gcp_upload_compress_level) \
+                            if compress else fh
+            text_fh = io.TextIOWrapper(byte_stream, encoding='utf-8')
+            record_count: int = tur.write_json_records(json_data, text_fh, output_format=output_format)
+
+            text_fh.detach()
+            if compress:
+                byte_stream.close()
+            count_io(rows=record_count, bytes_out=fh.tell())
+
+    @instrumented('upload', rows=lambda result, arguments: len(arguments['df']))
+    def write_parquet_df(self, object_name: str, df: pd.DataFrame) -> None:
+        """Writes `df` as a parquet object, see `tweet_turing.set_gcp_object_from_df_as_parq`."""
+        with self.open_output(object_name) as fh:
+            df.to_parquet(fh, engine='pyarrow', index=False, compression='gzip')
+            count_io(bytes_out=fh.tell())
+
+
+class GcsBackend(StorageBackend):
+    """Objects in a GCP cloud storage bucket, read through `cache` (a `GcpObjectCache`) if one is provided.
+        The pyarrow filesystem for `get_arrow_location` is authenticated with `key_file` on first use."""
+
+    def __init__(self, bucket, cache: GcpObjectCache = None, key_file: str = gcp_key_file,
+                    max_workers: int = tur.gcp_fetch_max_workers):
+        self.bucket = bucket
+        self.cache: GcpObjectCache = cache
+        self.key_file: str = key_file
+        self.max_workers = max_workers
+        self._arrow_filesystem: pa_fs.FileSystem = None
+
+    def list_object_states(self, prefix: str = "") -> dict:
+        """See `tweet_turing_ingest.get_gcp_object_states`."""
+        blob_list = self.bucket.client.list_blobs(bucket_or_name=self.bucket.name, prefix=prefix)
+
+        return {
+            blob.name: {'size': blob.size, 'generation': blob.generation}
+            for blob in blob_list if (blob.name != prefix) and not blob.name.endswith("/")
+            }
+
+    def open_input(self, object_name: str):
+        if (self.cache is not None):
+            gcp_object = self.bucket.get_blob(object_name)     # metadata needed for cache key
+            if (gcp_object is None):
+                raise FileNotFoundError(f"GcsBackend.open_input(): no object '{object_name}' in bucket '{self.bucket.name}'")
+            return open(self.cache.get_path(gcp_object), mode='rb')
+
+        return tur.get_gcp_object_as_blob(self.bucket, object_name).open("rb")
+
+    def open_output(self, object_name: str, content_encoding: str = None, metadata: dict = None):
+        gcp_object = self.bucket.blob(object_name)
+        gcp_object.content_encoding = content_encoding
+        gcp_object.metadata = metadata
+
+        return gcp_object.open("wb", chunk_size=tur.gcp_upload_chunk_size, ignore_flush=True)
+
+    def get_metadata(self, object_name: str) -> dict:
+        gcp_object = self.bucket.get_blob(object_name)
+
+        return dict(gcp_object.metadata or {}) if (gcp_object is not None) else {}
+
+    def get_arrow_location(self, object_name: str) -> tuple:
+        if (self._arrow_filesystem is None):
+            self._arrow_filesystem = tur.get_gcp_arrow_filesystem(key_file=self.key_file)
+
+        return (self._arrow_filesystem, f"{self.bucket.name}/{object_name}")
+
+    def read_json(self, object_name: str, json_backend: str = None, record_class: type = None):
+        return tur.get_gcp_object_as_json(self.bucket, object_name, cache=self.cache, json_backend=json_backend,
+                                            record_class=record_class)
+
+    def read_csv_df(self, object_name: str, compact: bool = False) -> pd.DataFrame:
+        if (self.cache is not None):
+            return super().read_csv_df(object_name, compact=compact)
+
+        return tur.get_gcp_object_as_csv_df(self.bucket, object_name, compact=compact)
+
+    def read_parquet_df(self, object_name: str, columns: list = None, compact: bool = False,
+                        parse_dates: bool = False) -> pd.DataFrame:
+        if (columns is not None):
+            return super().read_parquet_df(object_name, columns=columns, compact=compact, parse_dates=parse_dates)
+
+        return tur.get_gcp_object_from_parq_as_df(self.bucket, object_name, cache=self.cache, compact=compact,
+                                                    parse_dates=parse_dates)
+
+    def write_json(self, object_name: str, json_data, output_format: str = 'json', compress: bool = False) -> None:
+        tur.set_gcp_object_from_json(self.bucket, object_name, json_data, output_format=output_format,
+                                        compress=compress)
+
+    def write_parquet_df(self, object_name: str, df: pd.DataFrame) -> None:
+        tur.set_gcp_object_from_df_as_parq(self.bucket, object_name, df)
+
+
+class LocalBackend(StorageBackend):
+    """Objects stored as files under `root_path`, at their object name as relative path (so the layout of
+        the bucket, e.g. `gcp_data_paths`, maps onto local directories). Parquet and Arrow IPC files are
+        read through memory maps (`use_mmap`), and objects are written to a temporary file first."""
+
+    def __init__(self, root_path: str = local_bucket_path, use_mmap: bool = True, max_workers: int = 1):
+        self.root_path: str = os.path.abspath(root_path)
+        self.filesystem: pa_fs.LocalFileSystem = pa_fs.LocalFileSystem(use_mmap=use_mmap)
+        self.max_workers = max_workers
+
+    def get_path(self, object_name: str) -> str:
+        """Returns the local file path of an object (or prefix)."""
+        return os.path.join(self.root_path, *object_name.split("/"))
+
+    def list_object_states(self, prefix: str = "") -> dict:
+        """Lists files as GCS lists objects: by name prefix, recursively, and without directories.
+            Temporary files (starting with '.') are skipped."""
+        prefix_dir: str = prefix if prefix.endswith("/") else prefix.rpartition("/")[0]
+        object_states: dict = {}
+
+        for (dir_path, dir_names, file_names) in os.walk(self.get_path(prefix_dir)):
+            dir_names[:] = [d for d in dir_names if not d.startswith(".")]
+            rel_dir: str = os.path.relpath(dir_path, self.root_path).replace(os.sep, "/")
+            for file_name in file_names:
+                object_name: str = file_name if (rel_dir == ".") else f"{rel_dir}/{file_name}"
+                if file_name.startswith(".") or not object_name.startswith(prefix):
+                    continue
+                file_stat: os.stat_result = os.stat(os.path.join(dir_path, file_name))
+                object_states[object_name] = {'size': file_stat.st_size, 'mtime': file_stat.st_mtime_ns}
+
+        return object_states
+
+    def _get_metadata_path(self, object_name: str) -> str:
+        path: str = self.get_path(object_name)
+        return os.path.join(os.path.dirname(path), f".{os.path.basename(path)}{_metadata_file_suffix}")
+
+    def _read_metadata_file(self, object_name: str) -> dict:
+        """Returns the sidecar of an object, or None if it has none (e.g. a file copied in by hand)."""
+        try:
+            with open(self._get_metadata_path(object_name), mode='r', encoding='utf-8') as fh:
+                return json.load(fh)
+        except FileNotFoundError:
+            return None
+
+    def open_input(self, object_name: str):
+        """Opens the file for reading. Files written with `content_encoding='gzip'` (e.g. `compress=True`)
+            are decompressed transparently, as GCS does for objects stored with `Content-Encoding: gzip`.
+            Raises ValueError for gzip data without a sidecar, whose content encoding is unknown."""
+        fh = open(self.get_path(object_name), mode='rb')
+        metadata_file: dict = self._read_metadata_file(object_name)
+
+        if (metadata_file is None) and (fh.peek(2)[:2] == b"\x1f\x8b"):
+            fh.close()
+            raise ValueError(f"LocalBackend.open_input(): object '{object_name}' holds gzip data but has no "
+                                f"'{_metadata_file_suffix}' sidecar recording its content encoding; rewrite it with open_output")
+        if (metadata_file is not None) and (metadata_file.get('content_encoding') == 'gzip'):
+            return gzip.GzipFile(fileobj=fh, mode='rb')
+
+        return fh
+
+    def get_metadata(self, object_name: str) -> dict:
+        return (self._read_metadata_file(object_name) or {}).get('metadata', {})
+
+    @contextlib.contextmanager
+    def open_output(self, object_name: str, content_encoding: str = None, metadata: dict = None):
+        """Writes the object and its sidecar to temporary files, then moves the sidecar into place before
+            the data, so that the data is never visible next to a missing or outdated sidecar. Every object
+            written here has a sidecar, even without a content encoding or metadata."""
+        path: str = self.get_path(object_name)
+        temp_path: str = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.tmp")
+        metadata_path: str = self._get_metadata_path(object_name)
+        metadata_temp_path: str = f"{metadata_path}.tmp"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        try:
+            with open(temp_path, mode='wb') as fh:
+                yield fh
+            with open(metadata_temp_path, mode='w', encoding='utf-8') as fh:
+                json.dump({'content_encoding': content_encoding, 'metadata': metadata or {}}, fh)
+            os.replace(metadata_temp_path, metadata_path)
+            os.replace(temp_path, path)
+        except BaseException:
+            for leftover_path in [temp_path, metadata_temp_path]:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(leftover_path)
+            raise
+
+    def get_arrow_location(self, object_name: str) -> tuple:
+        return (self.filesystem, self.get_path(object_name).replace(os.sep, "/"))
+
+
+def get_storage_backend(kind: str = 'gcs', **kwargs) -> StorageBackend:
+    """Creates a storage backend: `kind='local'` for a `LocalBackend` (keyword arguments as its constructor),
+        or `kind='gcs'` for a `GcsBackend` of the project bucket (see `connect_gcs_backend`)."""
+    if (kind == 'local'):
+        return LocalBackend(**kwargs)
+    if (kind == 'gcs'):
+        return connect_gcs_backend(**kwargs)
+
+    raise ValueError(f"get_storage_backend(): unknown storage backend '{kind}', expected one of {storage_backend_kinds}")
+
+
+def connect_gcs_backend(project_name: str = gcp_project_name, bucket_name: str = gcp_bucket_name,
+                        key_file: str = gcp_key_file, cache: GcpObjectCache = None,
+                        max_workers: int = tur.gcp_fetch_max_workers) -> GcsBackend:
+    """Connects to the GCP bucket (see `tweet_turing.get_gcp_storage_client`) and returns a `GcsBackend`.
+        Raises a ValueError if the client cannot be created, e.g. without a valid `key_file`."""
+    storage_client = tur.get_gcp_storage_client(project_name=project_name, key_file=key_file, pool_size=max_workers)
+    if isinstance(storage_client, int):
+        raise ValueError(f"connect_gcs_backend(): could not create a storage client with key_file='{key_file}'")
+
+    return GcsBackend(tur.get_gcp_bucket(storage_client, bucket_name), cache=cache, key_file=key_file,
+                        max_workers=max_workers)
+
+
+@instrumented('download', rows=lambda result, arguments: len(result))
+def copy_objects(source: StorageBackend, destination: StorageBackend, prefix: str = "",
+                    overwrite: bool = False) -> list:
+    """Copies the objects under `prefix` from `source` to `destination`, e.g. from the bucket to a
+        `LocalBackend` to work offline. Objects are copied decoded (e.g. gzip-encoded GCS objects are stored
+        uncompressed). Each copy records the state of its source object (its generation, or size and mtime)
+        in its metadata, and objects already copied from the current state are skipped unless `overwrite`
+        is True. Returns the names of the objects copied."""
+    destination_states: dict = destination.list_object_states(prefix)
+    copied: list = []
+
+    for (object_name, state) in sorted(source.list_object_states(prefix).items()):
+        source_state: str = json.dumps(state, sort_keys=True)
+        if not overwrite and (object_name in destination_states) \
+                and (destination.get_metadata(object_name).get(_source_state_key) == source_state):
+            continue
+
+        with source.open_input(object_name) as in_fh, \
+                destination.open_output(object_name, metadata={_source_state_key: source_state}) as out_fh:
+            shutil.copyfileobj(in_fh, out_fh, length=tur.gcp_upload_chunk_size)
+        copied.append(object_name)
+
+    return copied
@@ -9,17 +9,23 @@
 #    - a function from external package `tldextract` to extract top-level domain from a URL
 
 
+import functools
 import re
+import numpy as np
 import pandas as pd
 import tldextract       # Source: https://github.com/john-kurkowski/tldextract
 
-from tweet_counter import count_tweet   
+from tweet_counter import count_tweet, URL_MATCH, TWITTER_URL_SIZE, TWITTER_STANDARD_CHAR_LIMIT
     # Source: https://github.com/nottrobin/tweet-counter
     #   Version: 0.1.0
     #   Note: on Windows, above package requires manual installation (`pip install` generates error)
+from tld import get_tld     # installed with tweet_counter
 
+from tweet_turing_metrics import instrumented
 
-__all__ = ['char_count', 'retweet_handle', 'reply_handle', 'explode_url']
+
+__all__ = ['char_count', 'retweet_handle', 'reply_handle', 'explode_url',
+           'char_count_column', 'retweet_handle_column', 'reply_handle_column', 'explode_url_column']
 
 
 # constants
@@ -66,6 +72,19 @@ AT_SIGNS: str = "[@\uFF20]"
 VALID_REPLY_PATTERN_STR = "^(?:" + UNICODE_SPACES + "|" + DIRECTIONAL_CHARACTERS + ")*" + AT_SIGNS + "([a-z0-9_]{1,20})"
 VALID_REPLY_PATTERN = re.compile(VALID_REPLY_PATTERN_STR, flags=re.IGNORECASE)
 
+#   number of tweets whose text is encoded together when counting characters in bulk
+CHAR_COUNT_CHUNK_SIZE: int = 100_000
+
+#   URL parser which never goes to the network: `suffix_list_urls=()` makes tldextract use the
+#   public suffix list snapshot bundled with (and pinned by) the installed tldextract version
+TLD_EXTRACTOR = tldextract.TLDExtract(suffix_list_urls=(), cache_dir=None)
+
+#   max number of distinct URLs remembered by `explode_url` / `explode_url_column`
+EXPLODE_URL_CACHE_SIZE: int = 262_144
+
+#   keys of the dict returned by `explode_url` (and columns returned by `explode_url_column`)
+EXPLODE_URL_FIELDS: tuple = ('subdomain', 'domain', 'tld', 'registered_domain')
+
 
 # functions
 ##########################
@@ -80,35 +99,91 @@ def char_count(tweet_series: pd.Series) -> int:
 def retweet_handle(tweet_series: pd.Series) -> str:
     """Returns the Twitter handle of the parent author of a retweeted tweet.
         E.g. if @foo is retweeting a tweet by @bar with the text `RT @bar What is your name?`, returns `bar`."""
-    handle: str = _extract_first_handle_after_RT(tweet_series['content'])
-    if (handle is None):
-        return None
-    else:
-        return handle.lstrip('@')
+    return _extract_first_handle_after_RT(tweet_series['content'])
 
 
 def reply_handle(tweet_series: pd.Series) -> str:
     """Returns the Twitter handle of the parent author of a reply tweet.
         E.g. if @foo is replying to a tweet by @bar with the text `@bar What is your quest?`, returns `bar`."""
-    handle: str = _extract_reply_screenname(tweet_series['content'])
-    if (handle is None):
-        return None
-    else:
-        return handle.lstrip('@')
+    return _extract_reply_screenname(tweet_series['content'])
 
 
 def explode_url(url_text: str) -> dict:
     """Breaks apart a string containing only a fully-qualified URL.
         Returns the pieces of the URL as a dict. Refer to tldextract docs
-        for more information."""
-    url_named_tuple: tldextract.ExtractResult = tldextract.extract(url_text)
+        for more information. Parsing is offline and memoized (see `TLD_EXTRACTOR`)."""
+    return dict(zip(EXPLODE_URL_FIELDS, _explode_url_cached(url_text)))
+
+
+@instrumented('feature')
+def explode_url_column(urls) -> pd.DataFrame:
+    """Column-level version of `explode_url`. Each distinct URL in `urls` is parsed only once
+        (through the same bounded cache used by `explode_url`) and the results are mapped back.
+        Returns a DataFrame aligned to the input with "string" columns `subdomain`, `domain`,
+        `tld` and `registered_domain`; missing URLs yield NA in every column."""
+    url_series: pd.Series = pd.Series(urls)
+    codes, unique_urls = pd.factorize(url_series)   # missing values get code -1
+
+    # one row per distinct URL, plus a trailing all-NA row which code -1 picks up
+    unique_parts: list = [_explode_url_cached(url) for url in unique_urls]
+    unique_parts.append((pd.NA,) * len(EXPLODE_URL_FIELDS))
+    parts_by_field: list = list(zip(*unique_parts))
+
+    return pd.DataFrame({
+        field: pd.array(np.asarray(field_values, dtype=object)[codes], dtype="string")
+        for (field, field_values) in zip(EXPLODE_URL_FIELDS, parts_by_field)
+        }, index=url_series.index)
+
+
+@instrumented('feature')
+def char_count_column(texts) -> pd.Series:
+    """Column-level version of `char_count`. Accepts a DataFrame (or its `content` column).
+        Matches `count_tweet` exactly, but only tweets containing a '.' (i.e. that could contain a URL)
+        are examined one at a time; counting of wide characters is vectorized over the whole column.
+        Returns an int64 Series aligned to the input; missing content counts as 0."""
+    content: pd.Series = _get_text_series(texts)
+    text_array: np.ndarray = content.to_numpy(dtype=object, na_value="")
+
+    # mirror `count_tweet`: valid URLs are removed from the text and counted at a fixed width
+    url_counts = np.zeros(len(text_array), dtype='int64')
+    may_have_url: np.ndarray = content.str.contains(".", regex=False, na=False).to_numpy(dtype=bool)
+
+    for i in np.flatnonzero(may_have_url):
+        urls: list = [url for url in URL_MATCH.findall(text_array[i]) if is_valid_tld(url)]
+        if (len(urls) > 0):
+            url_counts[i] = len(urls)
+            text = text_array[i]
+            for url in urls:
+                text = text.replace(url, "")
+            text_array[i] = text
+
+    counts = np.empty(len(text_array), dtype='int64')
+    for start in range(0, len(text_array), CHAR_COUNT_CHUNK_SIZE):
+        chunk: np.ndarray = text_array[start:(start + CHAR_COUNT_CHUNK_SIZE)]
+        counts[start:(start + len(chunk))] = _count_weighted_chars(chunk)
+
+    return pd.Series(counts + (url_counts * TWITTER_URL_SIZE), index=content.index)
+
+
+@instrumented('feature')
+def retweet_handle_column(texts) -> pd.Series:
+    """Column-level version of `retweet_handle`. Accepts a DataFrame (or its `content` column).
+        The 'RT ' prefix check and the handle extraction are both vectorized.
+        Returns a "string" Series of handles (without `@`), NA where a tweet is not a retweet."""
+    content: pd.Series = _get_text_series(texts)
+    is_rt: pd.Series = content.str.startswith("RT ", na=False)
 
-    return {
-            'subdomain': url_named_tuple.subdomain,
-            'domain': url_named_tuple.domain,
-            'tld': url_named_tuple.suffix,
-            'registered_domain': url_named_tuple.registered_domain
-        }
+    return content.where(is_rt).str.slice(start=3) \
+        .str.extract(VALID_REPLY_PATTERN_STR, flags=re.IGNORECASE, expand=False).astype("string")
+
+
+@instrumented('feature')
+def reply_handle_column(texts) -> pd.Series:
+    """Column-level version of `reply_handle`. Accepts a DataFrame (or its `content` column).
+        Returns a "string" Series of handles (without `@`), NA where a tweet is not a reply."""
+    content: pd.Series = _get_text_series(texts)
+
+    return content.str.extract(VALID_REPLY_PATTERN_STR, flags=re.IGNORECASE, expand=False).astype("string")
 
 
 ###########################
@@ -116,18 +191,64 @@ def explode_url(url_text: str) -> dict:
 ###########################
 
 def _extract_reply_screenname(tweet_text: str):
-    """Returns the handle, including `@`, occuring at start of a tweet (i.e. when a tweet is replying to another).
+    """Returns the handle, without `@`, occuring at start of a tweet (i.e. when a tweet is replying to another).
         Returns None if anything but a handle is at the very start of a tweet.
         Regex based on Twitter's `twittertext` code."""
-    return VALID_REPLY_PATTERN.match(tweet_text)    # seems to work, may consider "search" but "match" looks only at start of string
+    match = VALID_REPLY_PATTERN.match(tweet_text)    # seems to work, may consider "search" but "match" looks only at start of string
+
+    return match.group(1) if (match is not None) else None
 
 
 def _extract_first_handle_after_RT(tweet_text: str):
-    """Returns the handle, including `@`, occuring at start of a tweet but after chars 'RT ' (note the trailing space).
+    """Returns the handle, without `@`, occuring at start of a tweet but after chars 'RT ' (note the trailing space).
         Returns None if anything but 'RT ' followed by a handle is at the very start of a tweet.
         Note that check for 'RT ' is expected to be performed prior to calling this function.
         Regex based on Twitter's `twittertext` code."""
-    return VALID_REPLY_PATTERN.search(tweet_text[3:])   # seems to work
+    match = VALID_REPLY_PATTERN.search(tweet_text[3:])   # seems to work
+
+    return match.group(1) if (match is not None) else None
+
+
+def _get_text_series(texts) -> pd.Series:
+    """Returns the `content` column if `texts` is a DataFrame, otherwise `texts` as a "string" Series."""
+    if isinstance(texts, pd.DataFrame):
+        texts = texts['content']
+
+    return pd.Series(texts).astype("string")
+
+
+@functools.lru_cache(maxsize=65_536)
+def is_valid_tld(url: str) -> bool:
+    """Memoized version of the TLD check performed by `tweet_counter.find_urls`."""
+    return bool(get_tld(url, fix_protocol=True, fail_silently=True))
+
+
+@functools.lru_cache(maxsize=EXPLODE_URL_CACHE_SIZE)
+def _explode_url_cached(url_text: str) -> tuple:
+    """Parses a URL with the offline `TLD_EXTRACTOR`. Returns a tuple ordered as `EXPLODE_URL_FIELDS`."""
+    url_named_tuple: tldextract.tldextract.ExtractResult = TLD_EXTRACTOR(url_text)
+
+    # `registered_domain` was renamed in newer tldextract versions
+    if hasattr(url_named_tuple, 'top_domain_under_public_suffix'):
+        registered_domain: str = url_named_tuple.top_domain_under_public_suffix
+    else:
+        registered_domain = url_named_tuple.registered_domain
+
+    return (url_named_tuple.subdomain, url_named_tuple.domain, url_named_tuple.suffix, registered_domain)
+
+
+def _count_weighted_chars(text_array: np.ndarray) -> np.ndarray:
+    """Counts characters for an array of tweet texts (with URLs already removed), where characters
+        above `TWITTER_STANDARD_CHAR_LIMIT` count double, as in `tweet_counter.count_tweet`.
+        All texts are encoded into one UTF-32 buffer and counted with numpy, not one call per tweet."""
+    lengths = np.fromiter((len(t) for t in text_array), dtype='int64', count=len(text_array))
+    codepoints = np.frombuffer("".join(text_array).encode('utf-32-le', errors='surrogatepass'), dtype='<u4')
+
+    # per-tweet number of wide characters, via a cumulative sum over the whole buffer
+    wide_cumsum = np.concatenate(([0], np.cumsum(codepoints > TWITTER_STANDARD_CHAR_LIMIT)))
+    ends = np.cumsum(lengths)
+
+    return lengths + (wide_cumsum[ends] - wide_cumsum[ends - lengths])
 
 
 def _get_tweet_char_count(tweet_text: str) -> int: